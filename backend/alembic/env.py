@@ -26,6 +26,24 @@ config.set_main_option("sqlalchemy.url", DATABASE_URL)
 
 target_metadata = Base.metadata
 
+
+def _is_partition(name: str | None) -> bool:
+    return (name or "").startswith("strava_activities_p")
+
+
+def include_name(name, type_, parent_names):
+    """Ignore les partitions : seule la table partitionnée figure dans les modèles."""
+    if type_ == "table":
+        return not _is_partition(name)
+    return True
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Ignore les clés étrangères que PostgreSQL duplique vers chaque partition."""
+    if type_ == "foreign_key_constraint" and reflected:
+        return not _is_partition(object.referred_table.name)
+    return True
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -48,6 +66,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_name=include_name, include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -71,7 +90,7 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata, include_name=include_name, include_object=include_object
         )
 
         with context.begin_transaction():
@@ -0,0 +1,74 @@
+"""add plan templates
+
+Revision ID: 3b7d0e5c9f62
+Revises: 8f4c2b6e1d39
+Create Date: 2025-07-25 14:37:51.208419
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7d0e5c9f62'
+down_revision: Union[str, None] = '8f4c2b6e1d39'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('plan_templates',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('goal', sa.Text(), nullable=True),
+    sa.Column('public', sa.Boolean(), server_default='false', nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_plan_templates_id'), 'plan_templates', ['id'], unique=False)
+    op.create_index(op.f('ix_plan_templates_owner_id'), 'plan_templates', ['owner_id'], unique=False)
+    op.create_table('template_sessions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('day_offset', sa.Integer(), nullable=False),
+    sa.Column('type', postgresql.ENUM('cardio', 'running', 'other', 'repos', name='sessiontype', create_type=False), nullable=False),
+    sa.Column('exercise', sa.String(length=255), nullable=False),
+    sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed("to_tsvector('french', exercise)", persisted=True), nullable=True),
+    sa.Column('template_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['template_id'], ['plan_templates.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_template_sessions_id'), 'template_sessions', ['id'], unique=False)
+    op.create_index('ix_template_sessions_search_vector', 'template_sessions', ['search_vector'], unique=False, postgresql_using='gin')
+    op.create_index('ix_template_sessions_template_id_day_offset', 'template_sessions', ['template_id', 'day_offset'], unique=False)
+    op.add_column('sessions', sa.Column('template_session_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('sessions_template_session_id_fkey', 'sessions', 'template_sessions', ['template_session_id'], ['id'], ondelete='SET NULL')
+    op.add_column('training_plans', sa.Column('template_id', sa.Integer(), nullable=True))
+    op.add_column('training_plans', sa.Column('start_date', sa.Date(), nullable=True))
+    op.create_foreign_key('training_plans_template_id_fkey', 'training_plans', 'plan_templates', ['template_id'], ['id'])
+    # Index construits sans bloquer les écritures sur sessions et training_plans ;
+    # la contrainte d'unicité reprend ensuite l'index existant
+    with op.get_context().autocommit_block():
+        op.create_index('sessions_plan_id_template_session_id_key', 'sessions', ['plan_id', 'template_session_id'], unique=True, postgresql_concurrently=True)
+        op.create_index(op.f('ix_training_plans_template_id'), 'training_plans', ['template_id'], unique=False, postgresql_concurrently=True)
+    op.execute('ALTER TABLE sessions ADD CONSTRAINT sessions_plan_id_template_session_id_key UNIQUE USING INDEX sessions_plan_id_template_session_id_key')
+
+
+def downgrade() -> None:
+    op.drop_constraint('training_plans_template_id_fkey', 'training_plans', type_='foreignkey')
+    op.drop_index(op.f('ix_training_plans_template_id'), table_name='training_plans')
+    op.drop_column('training_plans', 'start_date')
+    op.drop_column('training_plans', 'template_id')
+    op.drop_constraint('sessions_template_session_id_fkey', 'sessions', type_='foreignkey')
+    op.drop_constraint('sessions_plan_id_template_session_id_key', 'sessions', type_='unique')
+    op.drop_column('sessions', 'template_session_id')
+    op.drop_index('ix_template_sessions_template_id_day_offset', table_name='template_sessions')
+    op.drop_index('ix_template_sessions_search_vector', table_name='template_sessions', postgresql_using='gin')
+    op.drop_index(op.f('ix_template_sessions_id'), table_name='template_sessions')
+    op.drop_table('template_sessions')
+    op.drop_index(op.f('ix_plan_templates_owner_id'), table_name='plan_templates')
+    op.drop_index(op.f('ix_plan_templates_id'), table_name='plan_templates')
+    op.drop_table('plan_templates')
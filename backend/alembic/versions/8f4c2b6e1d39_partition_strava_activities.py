@@ -0,0 +1,199 @@
+"""partition strava_activities by user_id
+
+Revision ID: 8f4c2b6e1d39
+Revises: 6e2b7c4d9a18
+Create Date: 2025-07-23 09:12:47.631058
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f4c2b6e1d39'
+down_revision: Union[str, None] = '6e2b7c4d9a18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Figés ici plutôt qu'importés des modèles : la migration ne doit pas changer après coup
+PARTITIONS = 16
+BATCH = 5000
+
+COLUMNS = (
+    'id', 'strava_id', 'user_id', 'name', 'type', 'start_date', 'distance', 'moving_time',
+    'elapsed_time', 'total_elevation_gain', 'elev_high', 'elev_low', 'average_speed', 'max_speed',
+    'average_heartrate', 'max_heartrate', 'calories', 'detail_fetched_at', 'summary_polyline',
+    'route_id', 'heatmap_version',
+)
+# Tables qui référencent une activité ; personal_records a déjà user_id
+CHILDREN = ('activity_laps', 'activity_splits', 'activity_best_efforts', 'activity_streams')
+REFERENCING = CHILDREN + ('personal_records',)
+
+
+def _columns(prefix: str = '') -> str:
+    return ', '.join(prefix + column for column in COLUMNS)
+
+
+def _batches(table: str):
+    """Bornes [début, fin[ couvrant les identifiants de *table* par lots de BATCH."""
+    low, high = op.get_bind().execute(sa.text(f'SELECT min(id), max(id) FROM {table}')).one()
+    if low is None:
+        return
+    for start in range(low, high + 1, BATCH):
+        yield start, start + BATCH
+
+
+def upgrade() -> None:
+    # 1. Table partitionnée vide, alimentée par trigger dès maintenant. Les noms
+    #    d'index provisoires évitent les collisions avec l'ancienne table.
+    op.create_table('strava_activities_part',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('strava_activities_id_seq')"), nullable=False),
+    sa.Column('strava_id', sa.BigInteger(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=True),
+    sa.Column('type', sa.String(length=50), nullable=True),
+    sa.Column('start_date', sa.String(length=50), nullable=True),
+    sa.Column('distance', sa.Float(), nullable=True),
+    sa.Column('moving_time', sa.Integer(), nullable=True),
+    sa.Column('elapsed_time', sa.Integer(), nullable=True),
+    sa.Column('total_elevation_gain', sa.Float(), nullable=True),
+    sa.Column('elev_high', sa.Float(), nullable=True),
+    sa.Column('elev_low', sa.Float(), nullable=True),
+    sa.Column('average_speed', sa.Float(), nullable=True),
+    sa.Column('max_speed', sa.Float(), nullable=True),
+    sa.Column('average_heartrate', sa.Float(), nullable=True),
+    sa.Column('max_heartrate', sa.Float(), nullable=True),
+    sa.Column('calories', sa.Float(), nullable=True),
+    sa.Column('detail_fetched_at', sa.DateTime(), nullable=True),
+    sa.Column('summary_polyline', sa.Text(), nullable=True),
+    sa.Column('route_id', sa.Integer(), nullable=True),
+    sa.Column('heatmap_version', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['route_id'], ['route_clusters.id'], name='strava_activities_route_id_fkey', ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], name='strava_activities_user_id_fkey', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id', 'user_id', name='strava_activities_part_pkey'),
+    sa.UniqueConstraint('user_id', 'strava_id', name='uq_strava_activities_user_id_strava_id'),
+    postgresql_partition_by='HASH (user_id)'
+    )
+    op.create_index('ix_strava_activities_part_route_id', 'strava_activities_part', ['route_id'], unique=False)
+    op.create_index('ix_strava_activities_part_user_id_start_date', 'strava_activities_part', ['user_id', 'start_date'], unique=False)
+    for remainder in range(PARTITIONS):
+        op.execute(
+            f'CREATE TABLE strava_activities_p{remainder:02d} PARTITION OF strava_activities_part '
+            f'FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})'
+        )
+
+    updates = ', '.join(f'{column} = EXCLUDED.{column}' for column in COLUMNS if column not in ('id', 'user_id'))
+    op.execute(f"""
+        CREATE FUNCTION strava_activities_mirror() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                DELETE FROM strava_activities_part WHERE id = OLD.id AND user_id = OLD.user_id;
+            ELSE
+                INSERT INTO strava_activities_part ({_columns()}) VALUES ({_columns('NEW.')})
+                ON CONFLICT (id, user_id) DO UPDATE SET {updates};
+            END IF;
+            RETURN NULL;
+        END $$
+    """)
+    op.execute("""
+        CREATE TRIGGER strava_activities_mirror AFTER INSERT OR UPDATE OR DELETE ON strava_activities
+        FOR EACH ROW EXECUTE FUNCTION strava_activities_mirror()
+    """)
+
+    # Les tables filles reçoivent user_id ; le trigger le renseigne pour le code
+    # encore déployé qui ne le fournit pas.
+    op.execute("""
+        CREATE FUNCTION activity_child_user_id() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF NEW.user_id IS NULL THEN
+                SELECT user_id INTO NEW.user_id FROM strava_activities WHERE id = NEW.activity_id;
+            END IF;
+            RETURN NEW;
+        END $$
+    """)
+    for table in CHILDREN:
+        op.add_column(table, sa.Column('user_id', sa.Integer(), nullable=True))
+        op.execute(
+            f'CREATE TRIGGER {table}_user_id BEFORE INSERT ON {table} '
+            'FOR EACH ROW EXECUTE FUNCTION activity_child_user_id()'
+        )
+
+    # 2. Recopie par lots, chacun dans sa propre transaction. FOR SHARE bloque la
+    #    suppression d'une ligne le temps de sa copie, sans quoi le trigger
+    #    pourrait passer avant elle et la ligne supprimée réapparaîtrait.
+    bind = op.get_bind()
+    with op.get_context().autocommit_block():
+        for start, end in _batches('strava_activities'):
+            bind.execute(sa.text(f"""
+                INSERT INTO strava_activities_part ({_columns()})
+                SELECT {_columns()} FROM strava_activities
+                WHERE id >= :start AND id < :end
+                FOR SHARE
+                ON CONFLICT (id, user_id) DO NOTHING
+            """), {'start': start, 'end': end})
+        for table in CHILDREN:
+            for start, end in _batches(table):
+                bind.execute(sa.text(f"""
+                    UPDATE {table} AS child SET user_id = activity.user_id
+                    FROM strava_activities AS activity
+                    WHERE activity.id = child.activity_id AND child.user_id IS NULL
+                    AND child.id >= :start AND child.id < :end
+                """), {'start': start, 'end': end})
+            # SET NOT NULL s'appuie sur la contrainte déjà validée au lieu de parcourir la table verrouillée
+            op.execute(f'ALTER TABLE {table} ADD CONSTRAINT {table}_user_id_not_null CHECK (user_id IS NOT NULL) NOT VALID')
+            op.execute(f'ALTER TABLE {table} VALIDATE CONSTRAINT {table}_user_id_not_null')
+            op.alter_column(table, 'user_id', existing_type=sa.Integer(), nullable=False)
+            op.drop_constraint(f'{table}_user_id_not_null', table, type_='check')
+        op.execute('ANALYZE strava_activities_part')
+
+    # 3. Bascule, sous verrou exclusif mais sans recopie. Les contraintes des
+    #    tables filles sont créées NOT VALID et validées ensuite hors verrou.
+    op.execute("SET LOCAL lock_timeout = '10s'")
+    op.execute('LOCK TABLE strava_activities IN ACCESS EXCLUSIVE MODE')
+    op.execute('ALTER SEQUENCE strava_activities_id_seq OWNED BY strava_activities_part.id')
+    for table in REFERENCING:
+        op.drop_constraint(f'{table}_activity_id_fkey', table, type_='foreignkey')
+    for table in CHILDREN:
+        op.execute(f'DROP TRIGGER {table}_user_id ON {table}')
+    op.drop_table('strava_activities')
+    op.execute('DROP FUNCTION strava_activities_mirror()')
+    op.execute('DROP FUNCTION activity_child_user_id()')
+    op.rename_table('strava_activities_part', 'strava_activities')
+    op.execute('ALTER INDEX strava_activities_part_pkey RENAME TO strava_activities_pkey')
+    op.execute('ALTER INDEX ix_strava_activities_part_route_id RENAME TO ix_strava_activities_route_id')
+    op.execute('ALTER INDEX ix_strava_activities_part_user_id_start_date RENAME TO ix_strava_activities_user_id_start_date')
+    for table in REFERENCING:
+        op.execute(
+            f'ALTER TABLE {table} ADD CONSTRAINT {table}_activity_id_user_id_fkey '
+            'FOREIGN KEY (activity_id, user_id) REFERENCES strava_activities (id, user_id) '
+            'ON DELETE CASCADE NOT VALID'
+        )
+
+    with op.get_context().autocommit_block():
+        for table in REFERENCING:
+            op.execute(f'ALTER TABLE {table} VALIDATE CONSTRAINT {table}_activity_id_user_id_fkey')
+
+
+def downgrade() -> None:
+    # Retour à une table unique, par recopie complète sous verrou
+    op.execute('LOCK TABLE strava_activities IN ACCESS EXCLUSIVE MODE')
+    op.execute('CREATE TABLE strava_activities_heap (LIKE strava_activities INCLUDING DEFAULTS)')
+    op.execute(f'INSERT INTO strava_activities_heap ({_columns()}) SELECT {_columns()} FROM strava_activities')
+    op.execute('ALTER SEQUENCE strava_activities_id_seq OWNED BY strava_activities_heap.id')
+    for table in REFERENCING:
+        op.drop_constraint(f'{table}_activity_id_user_id_fkey', table, type_='foreignkey')
+    op.drop_table('strava_activities')
+    op.rename_table('strava_activities_heap', 'strava_activities')
+    op.create_primary_key('strava_activities_pkey', 'strava_activities', ['id'])
+    op.create_index('ix_strava_activities_id', 'strava_activities', ['id'], unique=False)
+    op.create_index('ix_strava_activities_strava_id', 'strava_activities', ['strava_id'], unique=True)
+    op.create_index('ix_strava_activities_route_id', 'strava_activities', ['route_id'], unique=False)
+    op.create_index('ix_strava_activities_user_id_start_date', 'strava_activities', ['user_id', 'start_date'], unique=False)
+    op.create_foreign_key('strava_activities_route_id_fkey', 'strava_activities', 'route_clusters', ['route_id'], ['id'], ondelete='SET NULL')
+    op.create_foreign_key('strava_activities_user_id_fkey', 'strava_activities', 'users', ['user_id'], ['id'], ondelete='CASCADE')
+    for table in REFERENCING:
+        op.create_foreign_key(f'{table}_activity_id_fkey', table, 'strava_activities', ['activity_id'], ['id'], ondelete='CASCADE')
+    for table in CHILDREN:
+        op.drop_column(table, 'user_id')
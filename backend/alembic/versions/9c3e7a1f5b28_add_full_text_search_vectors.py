@@ -0,0 +1,36 @@
+"""add full-text search vectors
+
+Revision ID: 9c3e7a1f5b28
+Revises: 4d6b8e2f1a75
+Create Date: 2025-07-09 10:41:18.204553
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '9c3e7a1f5b28'
+down_revision: Union[str, None] = '4d6b8e2f1a75'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Colonnes générées STORED : l'ajout réécrit les tables une fois, puis la base
+    # tient les vecteurs à jour à chaque INSERT/UPDATE.
+    op.add_column('sessions', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed("to_tsvector('french', exercise)", persisted=True), nullable=True))
+    op.add_column('training_plans', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed("setweight(to_tsvector('french', coalesce(name, '')), 'A') || setweight(to_tsvector('french', coalesce(goal, '')), 'B')", persisted=True), nullable=True))
+    with op.get_context().autocommit_block():
+        op.create_index('ix_sessions_search_vector', 'sessions', ['search_vector'], unique=False, postgresql_using='gin', postgresql_concurrently=True)
+        op.create_index('ix_training_plans_search_vector', 'training_plans', ['search_vector'], unique=False, postgresql_using='gin', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_training_plans_search_vector', table_name='training_plans', postgresql_concurrently=True)
+        op.drop_index('ix_sessions_search_vector', table_name='sessions', postgresql_concurrently=True)
+    op.drop_column('training_plans', 'search_vector')
+    op.drop_column('sessions', 'search_vector')
@@ -0,0 +1,34 @@
+"""add calendar indexes
+
+Revision ID: e5a7c0b3d914
+Revises: c81d5f3a0b62
+Create Date: 2025-07-07 11:05:52.640917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a7c0b3d914'
+down_revision: Union[str, None] = 'c81d5f3a0b62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY : pas de verrou bloquant les écritures pendant la construction,
+    # ce qui impose de sortir de la transaction de la migration.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_sessions_plan_id_date', 'sessions', ['plan_id', 'date'], unique=False, postgresql_concurrently=True)
+        op.create_index(op.f('ix_training_plans_owner_id'), 'training_plans', ['owner_id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_strava_activities_user_id_start_date', 'strava_activities', ['user_id', 'start_date'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_strava_activities_user_id_start_date', table_name='strava_activities', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_training_plans_owner_id'), table_name='training_plans', postgresql_concurrently=True)
+        op.drop_index('ix_sessions_plan_id_date', table_name='sessions', postgresql_concurrently=True)
@@ -0,0 +1,61 @@
+"""recompute personal records on delete
+
+Revision ID: f5b19d7e3c62
+Revises: e7a3c95d2f14
+Create Date: 2025-07-31 09:18:52.660471
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f5b19d7e3c62'
+down_revision: Union[str, None] = 'e7a3c95d2f14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_activity_best_efforts_user_id_distance_name_elapsed_time',
+            'activity_best_efforts',
+            ['user_id', 'distance_name', 'elapsed_time'],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+    # Copie figée de models.PERSONAL_RECORD_TRIGGER_DDL
+    op.execute("""
+        CREATE FUNCTION personal_records_recompute() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM users WHERE id = OLD.user_id) THEN
+                INSERT INTO personal_records
+                    (user_id, distance_name, distance, elapsed_time, activity_id, strava_id, achieved_at)
+                SELECT effort.user_id, effort.distance_name, effort.distance, effort.elapsed_time,
+                       effort.activity_id, activity.strava_id, activity.start_date
+                FROM activity_best_efforts AS effort
+                JOIN strava_activities AS activity
+                    ON activity.id = effort.activity_id AND activity.user_id = effort.user_id
+                WHERE effort.user_id = OLD.user_id
+                    AND effort.distance_name = OLD.distance_name
+                    AND effort.activity_id <> OLD.activity_id
+                ORDER BY effort.elapsed_time, effort.activity_id
+                LIMIT 1
+                ON CONFLICT (user_id, distance_name) DO NOTHING;
+            END IF;
+            RETURN NULL;
+        END $$
+    """)
+    op.execute("""
+        CREATE TRIGGER personal_records_recompute AFTER DELETE ON personal_records
+        FOR EACH ROW EXECUTE FUNCTION personal_records_recompute()
+    """)
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER personal_records_recompute ON personal_records')
+    op.execute('DROP FUNCTION personal_records_recompute()')
+    op.drop_index('ix_activity_best_efforts_user_id_distance_name_elapsed_time', table_name='activity_best_efforts')
@@ -0,0 +1,102 @@
+"""Détail des activités Strava : récupération unique, normalisation et préchargement.
+
+L'API ne renvoie lors de la synchronisation que le résumé des activités. Le
+détail (tours, découpage kilométrique, dénivelé, cardio) est récupéré une seule
+fois par activité puis servi depuis la base ; le worker de synchronisation le
+précharge pour les activités récentes.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy.orm import Session
+
+from . import crud, models, strava_tokens, strava_utils
+
+logger = logging.getLogger(__name__)
+
+# Fenêtre et volume du préchargement, par utilisateur et par synchronisation
+PREFETCH_DAYS = int(os.getenv("STRAVA_DETAIL_PREFETCH_DAYS", "14"))
+PREFETCH_LIMIT = int(os.getenv("STRAVA_DETAIL_PREFETCH_LIMIT", "10"))
+
+_ACTIVITY_FIELDS = (
+    "elapsed_time",
+    "total_elevation_gain",
+    "elev_high",
+    "elev_low",
+    "average_speed",
+    "max_speed",
+    "average_heartrate",
+    "max_heartrate",
+    "calories",
+)
+_LAP_FIELDS = (
+    "name",
+    "elapsed_time",
+    "moving_time",
+    "distance",
+    "total_elevation_gain",
+    "average_speed",
+    "max_speed",
+    "average_heartrate",
+    "max_heartrate",
+)
+_SPLIT_FIELDS = (
+    "distance",
+    "elapsed_time",
+    "moving_time",
+    "elevation_difference",
+    "average_speed",
+    "average_heartrate",
+    "pace_zone",
+)
+
+
+def normalize(payload: dict[str, Any]) -> tuple[dict[str, Any], list[dict], list[dict]]:
+    """Convertit la réponse de ``GET /activities/{id}`` en colonnes, tours et splits."""
+    columns = {key: payload.get(key) for key in _ACTIVITY_FIELDS}
+    laps = [
+        {
+            **{key: lap.get(key) for key in _LAP_FIELDS},
+            "lap_index": lap.get("lap_index", index + 1),
+            "start_date": lap.get("start_date_local"),
+        }
+        for index, lap in enumerate(payload.get("laps") or [])
+    ]
+    splits = [
+        {**{key: split.get(key) for key in _SPLIT_FIELDS}, "split": split.get("split", index + 1)}
+        for index, split in enumerate(payload.get("splits_metric") or [])
+    ]
+    return columns, laps, splits
+
+
+def fetch_detail(db: Session, activity: models.StravaActivity, access_token: str) -> models.StravaActivity:
+    """Récupère et enregistre le détail de *activity*. Lève ``httpx.HTTPStatusError``."""
+    payload = strava_utils.fetch_activity(access_token, activity.strava_id, subject=activity.user_id)
+    columns, laps, splits = normalize(payload)
+    return crud.save_activity_detail(db, activity, columns, laps, splits)
+
+
+def prefetch_recent(db: Session, token: models.StravaToken) -> int:
+    """Récupère le détail des activités récentes de ``token.user_id`` qui ne l'ont pas encore.
+
+    Retourne le nombre d'activités enrichies ; s'arrête à la première erreur
+    Strava (quota atteint, token révoqué…), le reste attendra le passage suivant.
+    """
+    since = (datetime.utcnow() - timedelta(days=PREFETCH_DAYS)).strftime("%Y-%m-%d")
+    activities = crud.list_activities_missing_detail(db, token.user_id, since, PREFETCH_LIMIT)
+    if not activities:
+        return 0
+    fetched = 0
+    try:
+        access_token = strava_tokens.get_access_token(db, token)
+        for activity in activities:
+            fetch_detail(db, activity, access_token)
+            fetched += 1
+    except Exception:  # noqa: BLE001 - le préchargement est opportuniste
+        db.rollback()
+        logger.exception("Échec du préchargement du détail des activités (user %s)", token.user_id)
+    return fetched
@@ -0,0 +1,77 @@
+"""Calcul de l'assiduité hebdomadaire d'un plan.
+
+Ces fonctions ne touchent pas à la base : ``crud.refresh_adherence`` résume
+une semaine avec :func:`summarize_week`, et l'endpoint d'assiduité combine les
+résumés hebdomadaires avec :func:`combine_streaks`.
+"""
+from __future__ import annotations
+
+import re
+from datetime import date, timedelta
+from typing import Iterable
+
+from .schemas import SessionType
+
+RUN_TYPES = ("Run", "TrailRun", "VirtualRun")
+
+_KM_PATTERN = re.compile(r"(\d+(?:[.,]\d+)?)\s?km\b", re.IGNORECASE)
+
+
+def week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def parse_km(exercise: str) -> float:
+    """Volume prévu d'une séance, lu dans son libellé (« Sortie longue 12 km »)."""
+    return sum(float(value.replace(",", ".")) for value in _KM_PATTERN.findall(exercise or ""))
+
+
+def summarize_week(sessions: Iterable, distances: dict[str, float]) -> dict:
+    """Résumé d'une semaine de séances triées par date.
+
+    *distances* associe l'identifiant Strava d'une activité rattachée à sa
+    distance en mètres.
+    """
+    planned = completed = 0
+    planned_km = actual_km = 0.0
+    leading = run = longest = 0
+    leading_done = False
+    for session in sessions:
+        if session.type == SessionType.repos:
+            continue
+        planned += 1
+        planned_km += parse_km(session.exercise)
+        if session.strava_activity_id in distances:
+            actual_km += distances[session.strava_activity_id] / 1000
+        if session.completed:
+            completed += 1
+            leading_done = True
+            run = 0
+        else:
+            run += 1
+            longest = max(longest, run)
+            if not leading_done:
+                leading += 1
+    return {
+        "planned_sessions": planned,
+        "completed_sessions": completed,
+        "planned_km": round(planned_km, 1),
+        "actual_km": round(actual_km, 2),
+        "leading_missed": leading,
+        "trailing_missed": run,
+        "longest_missed": longest,
+    }
+
+
+def combine_streaks(weeks: Iterable) -> tuple[int, int]:
+    """Plus longue série de séances manquées et série en cours, sur des semaines consécutives."""
+    longest = run = 0
+    for week in weeks:
+        if week.planned_sessions == 0:
+            continue
+        if week.leading_missed == week.planned_sessions:
+            run += week.planned_sessions
+        else:
+            longest = max(longest, run + week.leading_missed, week.longest_missed)
+            run = week.trailing_missed
+    return max(longest, run), run
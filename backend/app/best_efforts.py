@@ -0,0 +1,117 @@
+"""Meilleurs efforts par distance et records personnels, calculés sur les séries d'activité.
+
+Pour chaque point de départ ``i``, le segment le plus court couvrant la
+distance cible se termine au premier point ``j`` tel que
+``distance[j] >= distance[i] + cible`` : la distance cumulée étant croissante,
+``j`` ne recule jamais quand ``i`` avance (deux pointeurs). ``np.searchsorted``
+calcule tous ces ``j`` en une passe vectorisée, soit O(n log n) par distance
+au lieu de O(n²) pour un balayage naïf de tous les segments.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from . import crud, models, streams, strava_tokens, strava_utils
+
+logger = logging.getLogger(__name__)
+
+TARGET_DISTANCES: dict[str, float] = {
+    "1k": 1000.0,
+    "5k": 5000.0,
+    "10k": 10000.0,
+    "semi": 21097.5,
+    "marathon": 42195.0,
+}
+RUN_TYPES = ("Run", "TrailRun", "VirtualRun")
+
+# Préchargement des séries des courses récentes par le worker de synchronisation
+PREFETCH_DAYS = int(os.getenv("STRAVA_STREAM_PREFETCH_DAYS", "14"))
+PREFETCH_LIMIT = int(os.getenv("STRAVA_STREAM_PREFETCH_LIMIT", "10"))
+
+
+@dataclass
+class BestEffort:
+    distance_name: str
+    distance: float
+    elapsed_time: float
+    start_offset: int
+
+
+def compute(time: np.ndarray, distance: np.ndarray) -> list[BestEffort]:
+    """Segment le plus rapide de chaque distance de ``TARGET_DISTANCES`` couverte par l'activité.
+
+    L'instant où la distance cible est atteinte est interpolé entre les deux
+    points qui l'encadrent.
+    """
+    n = min(len(time), len(distance))
+    if n < 2:
+        return []
+    t = time[:n].astype(np.float64)
+    # Le cumul GPS peut reculer de quelques centimètres : on le force croissant
+    d = np.maximum.accumulate(distance[:n].astype(np.float64))
+
+    efforts = []
+    for name, target in TARGET_DISTANCES.items():
+        if d[-1] - d[0] < target:
+            continue
+        ends = np.searchsorted(d, d + target, side="left")
+        starts = np.nonzero(ends < n)[0]
+        ends = ends[starts]
+        previous = ends - 1
+        span = d[ends] - d[previous]
+        fraction = np.divide(
+            d[starts] + target - d[previous], span, out=np.ones_like(span), where=span > 0
+        )
+        elapsed = t[previous] + fraction * (t[ends] - t[previous]) - t[starts]
+        best = int(elapsed.argmin())
+        efforts.append(
+            BestEffort(
+                distance_name=name,
+                distance=target,
+                elapsed_time=round(float(elapsed[best]), 1),
+                start_offset=int(t[starts[best]] - t[0]),
+            )
+        )
+    return efforts
+
+
+def record_activity(db: Session, activity: models.StravaActivity, stream: models.ActivityStream) -> list[BestEffort]:
+    """Calcule et enregistre les meilleurs efforts d'une course, puis met à jour les records."""
+    if activity.type not in RUN_TYPES or stream.time is None or stream.distance is None:
+        return []
+    efforts = compute(streams.decode("time", stream.time), streams.decode("distance", stream.distance))
+    crud.save_best_efforts(db, activity, efforts)
+    return efforts
+
+
+def prefetch_recent(db: Session, token: models.StravaToken) -> int:
+    """Récupère les séries des courses récentes de ``token.user_id`` et en calcule les efforts.
+
+    Retourne le nombre d'activités traitées ; s'arrête à la première erreur
+    Strava, le reste attendra le passage suivant.
+    """
+    since = (datetime.utcnow() - timedelta(days=PREFETCH_DAYS)).strftime("%Y-%m-%d")
+    activities = crud.list_runs_missing_stream(db, token.user_id, RUN_TYPES, since, PREFETCH_LIMIT)
+    if not activities:
+        return 0
+    processed = 0
+    try:
+        access_token = strava_tokens.get_access_token(db, token)
+        for activity in activities:
+            payload = strava_utils.fetch_activity_streams(
+                access_token, activity.strava_id, streams.STREAM_KEYS, subject=token.user_id
+            )
+            stream = crud.save_activity_stream(db, activity, streams.encode_strava_streams(payload))
+            if stream is not None:
+                record_activity(db, activity, stream)
+            processed += 1
+    except Exception:  # noqa: BLE001 - le préchargement est opportuniste
+        db.rollback()
+        logger.exception("Échec du préchargement des séries (user %s)", token.user_id)
+    return processed
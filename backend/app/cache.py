@@ -0,0 +1,74 @@
+"""Cache LRU en mémoire des réponses sérialisées des plans et de leurs séances.
+
+Les entrées sont indexées par (plan, version, type de réponse), où la version
+est la colonne ``training_plans.cache_version`` : chaque écriture sur un plan
+l'incrémente dans la même transaction. Avant de servir une entrée, on relit
+cette version par clé primaire ; une écriture faite par n'importe quel worker
+rend donc immédiatement obsolètes les entrées de tous les autres.
+:meth:`PlanCache.invalidate` ne fait que libérer la mémoire localement.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from . import metrics
+
+metrics.describe("plan_cache_requests_total", "Lectures du cache des plans, par résultat (hit/miss).")
+
+
+class CachedPayload(NamedTuple):
+    body: bytes
+    expires_at: float
+
+
+class PlanCache:
+    def __init__(self, max_bytes: int, ttl: float) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple[int, int, str], CachedPayload] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, plan_id: int, version: int, kind: str) -> CachedPayload | None:
+        with self._lock:
+            key = (plan_id, version, kind)
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        metrics.inc("plan_cache_requests_total", result="hit" if entry else "miss")
+        return entry
+
+    def set(self, plan_id: int, version: int, kind: str, body: bytes) -> None:
+        """Mémorise *body*, lu après la version *version* du plan."""
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            key = (plan_id, version, kind)
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = CachedPayload(body, time.monotonic() + self.ttl)
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, plan_id: int) -> None:
+        """Libère les entrées locales du plan (la version en base suffit à les rendre obsolètes)."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == plan_id]:
+                self._remove(key)
+
+    def _remove(self, key: tuple[int, int, str]) -> None:
+        self._size -= len(self._entries.pop(key).body)
+
+
+plan_cache = PlanCache(
+    max_bytes=int(os.getenv("PLAN_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    ttl=float(os.getenv("PLAN_CACHE_TTL", "60")),
+)
@@ -1,24 +1,50 @@
 """Fonctions CRUD pour les plans d'entraînement et les séances."""
 from __future__ import annotations
 
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from . import adherence, models, schemas
+from .cache import plan_cache
 
-from . import models, schemas
+# Les écritures utilisent INSERT/UPDATE ... RETURNING : les colonnes générées par
+# la base (id, valeurs par défaut) reviennent avec l'instruction elle-même, sans
+# SELECT de rafraîchissement après le commit (cf. expire_on_commit=False).
 
 # ---------- Users ----------
 
 from .security import hash_password, verify_password
 
+UNIQUE_VIOLATION = "23505"
+
+
+class EmailAlreadyRegistered(Exception):
+    """Levée quand l'insertion d'un utilisateur viole l'unicité de l'email."""
+
 
 def create_user(db: Session, user_in: schemas.UserCreate) -> models.User:
-    user = models.User(
-        email=user_in.email,
-        name=user_in.name,
-        password_hash=hash_password(user_in.password),
+    stmt = (
+        insert(models.User)
+        .values(
+            email=user_in.email,
+            name=user_in.name,
+            password_hash=hash_password(user_in.password),
+        )
+        .returning(models.User)
     )
-    db.add(user)
-    db.commit()
-    db.refresh(user)
+    try:
+        user = db.scalars(stmt).one()
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if getattr(e.orig, "pgcode", None) == UNIQUE_VIOLATION:
+            raise EmailAlreadyRegistered(user_in.email) from e
+        raise
     return user
 
 def get_user(db: Session, user_id: int) -> models.User | None:
@@ -36,15 +62,41 @@ def list_users(db: Session, skip: int = 0, limit: int = 100):
 # ---------- Plans ----------
 
 def create_plan(db: Session, owner_id: int, plan_in: schemas.TrainingPlanCreate) -> models.TrainingPlan:
-    plan = models.TrainingPlan(**plan_in.dict(), owner_id=owner_id)
-    db.add(plan)
+    stmt = insert(models.TrainingPlan).values(**plan_in.dict(), owner_id=owner_id).returning(models.TrainingPlan)
+    plan = db.scalars(stmt).one()
+    # Un nouveau plan n'a pas de séance : évite le chargement paresseux à la sérialisation
+    set_committed_value(plan, "sessions", [])
     db.commit()
-    db.refresh(plan)
     return plan
 
 
 def get_plan(db: Session, plan_id: int) -> models.TrainingPlan | None:
-    return db.query(models.TrainingPlan).filter(models.TrainingPlan.id == plan_id).first()
+    """Retourne le plan *plan_id*, sauf s'il est archivé."""
+    return (
+        db.query(models.TrainingPlan)
+        .filter(models.TrainingPlan.id == plan_id, models.TrainingPlan.archived_at.is_(None))
+        .first()
+    )
+
+
+def get_plan_cache_version(db: Session, plan_id: int) -> tuple[int, int] | None:
+    """(propriétaire, version de cache) du plan non archivé, lus sans charger le plan."""
+    row = db.execute(
+        select(models.TrainingPlan.owner_id, models.TrainingPlan.cache_version).where(
+            models.TrainingPlan.id == plan_id, models.TrainingPlan.archived_at.is_(None)
+        )
+    ).first()
+    return tuple(row) if row else None
+
+
+def bump_plan_cache_version(db: Session, plan_id: int) -> None:
+    """Rend obsolètes les réponses en cache du plan dans tous les workers, au commit de la transaction."""
+    db.execute(
+        update(models.TrainingPlan)
+        .where(models.TrainingPlan.id == plan_id)
+        .values(cache_version=models.TrainingPlan.cache_version + 1)
+        .execution_options(synchronize_session=False)
+    )
 
 
 def list_plans(db: Session, owner_id: int | None = None, skip: int = 0, limit: int = 100):
@@ -52,39 +104,199 @@ def list_plans(db: Session, owner_id: int | None = None, skip: int = 0, limit: i
     - Si *owner_id* est fourni, ne retourne que les plans appartenant à cet utilisateur.
     - Sinon, retourne l'ensemble des plans (usage admin).
     """
-    query = db.query(models.TrainingPlan)
+    query = db.query(models.TrainingPlan).filter(models.TrainingPlan.archived_at.is_(None))
     if owner_id is not None:
         query = query.filter(models.TrainingPlan.owner_id == owner_id)
     return query.offset(skip).limit(limit).all()
 
 
-def delete_plan(db: Session, plan: models.TrainingPlan) -> None:
-    db.delete(plan)
+def delete_plan(db: Session, plan_id: int, owner_id: int) -> bool:
+    """Supprime définitivement un plan. Retourne ``False`` s'il n'existe pas pour *owner_id*.
+
+    Un seul DELETE : les séances sont supprimées par le ``ON DELETE CASCADE`` de
+    la base, sans être chargées en mémoire.
+    """
+    result = db.execute(
+        delete(models.TrainingPlan).where(
+            models.TrainingPlan.id == plan_id, models.TrainingPlan.owner_id == owner_id
+        )
+    )
     db.commit()
+    plan_cache.invalidate(plan_id)
+    return result.rowcount > 0
+
+
+def archive_plan(db: Session, plan_id: int, owner_id: int) -> bool:
+    """Archive un plan (suppression logique) ; il sera purgé plus tard par ``purge_archived_plans``."""
+    result = db.execute(
+        update(models.TrainingPlan)
+        .where(
+            models.TrainingPlan.id == plan_id,
+            models.TrainingPlan.owner_id == owner_id,
+            models.TrainingPlan.archived_at.is_(None),
+        )
+        .values(archived_at=datetime.utcnow(), cache_version=models.TrainingPlan.cache_version + 1)
+    )
+    db.commit()
+    plan_cache.invalidate(plan_id)
+    return result.rowcount > 0
+
+
+def restore_plan(db: Session, plan_id: int, owner_id: int) -> bool:
+    result = db.execute(
+        update(models.TrainingPlan)
+        .where(
+            models.TrainingPlan.id == plan_id,
+            models.TrainingPlan.owner_id == owner_id,
+            models.TrainingPlan.archived_at.is_not(None),
+        )
+        .values(archived_at=None, cache_version=models.TrainingPlan.cache_version + 1)
+    )
+    db.commit()
+    plan_cache.invalidate(plan_id)
+    return result.rowcount > 0
+
+
+def purge_archived_plans(db: Session, archived_before: datetime, batch_size: int) -> int:
+    """Supprime au plus *batch_size* plans archivés avant *archived_before*.
+
+    ``SKIP LOCKED`` permet à plusieurs workers de purger en parallèle sans se bloquer.
+    """
+    batch = (
+        select(models.TrainingPlan.id)
+        .where(models.TrainingPlan.archived_at < archived_before)
+        .order_by(models.TrainingPlan.archived_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    result = db.execute(delete(models.TrainingPlan).where(models.TrainingPlan.id.in_(batch)))
+    db.commit()
+    return result.rowcount
 
 
 def create_plan_from_gemini(db: Session, owner_id: int, plan_data: schemas.GeminiPlan) -> models.TrainingPlan:
     """
     Crée un plan d'entraînement complet et ses séances à partir d'une structure générée par Gemini.
+
+    Ne valide pas la transaction : la réponse idempotente de la requête est
+    enregistrée avec le plan (cf. :func:`complete_idempotency_key`).
     """
-    db_plan = models.TrainingPlan(
-        name=plan_data.name,
-        goal=plan_data.goal,
-        owner_id=owner_id
+    db_plan = db.scalars(
+        insert(models.TrainingPlan)
+        .values(name=plan_data.name, goal=plan_data.goal, owner_id=owner_id)
+        .returning(models.TrainingPlan)
+    ).one()
+
+    sessions: list[models.Session] = []
+    if plan_data.sessions:
+        # INSERT multi-lignes avec RETURNING (regroupé par lots par SQLAlchemy)
+        sessions = list(
+            db.scalars(
+                insert(models.Session).returning(models.Session, sort_by_parameter_order=True),
+                [
+                    {
+                        "plan_id": db_plan.id,
+                        "date": session_data.date,
+                        "type": session_data.type,
+                        "exercise": session_data.exercise,
+                    }
+                    for session_data in plan_data.sessions
+                ],
+            )
+        )
+    set_committed_value(db_plan, "sessions", sorted(sessions, key=lambda session: session.date))
+    refresh_adherence(db, db_plan, {session.date for session in sessions})
+    return db_plan
+
+
+# ---------- Templates ----------
+
+def create_template(db: Session, owner_id: int, template_in: schemas.PlanTemplateCreate) -> models.PlanTemplate:
+    template = db.scalars(
+        insert(models.PlanTemplate)
+        .values(name=template_in.name, goal=template_in.goal, public=template_in.public, owner_id=owner_id)
+        .returning(models.PlanTemplate)
+    ).one()
+    sessions: list[models.TemplateSession] = []
+    if template_in.sessions:
+        sessions = list(
+            db.scalars(
+                insert(models.TemplateSession).returning(models.TemplateSession, sort_by_parameter_order=True),
+                [{**session.dict(), "template_id": template.id} for session in template_in.sessions],
+            )
+        )
+    set_committed_value(template, "sessions", sorted(sessions, key=lambda session: session.day_offset))
+    db.commit()
+    return template
+
+
+def create_template_from_plan(
+    db: Session, plan: models.TrainingPlan, public: bool
+) -> models.PlanTemplate | None:
+    """Modèle reprenant les séances de *plan*, décalées depuis le lundi de sa première semaine.
+
+    Retourne ``None`` si le plan n'a aucune séance.
+    """
+    sessions = list_sessions(db, plan.id)
+    if not sessions:
+        return None
+    start = adherence.week_start(min(session.date for session in sessions))
+    template_in = schemas.PlanTemplateCreate(
+        name=plan.name,
+        goal=plan.goal,
+        public=public,
+        sessions=[
+            schemas.TemplateSessionCreate(
+                day_offset=(session.date - start).days, type=session.type, exercise=session.exercise
+            )
+            for session in sessions
+        ],
     )
+    return create_template(db, plan.owner_id, template_in)
 
-    for session_data in plan_data.sessions:
-        db_session = models.Session(
-            date=session_data.date,
-            type=session_data.type,
-            exercise=session_data.exercise,
+
+def get_template(db: Session, template_id: int, user_id: int) -> models.PlanTemplate | None:
+    """Retourne le modèle s'il est public ou appartient à *user_id*."""
+    return (
+        db.query(models.PlanTemplate)
+        .filter(
+            models.PlanTemplate.id == template_id,
+            (models.PlanTemplate.owner_id == user_id) | models.PlanTemplate.public.is_(True),
         )
-        db_plan.sessions.append(db_session)
+        .first()
+    )
 
-    db.add(db_plan)
+
+def list_templates(db: Session, user_id: int) -> list[models.PlanTemplate]:
+    return (
+        db.query(models.PlanTemplate)
+        .filter((models.PlanTemplate.owner_id == user_id) | models.PlanTemplate.public.is_(True))
+        .order_by(models.PlanTemplate.id)
+        .all()
+    )
+
+
+def create_plan_from_template(
+    db: Session, owner_id: int, template: models.PlanTemplate, start_date: date, name: str | None = None
+) -> models.TrainingPlan:
+    """Plan référençant *template* à partir de *start_date*, sans copier ses séances."""
+    plan = db.scalars(
+        insert(models.TrainingPlan)
+        .values(
+            name=name or template.name,
+            goal=template.goal,
+            owner_id=owner_id,
+            template_id=template.id,
+            start_date=start_date,
+        )
+        .returning(models.TrainingPlan)
+    ).one()
+    set_committed_value(plan, "sessions", [])
+    refresh_adherence(
+        db, plan, {start_date + timedelta(days=session.day_offset) for session in template.sessions}
+    )
     db.commit()
-    db.refresh(db_plan)
-    return db_plan
+    return plan
 
 
 # ---------- Strava ----------
@@ -96,50 +308,155 @@ def upsert_strava_token(
     refresh_token: str,
     expires_at: int,
 ):
-    token = db.query(models.StravaToken).filter(models.StravaToken.user_id == user_id).first()
-    if token:
-        token.access_token = access_token
-        token.refresh_token = refresh_token
-        token.expires_at = expires_at
-    else:
-        token = models.StravaToken(
-            user_id=user_id,
-            access_token=access_token,
-            refresh_token=refresh_token,
-            expires_at=expires_at,
-        )
-        db.add(token)
+    values = {"access_token": access_token, "refresh_token": refresh_token, "expires_at": expires_at}
+    stmt = (
+        pg_insert(models.StravaToken)
+        .values(user_id=user_id, **values)
+        .on_conflict_do_update(index_elements=[models.StravaToken.user_id], set_=values)
+        .returning(models.StravaToken)
+        .execution_options(populate_existing=True)
+    )
+    token = db.scalars(stmt).one()
     db.commit()
-    db.refresh(token)
     return token
 
 
+def _existing_strava_ids(db: Session, user_id: int, strava_ids: list[int]) -> set[int]:
+    return set(
+        db.scalars(
+            select(models.StravaActivity.strava_id).where(
+                models.StravaActivity.user_id == user_id,
+                models.StravaActivity.strava_id.in_(strava_ids),
+            )
+        )
+    )
+
+
 def upsert_strava_activity(db: Session, user_id: int, activity_data: schemas.StravaActivityCreate) -> tuple[models.StravaActivity, bool]:
     """
     Crée ou met à jour une activité Strava dans la base de données.
     Retourne l'objet de l'activité et un booléen `created`.
     """
-    existing_activity = (
+    values = activity_data.dict()
+    # RETURNING xmax n'est pas disponible sur une table partitionnée : l'existence
+    # est vérifiée juste avant, par la même clé que l'upsert
+    created = not _existing_strava_ids(db, user_id, [activity_data.strava_id])
+    stmt = (
+        pg_insert(models.StravaActivity)
+        .values(**values, user_id=user_id)
+        .on_conflict_do_update(
+            index_elements=[models.StravaActivity.user_id, models.StravaActivity.strava_id],
+            set_={key: value for key, value in values.items() if key != "strava_id"},
+        )
+        .returning(models.StravaActivity)
+        .execution_options(populate_existing=True)
+    )
+    activity = db.scalars(stmt).one()
+    db.commit()
+    return activity, created
+
+
+def upsert_strava_activities(
+    db: Session, user_id: int, activities: list[schemas.StravaActivityCreate]
+) -> tuple[int, int]:
+    """Variante par lot de :func:`upsert_strava_activity`, en une seule écriture.
+
+    Ne valide pas la transaction : l'appelant commite avec son propre état
+    (point de reprise de la synchronisation). Retourne ``(créées, mises à jour)``.
+    """
+    if not activities:
+        return 0, 0
+    values = [activity.dict() for activity in activities]
+    strava_ids = {row["strava_id"] for row in values}
+    existing = _existing_strava_ids(db, user_id, list(strava_ids))
+    stmt = pg_insert(models.StravaActivity).values([{**row, "user_id": user_id} for row in values])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.StravaActivity.user_id, models.StravaActivity.strava_id],
+        set_={key: stmt.excluded[key] for key in values[0] if key != "strava_id"},
+    )
+    db.execute(stmt)
+    return len(strava_ids) - len(existing), len(existing)
+
+
+def get_strava_activity(db: Session, user_id: int, strava_id: int) -> models.StravaActivity | None:
+    return (
         db.query(models.StravaActivity)
-        .filter(models.StravaActivity.strava_id == activity_data.strava_id)
+        .filter(
+            models.StravaActivity.strava_id == strava_id,
+            models.StravaActivity.user_id == user_id,
+        )
         .first()
     )
 
-    if existing_activity:
-        # Update
-        update_data = activity_data.dict(exclude_unset=True)
-        for key, value in update_data.items():
-            setattr(existing_activity, key, value)
-        db.commit()
-        db.refresh(existing_activity)
-        return existing_activity, False  # False for 'created'
-    else:
-        # Create
-        new_activity = models.StravaActivity(**activity_data.dict(), user_id=user_id)
-        db.add(new_activity)
-        db.commit()
-        db.refresh(new_activity)
-        return new_activity, True  # True for 'created'
+
+def save_activity_detail(
+    db: Session,
+    activity: models.StravaActivity,
+    columns: dict,
+    laps: list[dict],
+    splits: list[dict],
+) -> models.StravaActivity:
+    """Enregistre le détail d'une activité, ses tours et son découpage kilométrique.
+
+    La ligne de l'activité est verrouillée : si un autre processus a enregistré
+    le détail entre-temps, on conserve le sien.
+    """
+    locked = (
+        db.query(models.StravaActivity)
+        .filter(models.StravaActivity.id == activity.id, models.StravaActivity.user_id == activity.user_id)
+        .with_for_update()
+        .populate_existing()
+        .one()
+    )
+    if locked.detail_fetched_at is None:
+        for key, value in columns.items():
+            setattr(locked, key, value)
+        locked.detail_fetched_at = datetime.utcnow()
+        if laps:
+            db.execute(
+                insert(models.ActivityLap),
+                [{**lap, "activity_id": locked.id, "user_id": locked.user_id} for lap in laps],
+            )
+        if splits:
+            db.execute(
+                insert(models.ActivitySplit),
+                [{**split, "activity_id": locked.id, "user_id": locked.user_id} for split in splits],
+            )
+    db.commit()
+    return locked
+
+
+def list_activities_missing_detail(db: Session, user_id: int, since: str, limit: int) -> list[models.StravaActivity]:
+    """Activités récentes (``start_date >= since``) dont le détail n'a pas encore été récupéré."""
+    return (
+        db.query(models.StravaActivity)
+        .filter(
+            models.StravaActivity.user_id == user_id,
+            models.StravaActivity.detail_fetched_at.is_(None),
+            models.StravaActivity.start_date >= since,
+        )
+        .order_by(models.StravaActivity.start_date.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def save_activity_stream(
+    db: Session, activity: models.StravaActivity, columns: dict
+) -> models.ActivityStream | None:
+    """Enregistre les séries encodées d'une activité.
+
+    Si un autre processus les a enregistrées entre-temps, on conserve les
+    siennes et la fonction retourne ``None``.
+    """
+    stream = db.scalars(
+        pg_insert(models.ActivityStream)
+        .values(activity_id=activity.id, user_id=activity.user_id, **columns)
+        .on_conflict_do_nothing(index_elements=[models.ActivityStream.activity_id])
+        .returning(models.ActivityStream)
+    ).one_or_none()
+    db.commit()
+    return stream
 
 
 # ---------- Sessions ----------
@@ -149,12 +466,794 @@ def add_session(
     plan: models.TrainingPlan,
     session_in: schemas.SessionCreate,
 ) -> models.Session:
-    session = models.Session(**session_in.dict(), plan_id=plan.id)
-    db.add(session)
+    stmt = insert(models.Session).values(**session_in.dict(), plan_id=plan.id).returning(models.Session)
+    session = db.scalars(stmt).one()
+    refresh_adherence(db, plan, {session.date})
+    bump_plan_cache_version(db, plan.id)
     db.commit()
-    db.refresh(session)
+    plan_cache.invalidate(plan.id)
     return session
 
 
-def list_sessions(db: Session, plan_id: int):
-    return db.query(models.Session).filter(models.Session.plan_id == plan_id).all()
+# Date d'une séance de modèle dans un plan qui l'instancie
+TEMPLATE_SESSION_DATE = models.TrainingPlan.start_date + models.TemplateSession.day_offset
+
+
+def select_template_sessions(*columns):
+    """SELECT sur les séances de modèle de chaque plan qui n'ont pas encore de ligne dans ``sessions``.
+
+    La jointure expose ``TrainingPlan`` et ``TemplateSession`` aux filtres de l'appelant.
+    """
+    overridden = (
+        select(models.Session.id)
+        .where(
+            models.Session.plan_id == models.TrainingPlan.id,
+            models.Session.template_session_id == models.TemplateSession.id,
+        )
+        .exists()
+    )
+    return (
+        select(*columns)
+        .select_from(models.TrainingPlan)
+        .join(models.TemplateSession, models.TemplateSession.template_id == models.TrainingPlan.template_id)
+        .where(~overridden)
+    )
+
+
+def _virtual_session(plan_id: int, template_session: models.TemplateSession, day: date) -> models.Session:
+    """Séance de modèle présentée comme une ``Session`` transitoire, jamais ajoutée à la session SQLAlchemy."""
+    return models.Session(
+        plan_id=plan_id,
+        template_session_id=template_session.id,
+        date=day,
+        type=template_session.type,
+        exercise=template_session.exercise,
+        strava_activity_id=None,
+        completed=False,
+    )
+
+
+def list_template_sessions(db: Session, *criteria) -> list[models.Session]:
+    """Séances de modèle non matérialisées correspondant à *criteria* (cf. :func:`select_template_sessions`)."""
+    day = TEMPLATE_SESSION_DATE.label("date")
+    rows = db.execute(
+        select_template_sessions(models.TrainingPlan.id, models.TemplateSession, day)
+        .where(*criteria)
+        .order_by(day, models.TemplateSession.id)
+    )
+    return [_virtual_session(plan_id, template_session, day) for plan_id, template_session, day in rows]
+
+
+def _session_order(session: models.Session) -> tuple:
+    return session.date, session.id is None, session.id or session.template_session_id
+
+
+def expand_plan_sessions(db: Session, plans: list[models.TrainingPlan]) -> dict[int, list[models.Session]]:
+    """Séances de chaque plan, celles héritées d'un modèle comprises, triées par date."""
+    sessions = {plan.id: list(plan.sessions) for plan in plans}
+    template_plans = [plan.id for plan in plans if plan.template_id is not None]
+    if template_plans:
+        for session in list_template_sessions(db, models.TrainingPlan.id.in_(template_plans)):
+            sessions[session.plan_id].append(session)
+        for plan_id in template_plans:
+            sessions[plan_id].sort(key=_session_order)
+    return sessions
+
+
+def materialize_template_session(
+    db: Session, plan: models.TrainingPlan, template_session_id: int
+) -> models.Session | None:
+    """Ligne ``sessions`` de la séance de modèle *template_session_id* dans *plan*, créée au besoin.
+
+    Retourne ``None`` si la séance n'appartient pas au modèle du plan. Ne valide pas la transaction.
+    """
+    template_session = db.get(models.TemplateSession, template_session_id)
+    if plan.template_id is None or template_session is None or template_session.template_id != plan.template_id:
+        return None
+    db.execute(
+        pg_insert(models.Session)
+        .values(
+            plan_id=plan.id,
+            template_session_id=template_session.id,
+            date=plan.start_date + timedelta(days=template_session.day_offset),
+            type=template_session.type,
+            exercise=template_session.exercise,
+            completed=False,
+        )
+        .on_conflict_do_nothing(index_elements=[models.Session.plan_id, models.Session.template_session_id])
+    )
+    return (
+        db.query(models.Session)
+        .filter(models.Session.plan_id == plan.id, models.Session.template_session_id == template_session.id)
+        .one()
+    )
+
+
+def get_session(db: Session, plan_id: int, session_id: int) -> models.Session | None:
+    return (
+        db.query(models.Session)
+        .filter(models.Session.id == session_id, models.Session.plan_id == plan_id)
+        .first()
+    )
+
+
+def update_session(
+    db: Session, plan: models.TrainingPlan, session: models.Session, changes: dict
+) -> models.Session:
+    previous_date = session.date
+    for key, value in changes.items():
+        setattr(session, key, value)
+    db.flush()
+    refresh_adherence(db, plan, {previous_date, session.date})
+    bump_plan_cache_version(db, plan.id)
+    db.commit()
+    plan_cache.invalidate(plan.id)
+    return session
+
+
+def list_sessions(db: Session, plan_id: int) -> list[models.Session]:
+    """Séances du plan, y compris celles de son modèle qui n'ont pas été modifiées."""
+    sessions = db.query(models.Session).filter(models.Session.plan_id == plan_id).all()
+    sessions += list_template_sessions(db, models.TrainingPlan.id == plan_id)
+    return sorted(sessions, key=_session_order)
+
+
+def list_runs_missing_stream(
+    db: Session, user_id: int, types: tuple[str, ...], since: str, limit: int
+) -> list[models.StravaActivity]:
+    """Courses récentes (``start_date >= since``) dont les séries n'ont pas encore été récupérées."""
+    return (
+        db.query(models.StravaActivity)
+        .outerjoin(
+            models.ActivityStream,
+            (models.ActivityStream.activity_id == models.StravaActivity.id)
+            & (models.ActivityStream.user_id == models.StravaActivity.user_id),
+        )
+        .filter(
+            models.StravaActivity.user_id == user_id,
+            models.StravaActivity.type.in_(types),
+            models.StravaActivity.start_date >= since,
+            models.ActivityStream.id.is_(None),
+        )
+        .order_by(models.StravaActivity.start_date.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def save_best_efforts(db: Session, activity: models.StravaActivity, efforts: list) -> None:
+    """Enregistre les meilleurs efforts d'une activité et améliore les records de l'utilisateur.
+
+    La mise à jour des records est incrémentale : un record n'est remplacé que
+    si le nouvel effort est plus rapide (clause ``WHERE`` de l'upsert).
+    """
+    if not efforts:
+        return
+    rows = [
+        {
+            "distance_name": effort.distance_name,
+            "distance": effort.distance,
+            "elapsed_time": effort.elapsed_time,
+            "start_offset": effort.start_offset,
+        }
+        for effort in efforts
+    ]
+    stmt = pg_insert(models.ActivityBestEffort).values(
+        [{**row, "activity_id": activity.id, "user_id": activity.user_id} for row in rows]
+    )
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[models.ActivityBestEffort.activity_id, models.ActivityBestEffort.distance_name],
+            set_={"elapsed_time": stmt.excluded.elapsed_time, "start_offset": stmt.excluded.start_offset},
+        )
+    )
+
+    records = pg_insert(models.PersonalRecord).values(
+        [
+            {
+                "user_id": activity.user_id,
+                "distance_name": row["distance_name"],
+                "distance": row["distance"],
+                "elapsed_time": row["elapsed_time"],
+                "activity_id": activity.id,
+                "strava_id": activity.strava_id,
+                "achieved_at": activity.start_date,
+            }
+            for row in rows
+        ]
+    )
+    db.execute(
+        records.on_conflict_do_update(
+            index_elements=[models.PersonalRecord.user_id, models.PersonalRecord.distance_name],
+            set_={
+                key: records.excluded[key]
+                for key in ("elapsed_time", "activity_id", "strava_id", "achieved_at")
+            },
+            where=records.excluded.elapsed_time < models.PersonalRecord.elapsed_time,
+        )
+    )
+    db.commit()
+
+
+def list_personal_records(db: Session, user_id: int) -> list[models.PersonalRecord]:
+    return (
+        db.query(models.PersonalRecord)
+        .filter(models.PersonalRecord.user_id == user_id)
+        .order_by(models.PersonalRecord.distance)
+        .all()
+    )
+
+
+def list_user_sessions_between(db: Session, owner_id: int, date_from: date, date_to: date):
+    """Séances de tous les plans de *owner_id* entre deux dates incluses (index ``(plan_id, date)``),
+    y compris celles héritées des modèles."""
+    sessions = (
+        db.query(models.Session)
+        .join(models.TrainingPlan, models.Session.plan_id == models.TrainingPlan.id)
+        .filter(
+            models.TrainingPlan.owner_id == owner_id,
+            models.TrainingPlan.archived_at.is_(None),
+            models.Session.date >= date_from,
+            models.Session.date <= date_to,
+        )
+        .all()
+    )
+    sessions += list_template_sessions(
+        db,
+        models.TrainingPlan.owner_id == owner_id,
+        models.TrainingPlan.archived_at.is_(None),
+        TEMPLATE_SESSION_DATE >= date_from,
+        TEMPLATE_SESSION_DATE <= date_to,
+    )
+    return sorted(sessions, key=_session_order)
+
+
+def search(db: Session, owner_id: int, q: str, limit: int = 20):
+    """Recherche plein texte dans les plans et séances non archivés de *owner_id*.
+
+    ``websearch_to_tsquery`` accepte la syntaxe des moteurs de recherche
+    (guillemets, ``-exclusion``, ``or``) sans jamais lever d'erreur de syntaxe.
+    Les filtres ``@@`` utilisent les index GIN sur ``search_vector``.
+    Retourne deux listes de couples ``(objet, score)`` triées par pertinence.
+    """
+    query = func.websearch_to_tsquery(models.SEARCH_CONFIG, q)
+
+    plan_rank = func.ts_rank(models.TrainingPlan.search_vector, query).label("rank")
+    plans = (
+        db.query(models.TrainingPlan, plan_rank)
+        .filter(
+            models.TrainingPlan.owner_id == owner_id,
+            models.TrainingPlan.archived_at.is_(None),
+            models.TrainingPlan.search_vector.bool_op("@@")(query),
+        )
+        .order_by(plan_rank.desc(), models.TrainingPlan.id)
+        .limit(limit)
+        .all()
+    )
+
+    session_rank = func.ts_rank(models.Session.search_vector, query).label("rank")
+    sessions = (
+        db.query(models.Session, session_rank)
+        .join(models.TrainingPlan, models.Session.plan_id == models.TrainingPlan.id)
+        .filter(
+            models.TrainingPlan.owner_id == owner_id,
+            models.TrainingPlan.archived_at.is_(None),
+            models.Session.search_vector.bool_op("@@")(query),
+        )
+        .order_by(session_rank.desc(), models.Session.date, models.Session.id)
+        .limit(limit)
+        .all()
+    )
+
+    template_rank = func.ts_rank(models.TemplateSession.search_vector, query).label("rank")
+    day = TEMPLATE_SESSION_DATE.label("date")
+    inherited = db.execute(
+        select_template_sessions(models.TrainingPlan.id, models.TemplateSession, day, template_rank)
+        .where(
+            models.TrainingPlan.owner_id == owner_id,
+            models.TrainingPlan.archived_at.is_(None),
+            models.TemplateSession.search_vector.bool_op("@@")(query),
+        )
+        .order_by(template_rank.desc(), day, models.TemplateSession.id)
+        .limit(limit)
+    )
+    sessions += [
+        (_virtual_session(plan_id, template_session, day), rank)
+        for plan_id, template_session, day, rank in inherited
+    ]
+    sessions.sort(key=lambda hit: -hit[1])
+    return plans, sessions[:limit]
+
+
+def list_strava_activities_between(db: Session, user_id: int, date_from: date, date_to: date):
+    """Activités Strava de *user_id* entre deux dates incluses.
+
+    ``start_date`` est une chaîne ISO : la comparaison lexicographique suit l'ordre chronologique.
+    """
+    return (
+        db.query(models.StravaActivity)
+        .filter(
+            models.StravaActivity.user_id == user_id,
+            models.StravaActivity.start_date >= date_from.isoformat(),
+            models.StravaActivity.start_date < (date_to + timedelta(days=1)).isoformat(),
+        )
+        .order_by(models.StravaActivity.start_date)
+        .all()
+    )
+
+
+
+# ---------- Idempotency ----------
+
+IDEMPOTENCY_TTL = timedelta(hours=24)
+
+
+def reserve_idempotency_key(
+    db: Session, user_id: int, key: str, request_hash: str, lease: timedelta
+) -> tuple[models.IdempotencyKey, bool]:
+    """Réserve *key* pour l'utilisateur.
+
+    Retourne l'enregistrement et ``True`` s'il vient d'être créé, ``False`` s'il
+    existait déjà (requête en cours ou réponse à rejouer). Les clés de plus de
+    ``IDEMPOTENCY_TTL`` sont considérées comme libres, de même que les clés
+    sans réponse réservées depuis plus de *lease* : la requête d'origine est
+    morte (worker tué, délai dépassé) et un nouvel essai peut être exécuté.
+    """
+    now = datetime.utcnow()
+    db.query(models.IdempotencyKey).filter(
+        models.IdempotencyKey.user_id == user_id,
+        models.IdempotencyKey.key == key,
+        (models.IdempotencyKey.created_at < now - IDEMPOTENCY_TTL)
+        | (models.IdempotencyKey.status_code.is_(None) & (models.IdempotencyKey.created_at < now - lease)),
+    ).delete(synchronize_session=False)
+    stmt = (
+        pg_insert(models.IdempotencyKey)
+        .values(user_id=user_id, key=key, request_hash=request_hash, created_at=now)
+        .on_conflict_do_nothing(index_elements=["user_id", "key"])
+        .returning(models.IdempotencyKey.id)
+    )
+    inserted = db.execute(stmt).scalar_one_or_none()
+    db.commit()
+    record = (
+        db.query(models.IdempotencyKey)
+        .filter(models.IdempotencyKey.user_id == user_id, models.IdempotencyKey.key == key)
+        .one()
+    )
+    return record, inserted is not None
+
+
+def complete_idempotency_key(
+    db: Session, record: models.IdempotencyKey, status_code: int, response_body: str
+) -> bool:
+    """Enregistre la réponse de la requête. Ne valide pas la transaction.
+
+    Retourne ``False`` si la réservation a expiré et été reprise entre-temps :
+    l'appelant doit alors annuler sa transaction.
+    """
+    result = db.execute(
+        update(models.IdempotencyKey)
+        .where(models.IdempotencyKey.id == record.id, models.IdempotencyKey.status_code.is_(None))
+        .values(status_code=status_code, response_body=response_body)
+    )
+    return result.rowcount == 1
+
+
+def release_idempotency_key(db: Session, record: models.IdempotencyKey) -> None:
+    """Libère une clé dont la requête a échoué, pour qu'un nouvel essai soit exécuté."""
+    db.execute(
+        delete(models.IdempotencyKey).where(
+            models.IdempotencyKey.id == record.id, models.IdempotencyKey.status_code.is_(None)
+        )
+    )
+    db.commit()
+
+
+# ---------- Gemini usage ----------
+
+def record_gemini_usage(
+    db: Session,
+    user_id: int,
+    call: str,
+    model: str,
+    outcome: str,
+    prompt_tokens: int,
+    output_tokens: int,
+    latency_ms: int,
+) -> None:
+    db.execute(
+        insert(models.GeminiUsage).values(
+            user_id=user_id,
+            call=call,
+            model=model,
+            outcome=outcome,
+            prompt_tokens=prompt_tokens,
+            output_tokens=output_tokens,
+            latency_ms=latency_ms,
+            created_at=datetime.utcnow(),
+        )
+    )
+    db.commit()
+
+
+def gemini_tokens_used(db: Session, since: datetime, user_id: int | None = None) -> int:
+    """Tokens (prompt et réponse) consommés depuis *since*, par *user_id* ou au total."""
+    stmt = select(
+        func.coalesce(func.sum(models.GeminiUsage.prompt_tokens + models.GeminiUsage.output_tokens), 0)
+    ).where(models.GeminiUsage.created_at >= since)
+    if user_id is not None:
+        stmt = stmt.where(models.GeminiUsage.user_id == user_id)
+    return db.execute(stmt).scalar_one()
+
+
+# ---------- Strava sync status ----------
+
+def claim_strava_sync(db: Session, user_id: int, lease: timedelta) -> models.StravaSyncStatus | None:
+    """Marque la synchronisation de *user_id* comme en cours, sauf si elle l'est déjà.
+
+    Une synchronisation « en cours » depuis plus de *lease* est considérée comme
+    interrompue (worker tué) et peut être reprise. Retourne ``None`` si un autre
+    processus détient déjà la synchronisation.
+    """
+    now = datetime.utcnow()
+    table = models.StravaSyncStatus.__table__
+    stmt = (
+        pg_insert(models.StravaSyncStatus)
+        .values(user_id=user_id, status="running", started_at=now)
+        .on_conflict_do_update(
+            index_elements=[models.StravaSyncStatus.user_id],
+            set_={"status": "running", "started_at": now, "error": None},
+            where=(table.c.status != "running") | (table.c.started_at < now - lease),
+        )
+        .returning(models.StravaSyncStatus)
+        .execution_options(populate_existing=True)
+    )
+    status = db.execute(stmt).scalar_one_or_none()
+    db.commit()
+    return status
+
+
+def finish_strava_sync(
+    db: Session, status: models.StravaSyncStatus, imported: int, updated: int, error: str | None = None
+) -> None:
+    now = datetime.utcnow()
+    status.status = "failed" if error else "succeeded"
+    status.finished_at = now
+    status.duration_seconds = (now - status.started_at).total_seconds()
+    status.imported = imported
+    status.updated = updated
+    status.error = error
+    if error is None:
+        status.last_success_at = now
+    db.add(status)
+    db.commit()
+
+
+def get_strava_sync_status(db: Session, user_id: int) -> models.StravaSyncStatus | None:
+    return db.get(models.StravaSyncStatus, user_id)
+
+
+def list_due_strava_syncs(db: Session, stale_before: datetime, limit: int) -> list[int]:
+    """Utilisateurs liés à Strava dont la dernière tentative de synchronisation précède *stale_before*.
+
+    Filtrer sur la tentative (et non le dernier succès) espace aussi les
+    nouvelles tentatives pour les comptes en échec. Les comptes jamais
+    synchronisés passent en premier, puis les moins récemment synchronisés.
+    """
+    status = models.StravaSyncStatus
+    rows = (
+        db.query(models.StravaToken.user_id)
+        .outerjoin(status, status.user_id == models.StravaToken.user_id)
+        .filter((status.started_at.is_(None)) | (status.started_at < stale_before))
+        .order_by(status.last_success_at.asc().nulls_first(), models.StravaToken.user_id)
+        .limit(limit)
+        .all()
+    )
+    return [user_id for (user_id,) in rows]
+
+
+# ---------- Strava import jobs ----------
+
+def create_strava_import_job(db: Session, user_id: int, job_id: str) -> models.StravaImportJob:
+    job = db.execute(
+        insert(models.StravaImportJob)
+        .values(job_id=job_id, user_id=user_id, status="pending", created_at=datetime.utcnow())
+        .returning(models.StravaImportJob)
+    ).scalar_one()
+    db.commit()
+    return job
+
+
+def get_strava_import_job(db: Session, job_id: str, user_id: int) -> models.StravaImportJob | None:
+    return (
+        db.query(models.StravaImportJob)
+        .filter(models.StravaImportJob.job_id == job_id, models.StravaImportJob.user_id == user_id)
+        .first()
+    )
+
+
+def update_strava_import_job(db: Session, job_id: str, **changes) -> None:
+    db.execute(
+        update(models.StravaImportJob)
+        .where(models.StravaImportJob.job_id == job_id)
+        .values(**changes, updated_at=datetime.utcnow())
+    )
+    db.commit()
+
+
+# ---------- Routes ----------
+
+# Espace de noms des verrous consultatifs pg_advisory_xact_lock(namespace, user_id)
+ROUTE_LOCK_NAMESPACE = 4301
+
+
+def lock_user_routes(db: Session, user_id: int) -> None:
+    """Sérialise l'indexation des parcours d'un utilisateur jusqu'à la fin de la transaction."""
+    db.execute(select(func.pg_advisory_xact_lock(ROUTE_LOCK_NAMESPACE, user_id)))
+
+
+def list_activities_without_route(db: Session, user_id: int) -> list[models.StravaActivity]:
+    return (
+        db.query(models.StravaActivity)
+        .filter(
+            models.StravaActivity.user_id == user_id,
+            models.StravaActivity.route_id.is_(None),
+            models.StravaActivity.summary_polyline.is_not(None),
+        )
+        .order_by(models.StravaActivity.start_date, models.StravaActivity.id)
+        .all()
+    )
+
+
+def find_route_candidates(
+    db: Session, user_id: int, endpoints: list[str], cells: set[str], limit: int
+) -> list[tuple[models.RouteCluster, int]]:
+    """Parcours dont le seau départ/arrivée est dans *endpoints*, partageant le plus de cellules avec *cells*.
+
+    Retourne des couples ``(parcours, cellules communes)`` par nombre décroissant.
+    """
+    shared = func.count(models.RouteCell.cell).label("shared")
+    return (
+        db.query(models.RouteCluster, shared)
+        .join(models.RouteCell, models.RouteCell.route_id == models.RouteCluster.id)
+        .filter(
+            models.RouteCell.user_id == user_id,
+            models.RouteCell.cell.in_(cells),
+            models.RouteCluster.endpoints.in_(endpoints),
+        )
+        .group_by(models.RouteCluster.id)
+        .order_by(shared.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def create_route_cluster(
+    db: Session, activity: models.StravaActivity, endpoints: str, path: str, cells: set[str]
+) -> models.RouteCluster:
+    cluster = models.RouteCluster(
+        user_id=activity.user_id,
+        endpoints=endpoints,
+        path=path,
+        cell_count=len(cells),
+        distance=activity.distance,
+        activity_count=1,
+    )
+    db.add(cluster)
+    db.flush()
+    db.execute(
+        insert(models.RouteCell),
+        [{"user_id": activity.user_id, "cell": cell, "route_id": cluster.id} for cell in cells],
+    )
+    activity.route_id = cluster.id
+    return cluster
+
+
+def attach_activity_to_route(db: Session, activity: models.StravaActivity, cluster: models.RouteCluster) -> None:
+    activity.route_id = cluster.id
+    cluster.activity_count = models.RouteCluster.activity_count + 1
+    db.flush()
+
+
+def list_routes(db: Session, user_id: int, min_activities: int = 2) -> list[models.RouteCluster]:
+    return (
+        db.query(models.RouteCluster)
+        .filter(
+            models.RouteCluster.user_id == user_id,
+            models.RouteCluster.activity_count >= min_activities,
+        )
+        .order_by(models.RouteCluster.activity_count.desc(), models.RouteCluster.id)
+        .all()
+    )
+
+
+def get_route(db: Session, user_id: int, route_id: int) -> models.RouteCluster | None:
+    return (
+        db.query(models.RouteCluster)
+        .filter(models.RouteCluster.id == route_id, models.RouteCluster.user_id == user_id)
+        .first()
+    )
+
+
+def list_route_activities(db: Session, route: models.RouteCluster) -> list[models.StravaActivity]:
+    return (
+        db.query(models.StravaActivity)
+        .filter(models.StravaActivity.user_id == route.user_id, models.StravaActivity.route_id == route.id)
+        .order_by(models.StravaActivity.start_date)
+        .all()
+    )
+
+
+# ---------- Heatmap ----------
+
+HEATMAP_LOCK_NAMESPACE = 4302
+
+
+def lock_user_heatmap(db: Session, user_id: int) -> None:
+    """Sérialise la mise à jour des tuiles d'un utilisateur jusqu'à la fin de la transaction."""
+    db.execute(select(func.pg_advisory_xact_lock(HEATMAP_LOCK_NAMESPACE, user_id)))
+
+
+def count_heatmap_activities(db: Session, user_id: int, version: int) -> int:
+    return (
+        db.query(func.count(models.StravaActivity.id))
+        .filter(models.StravaActivity.user_id == user_id, models.StravaActivity.heatmap_version == version)
+        .scalar()
+    )
+
+
+def bump_heatmap_version(db: Session, user: models.User) -> None:
+    """Passe à une nouvelle version de heatmap : toutes les activités seront rastérisées à nouveau."""
+    user.heatmap_version = user.heatmap_version + 1
+    db.flush()
+
+
+def list_activities_missing_heatmap(db: Session, user_id: int, version: int) -> list[models.StravaActivity]:
+    return (
+        db.query(models.StravaActivity)
+        .filter(
+            models.StravaActivity.user_id == user_id,
+            models.StravaActivity.summary_polyline.is_not(None),
+            models.StravaActivity.heatmap_version.is_distinct_from(version),
+        )
+        .order_by(models.StravaActivity.id)
+        .all()
+    )
+
+
+# ---------- Adherence ----------
+
+def refresh_adherence(db: Session, plan: models.TrainingPlan, dates: set[date]) -> None:
+    """Recalcule le résumé des semaines de *plan* contenant *dates*. Ne valide pas la transaction."""
+    for start in sorted({adherence.week_start(day) for day in dates}):
+        sessions = (
+            db.query(models.Session)
+            .filter(
+                models.Session.plan_id == plan.id,
+                models.Session.date >= start,
+                models.Session.date < start + timedelta(days=7),
+            )
+            .all()
+        )
+        if plan.template_id is not None:
+            sessions += list_template_sessions(
+                db,
+                models.TrainingPlan.id == plan.id,
+                TEMPLATE_SESSION_DATE >= start,
+                TEMPLATE_SESSION_DATE < start + timedelta(days=7),
+            )
+        sessions.sort(key=_session_order)
+        strava_ids = [
+            int(session.strava_activity_id)
+            for session in sessions
+            if session.strava_activity_id and session.strava_activity_id.isdigit()
+        ]
+        distances = {}
+        if strava_ids:
+            distances = {
+                str(strava_id): distance or 0.0
+                for strava_id, distance in db.query(
+                    models.StravaActivity.strava_id, models.StravaActivity.distance
+                ).filter(
+                    models.StravaActivity.user_id == plan.owner_id,
+                    models.StravaActivity.strava_id.in_(strava_ids),
+                )
+            }
+
+        summary = adherence.summarize_week(sessions, distances)
+        if not sessions:
+            db.execute(
+                delete(models.PlanWeekAdherence).where(
+                    models.PlanWeekAdherence.plan_id == plan.id,
+                    models.PlanWeekAdherence.week_start == start,
+                )
+            )
+            continue
+        stmt = pg_insert(models.PlanWeekAdherence).values(
+            plan_id=plan.id, week_start=start, updated_at=datetime.utcnow(), **summary
+        )
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[models.PlanWeekAdherence.plan_id, models.PlanWeekAdherence.week_start],
+                set_={key: stmt.excluded[key] for key in (*summary, "updated_at")},
+            )
+        )
+
+
+def list_plan_adherence(db: Session, plan_id: int) -> list[models.PlanWeekAdherence]:
+    return (
+        db.query(models.PlanWeekAdherence)
+        .filter(models.PlanWeekAdherence.plan_id == plan_id)
+        .order_by(models.PlanWeekAdherence.week_start)
+        .all()
+    )
+
+
+def match_sessions_to_activities(db: Session, user_id: int, since: date) -> int:
+    """Rattache les courses Strava aux séances de course prévues le même jour.
+
+    Une séance non réalisée et sans activité reçoit la première course du jour
+    qui n'est encore rattachée à aucune séance ; elle est alors marquée
+    réalisée. Retourne le nombre de séances rattachées.
+    """
+    sessions = (
+        db.query(models.Session)
+        .join(models.TrainingPlan, models.Session.plan_id == models.TrainingPlan.id)
+        .filter(
+            models.TrainingPlan.owner_id == user_id,
+            models.TrainingPlan.archived_at.is_(None),
+            models.Session.date >= since,
+            models.Session.type == models.SessionType.running,
+            models.Session.completed.is_not(True),
+            models.Session.strava_activity_id.is_(None),
+        )
+        .all()
+    )
+    sessions += list_template_sessions(
+        db,
+        models.TrainingPlan.owner_id == user_id,
+        models.TrainingPlan.archived_at.is_(None),
+        TEMPLATE_SESSION_DATE >= since,
+        models.TemplateSession.type == models.SessionType.running,
+    )
+    sessions.sort(key=_session_order)
+    if not sessions:
+        return 0
+    linked = {
+        strava_activity_id
+        for (strava_activity_id,) in db.query(models.Session.strava_activity_id)
+        .join(models.TrainingPlan, models.Session.plan_id == models.TrainingPlan.id)
+        .filter(models.TrainingPlan.owner_id == user_id, models.Session.strava_activity_id.is_not(None))
+    }
+    by_day: dict[str, list[models.StravaActivity]] = {}
+    for activity in list_strava_activities_between(db, user_id, since, date.today()):
+        if activity.type in adherence.RUN_TYPES and str(activity.strava_id) not in linked:
+            by_day.setdefault(activity.start_date[:10], []).append(activity)
+
+    matched = 0
+    touched: dict[int, set[date]] = {}
+    for session in sessions:
+        candidates = by_day.get(session.date.isoformat())
+        if not candidates:
+            continue
+        if session.id is None:
+            # Séance héritée d'un modèle : sa réalisation la matérialise. Un
+            # autre processus a pu la matérialiser entre-temps, d'où la
+            # relecture de la ligne créée (ou existante).
+            session = materialize_template_session(
+                db, db.get(models.TrainingPlan, session.plan_id), session.template_session_id
+            )
+            if session is None or session.completed or session.strava_activity_id is not None:
+                continue
+        activity = candidates.pop(0)
+        session.strava_activity_id = str(activity.strava_id)
+        session.completed = True
+        matched += 1
+        touched.setdefault(session.plan_id, set()).add(session.date)
+    db.flush()
+    for plan_id, dates in touched.items():
+        refresh_adherence(db, db.get(models.TrainingPlan, plan_id), dates)
+        bump_plan_cache_version(db, plan_id)
+    db.commit()
+    for plan_id in touched:
+        plan_cache.invalidate(plan_id)
+    return matched
@@ -14,6 +14,10 @@ DATABASE_URL = os.getenv(
 # echo=True affiche toutes les requêtes SQL générées par SQLAlchemy
 engine = create_engine(DATABASE_URL, echo=True, future=True)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, future=True)
+# expire_on_commit=False : les objets renvoyés par INSERT ... RETURNING restent
+# utilisables après le commit sans SELECT de rechargement.
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=engine, future=True
+)
 
 Base = declarative_base()
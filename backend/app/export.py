@@ -0,0 +1,160 @@
+"""Export en flux des données d'un utilisateur (plans, séances, activités Strava)."""
+from __future__ import annotations
+
+import csv
+import enum
+import io
+import json
+import zlib
+from datetime import date, datetime
+from typing import Any, Iterator
+
+from sqlalchemy import Integer, literal, null, select, union_all
+
+from . import crud, models
+from .database import SessionLocal
+
+# Nombre de lignes lues par aller-retour sur le curseur serveur
+YIELD_PER = 1000
+# Taille approximative des blocs envoyés au client
+CHUNK_SIZE = 64 * 1024
+
+EXPORT_FORMATS = ("ndjson", "csv")
+
+CSV_COLUMNS = [
+    "kind",
+    "id",
+    "plan_id",
+    "name",
+    "goal",
+    "created_at",
+    "date",
+    "type",
+    "exercise",
+    "completed",
+    "strava_activity_id",
+    "strava_id",
+    "start_date",
+    "distance",
+    "moving_time",
+]
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _stream(db, stmt, kind: str) -> Iterator[dict[str, Any]]:
+    """Parcourt *stmt* via un curseur serveur, sans matérialiser le résultat."""
+    result = db.execute(stmt.execution_options(yield_per=YIELD_PER))
+    for row in result.mappings():
+        yield {"kind": kind, **{key: _normalize(value) for key, value in row.items()}}
+
+
+def iter_export_rows(user_id: int) -> Iterator[dict[str, Any]]:
+    """Produit toutes les lignes exportables d'un utilisateur.
+
+    La session est ouverte ici et non via ``get_db`` : le flux continue d'être
+    consommé après la fin du handler, quand la dépendance a déjà été fermée.
+    """
+    plans = (
+        select(
+            models.TrainingPlan.id,
+            models.TrainingPlan.name,
+            models.TrainingPlan.goal,
+            models.TrainingPlan.created_at,
+        )
+        .where(models.TrainingPlan.owner_id == user_id, models.TrainingPlan.archived_at.is_(None))
+        .order_by(models.TrainingPlan.id)
+    )
+    own_sessions = (
+        select(
+            models.Session.id,
+            models.Session.plan_id,
+            models.Session.date,
+            models.Session.type,
+            models.Session.exercise,
+            models.Session.completed,
+            models.Session.strava_activity_id,
+        )
+        .join(models.TrainingPlan, models.Session.plan_id == models.TrainingPlan.id)
+        .where(models.TrainingPlan.owner_id == user_id, models.TrainingPlan.archived_at.is_(None))
+    )
+    # Séances héritées d'un modèle et jamais modifiées : elles n'ont pas d'identifiant propre
+    template_sessions = crud.select_template_sessions(
+        null().cast(Integer).label("id"),
+        models.TrainingPlan.id.label("plan_id"),
+        crud.TEMPLATE_SESSION_DATE.label("date"),
+        models.TemplateSession.type,
+        models.TemplateSession.exercise,
+        literal(False).label("completed"),
+        null().label("strava_activity_id"),
+    ).where(models.TrainingPlan.owner_id == user_id, models.TrainingPlan.archived_at.is_(None))
+    sessions = union_all(own_sessions, template_sessions).order_by("plan_id", "date")
+    activities = (
+        select(
+            models.StravaActivity.id,
+            models.StravaActivity.strava_id,
+            models.StravaActivity.name,
+            models.StravaActivity.type,
+            models.StravaActivity.start_date,
+            models.StravaActivity.distance,
+            models.StravaActivity.moving_time,
+        )
+        .where(models.StravaActivity.user_id == user_id)
+        .order_by(models.StravaActivity.id)
+    )
+
+    with SessionLocal() as db:
+        yield from _stream(db, plans, "plan")
+        yield from _stream(db, sessions, "session")
+        yield from _stream(db, activities, "strava_activity")
+
+
+def _encode_ndjson(rows: Iterator[dict[str, Any]]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+def _encode_csv(rows: Iterator[dict[str, Any]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_export(user_id: int, fmt: str, compress: bool = False) -> Iterator[bytes]:
+    """Génère l'export encodé par blocs d'environ ``CHUNK_SIZE`` octets.
+
+    Avec *compress*, la sortie est un flux gzip construit au fil de l'eau.
+    """
+    encode = _encode_csv if fmt == "csv" else _encode_ndjson
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    pending: list[bytes] = []
+    size = 0
+    for text in encode(iter_export_rows(user_id)):
+        data = text.encode("utf-8")
+        if compressor is not None:
+            data = compressor.compress(data)
+        if not data:
+            continue
+        pending.append(data)
+        size += len(data)
+        if size >= CHUNK_SIZE:
+            yield b"".join(pending)
+            pending, size = [], 0
+
+    if compressor is not None:
+        pending.append(compressor.flush())
+    if pending:
+        yield b"".join(pending)
@@ -1,19 +1,47 @@
+import logging
 import os
-import google.genai as genai
-from google.genai import types
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, TypeVar
+
+import httpx
 from dotenv import load_dotenv
 
+from . import crud, metrics, schemas
+from .database import SessionLocal
+
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
 # --- Client Initialization ---
+# The google-genai SDK is slow to import, so it is only loaded on first use
+# rather than at application (and every worker) startup.
 api_key = os.getenv("GEMINI_API_KEY")
-client = None
+_client = None
+_client_lock = threading.Lock()
 if not api_key:
-    print("Warning: GEMINI_API_KEY not found. Gemini features will be disabled.")
-else:
-    # The new, correct way to initialize the client
-    client = genai.Client(api_key=api_key)
+    logger.warning("GEMINI_API_KEY not found. Gemini features will be disabled.")
+
+
+def get_client():
+    """Returns the shared Gemini client, creating it on first call (None without an API key)."""
+    global _client
+    if _client is None and api_key:
+        with _client_lock:
+            if _client is None:
+                import google.genai as genai
+
+                _client = genai.Client(api_key=api_key)
+    return _client
+
 
 # --- Model Configuration ---
 generation_config = {
@@ -24,40 +52,229 @@ generation_config = {
     "response_mime_type": "application/json",
 }
 
-def generate_training_plan_from_prompt(prompt: str) -> str | None:
+
+# --- Compact Generation ---
+# Instead of one JSON object per day, the model answers with a few week
+# patterns and, per week, the pattern to follow, a volume factor and the days
+# that differ (schemas.CompactPlan, enforced as response_schema). The plan is
+# expanded server side, so even a long plan fits in a single short answer.
+MODEL_NAME = "gemini-1.5-flash"
+
+# The model call is aborted after GEMINI_PLAN_TIMEOUT seconds.
+PLAN_TIMEOUT = float(os.getenv("GEMINI_PLAN_TIMEOUT", "120"))
+
+# Daily token budgets (prompt + output, UTC day); 0 disables the budget.
+USER_DAILY_TOKENS = int(os.getenv("GEMINI_USER_DAILY_TOKENS", "200000"))
+GLOBAL_DAILY_TOKENS = int(os.getenv("GEMINI_GLOBAL_DAILY_TOKENS", "5000000"))
+
+metrics.describe("gemini_requests_total", "Gemini calls by call kind and outcome (ok, invalid, error, timeout).")
+metrics.describe("gemini_tokens_total", "Gemini tokens consumed, by call kind and direction (prompt, output).")
+metrics.describe("gemini_request_seconds_total", "Cumulative Gemini call latency, by call kind.")
+metrics.describe("gemini_budget_rejections_total", "Plan generations refused by a daily token budget.")
+
+class GeminiError(Exception):
+    """The plan could not be generated (model error or unusable answers)."""
+
+
+class GeminiUnavailable(GeminiError):
+    """No API key is configured."""
+
+
+class GeminiTimeout(GeminiError):
+    """A model call or the whole generation did not finish in time."""
+
+
+class GeminiBudgetExceeded(GeminiError):
+    """A daily token budget is exhausted; ``retry_after`` is the delay until the next UTC day."""
+
+    def __init__(self, scope: str, retry_after: float) -> None:
+        super().__init__(f"Daily Gemini token budget exhausted ({scope})")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+@dataclass
+class _Generation:
+    """Accounting context shared by the calls of one plan generation."""
+
+    user_id: int
+    deadline: float  # time.monotonic()
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+
+def check_budget(user_id: int) -> None:
+    """Raises GeminiBudgetExceeded if the user's or the global daily budget is spent."""
+    now = datetime.utcnow()
+    day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    retry_after = (day_start + timedelta(days=1) - now).total_seconds()
+    with SessionLocal() as db:
+        for scope, budget, scope_user in (
+            ("user", USER_DAILY_TOKENS, user_id),
+            ("global", GLOBAL_DAILY_TOKENS, None),
+        ):
+            if budget and crud.gemini_tokens_used(db, day_start, scope_user) >= budget:
+                metrics.inc("gemini_budget_rejections_total", scope=scope)
+                raise GeminiBudgetExceeded(scope, retry_after)
+
+
+def _record_usage(
+    generation: _Generation, call: str, outcome: str, prompt_tokens: int, output_tokens: int, latency: float
+) -> None:
+    metrics.inc("gemini_requests_total", call=call, outcome=outcome)
+    metrics.inc("gemini_tokens_total", prompt_tokens, call=call, kind="prompt")
+    metrics.inc("gemini_tokens_total", output_tokens, call=call, kind="output")
+    metrics.inc("gemini_request_seconds_total", latency, call=call)
+    try:
+        with SessionLocal() as db:
+            crud.record_gemini_usage(
+                db,
+                user_id=generation.user_id,
+                call=call,
+                model=MODEL_NAME,
+                outcome=outcome,
+                prompt_tokens=prompt_tokens,
+                output_tokens=output_tokens,
+                latency_ms=round(latency * 1000),
+            )
+    except Exception:
+        logger.exception("Failed to record Gemini usage")
+
+
+def _generate(
+    generation: _Generation, call: str, prompt: str, response_schema: type, parse: Callable[[str], T]
+) -> T | None:
+    """Sends a prompt expecting a JSON answer matching *response_schema* and returns ``parse(answer)``.
+
+    Returns None if the call fails or the answer cannot be parsed, and raises
+    GeminiTimeout if it times out. Each call is recorded in the usage table and
+    metrics.
+    """
+    timeout = generation.remaining()
+    if timeout <= 0:
+        raise GeminiTimeout("Plan generation deadline exceeded")
+    from google.genai import types
+
+    prompt_tokens = output_tokens = 0
+    result = None
+    started = time.monotonic()
+    try:
+        response = get_client().models.generate_content(
+            model=MODEL_NAME,
+            contents=prompt,
+            config=types.GenerateContentConfig(
+                **generation_config,
+                response_schema=response_schema,
+                http_options=types.HttpOptions(timeout=int(timeout * 1000)),
+            ),
+        )
+    except httpx.TimeoutException:
+        outcome = "timeout"
+        logger.warning("Gemini %s call timed out after %.1fs", call, timeout)
+    except Exception:
+        outcome = "error"
+        logger.exception("Gemini %s call failed", call)
+    else:
+        usage = response.usage_metadata
+        if usage is not None:
+            prompt_tokens = usage.prompt_token_count or 0
+            output_tokens = (usage.candidates_token_count or 0) + (usage.thoughts_token_count or 0)
+        try:
+            result = parse(response.text)
+            outcome = "ok"
+        except Exception as e:
+            outcome = "invalid"
+            logger.warning("Unusable Gemini %s answer: %s", call, e)
+    _record_usage(generation, call, outcome, prompt_tokens, output_tokens, time.monotonic() - started)
+    if outcome == "timeout":
+        raise GeminiTimeout(f"Gemini {call} call timed out")
+    return result
+
+
+def _wait(future: Future, generation: _Generation):
+    """Result of *future*, without waiting past the generation deadline."""
+    try:
+        return future.result(timeout=max(generation.remaining(), 0))
+    except FutureTimeoutError:
+        raise GeminiTimeout("Plan generation deadline exceeded") from None
+
+
+def _exercise(day: schemas.PatternDay, volume: float) -> str:
+    """Session text, with the ``{km}`` placeholder replaced by the week's distance.
+
+    Pattern distances are scaled by the week's volume and rounded to the half
+    kilometre; an override's distance is exact and used as given.
+    """
+    if day.km is None or "{km}" not in day.exercise:
+        return day.exercise
+    if isinstance(day, schemas.PatternOverride):
+        km = day.km
+    else:
+        km = round(day.km * volume * 2) / 2
+    return day.exercise.replace("{km}", f"{km:g}")
+
+
+def expand_plan(compact: schemas.CompactPlan) -> schemas.GeminiPlan:
+    """Expands the compact encoding into one session per day, from a Monday."""
+    patterns = {pattern.name: pattern.days for pattern in compact.patterns}
+    start = compact.start_date - timedelta(days=compact.start_date.weekday())
+    sessions: list[schemas.GeminiSession] = []
+    for index, week in enumerate(compact.weeks):
+        if week.pattern not in patterns:
+            raise ValueError(f"week {index + 1} uses unknown pattern {week.pattern!r}")
+        days: list[schemas.PatternDay] = list(patterns[week.pattern])
+        for override in week.overrides:
+            days[override.day] = override
+        sessions.extend(
+            schemas.GeminiSession(
+                date=start + timedelta(weeks=index, days=weekday),
+                type=day.type,
+                exercise=_exercise(day, week.volume),
+            )
+            for weekday, day in enumerate(days)
+        )
+    if not sessions:
+        raise ValueError("plan has no weeks")
+    return schemas.GeminiPlan(name=compact.name, goal=compact.goal, sessions=sessions)
+
+
+def _parse_plan(raw: str) -> schemas.GeminiPlan:
+    return expand_plan(schemas.CompactPlan.model_validate_json(raw))
+
+
+def generate_training_plan(prompt: str, user_id: int) -> schemas.GeminiPlan:
     """
     Generates a structured training plan from a user prompt using the Gemini API.
-    This function now uses the new Client API.
+
+    The model returns the compact week-pattern encoding in a single call, which
+    is then expanded into daily sessions.
+
+    The daily token budgets are checked before the call. Raises a GeminiError
+    subclass on failure.
     """
-    if not client:
-        print("Gemini client is not initialized. Cannot generate plan.")
-        return None
-
-    # The prompt asks for a structured JSON response.
-    full_prompt = f"""Crée un plan d'entraînement basé sur cette demande de l'utilisateur : '{prompt}'.
-
-La réponse DOIT être un objet JSON valide et rien d'autre. La structure doit être la suivante :
-{{
-  "name": "Nom du plan (ex: Préparation Marathon en 16 semaines)",
-  "goal": "Description de l'objectif (ex: Courir un marathon en moins de 4 heures)",
-  "sessions": [
-    {{
-      "date": "YYYY-MM-DD",
-      "type": "course_a_pied" | "cardio" | "repos" | "autre",
-      "exercise": "Description de la séance (ex: 5km allure modérée)"
-    }}
-  ]
-}}
-"""
+    if get_client() is None:
+        raise GeminiUnavailable("Gemini client is not initialized")
+    check_budget(user_id)
+    generation = _Generation(user_id=user_id, deadline=time.monotonic() + PLAN_TIMEOUT)
+
+    full_prompt = f"""Prépare un plan d'entraînement pour cette demande de l'utilisateur : '{prompt}'.
 
+Décris le plan de façon compacte :
+- "patterns" : les semaines types du plan (ex : foncier, spécifique, récupération, affûtage), chacune avec ses 7 jours du lundi au dimanche, type "repos" pour les jours sans entraînement. "km" est la distance de référence de la séance (null si sans objet) et "exercise" contient {{km}} là où elle s'insère (ex : "Footing {{km}} km allure facile").
+- "weeks" : une entrée par semaine du plan, dans l'ordre, avec le nom de sa semaine type ("pattern"), le coefficient "volume" appliqué aux distances (1 = distance de référence) et, dans "overrides", uniquement les jours qui diffèrent de la semaine type (0 = lundi, 6 = dimanche), comme la course objectif.
+- "start_date" : un lundi, au format YYYY-MM-DD.
+"""
+    # The call runs in a worker thread so that the caller can give up at the
+    # deadline; the in-flight request is itself bounded by its HTTP timeout.
+    executor = ThreadPoolExecutor(max_workers=1)
     try:
-        # The new, correct way to call the model
-        response = client.models.generate_content(
-            model='gemini-1.5-flash',
-            contents=full_prompt,
-            config=types.GenerateContentConfig(**generation_config)
+        plan = _wait(
+            executor.submit(_generate, generation, "plan", full_prompt, schemas.CompactPlan, _parse_plan),
+            generation,
         )
-        return response.text
-    except Exception as e:
-        print(f"Error generating plan with Gemini: {e}")
-        return None
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    if plan is None:
+        raise GeminiError("Gemini did not return a usable plan")
+    return plan
@@ -0,0 +1,234 @@
+"""Tuiles de heatmap personnelles (« où je cours »), précalculées côté serveur.
+
+Les tracés résumés des activités sont rastérisés dans des grilles de
+comptage 256 x 256 (une par tuile et par niveau de zoom), stockées sur disque
+au format ``.npy``. Chaque nouvelle activité n'ajoute ses passages qu'aux
+tuiles qu'elle traverse ; le PNG d'une tuile modifiée est supprimé puis
+régénéré à la demande.
+
+Le cache est rangé sous ``<HEATMAP_CACHE_DIR>/<user_id>/<version>/`` : pour
+reconstruire entièrement la heatmap d'un utilisateur, on incrémente
+``users.heatmap_version`` et toutes ses activités sont à nouveau rastérisées
+dans un répertoire neuf. Ce répertoire doit donc être partagé par tous les
+processus qui lisent ou écrivent les tuiles (API et sync-worker) : un
+processus qui ne trouverait pas le répertoire de la version courante
+déclencherait une reconstruction complète.
+"""
+from __future__ import annotations
+
+import io
+import math
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from . import crud, models, routes
+
+CACHE_DIR = os.getenv("HEATMAP_CACHE_DIR", os.path.join(tempfile.gettempdir(), "heatmap"))
+MIN_ZOOM = int(os.getenv("HEATMAP_MIN_ZOOM", "2"))
+MAX_ZOOM = int(os.getenv("HEATMAP_MAX_ZOOM", "16"))
+TILE_SIZE = 256
+# Nombre de passages à partir duquel un pixel est affiché à pleine intensité
+SATURATION = 20
+# Activités rastérisées en mémoire avant d'être reportées sur disque
+BATCH_SIZE = int(os.getenv("HEATMAP_BATCH_SIZE", "200"))
+
+
+# ---------- PNG ----------
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def encode_png(rgba: np.ndarray) -> bytes:
+    """Encode une image RGBA (h, w, 4) uint8 en PNG, sans dépendance externe."""
+    height, width = rgba.shape[:2]
+    # Filtre « None » (octet 0) en tête de chaque ligne
+    raw = np.concatenate((np.zeros((height, 1), dtype=np.uint8), rgba.reshape(height, -1)), axis=1)
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", header)
+        + _png_chunk(b"IDAT", zlib.compress(raw.tobytes(), 6))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+def render(counts: np.ndarray) -> bytes:
+    """Colore une grille de comptage (échelle logarithmique, palette « hot »)."""
+    intensity = np.log1p(counts.astype(np.float32)) / math.log1p(SATURATION)
+    intensity = np.clip(intensity, 0.0, 1.0)
+    rgba = np.empty(counts.shape + (4,), dtype=np.uint8)
+    rgba[..., 0] = 255 * np.clip(0.4 + 3 * intensity, 0, 1)
+    rgba[..., 1] = 255 * np.clip(3 * intensity - 1, 0, 1)
+    rgba[..., 2] = 255 * np.clip(3 * intensity - 2, 0, 1)
+    rgba[..., 3] = np.where(counts > 0, 255 * np.clip(0.35 + 0.65 * intensity, 0, 1), 0)
+    return encode_png(rgba)
+
+
+EMPTY_TILE = encode_png(np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8))
+
+
+# ---------- Rastérisation ----------
+
+def _project(points: np.ndarray, zoom: int) -> np.ndarray:
+    """(lat, lng) -> coordonnées pixel globales Web Mercator au niveau *zoom*."""
+    scale = TILE_SIZE * 2**zoom
+    lat = np.radians(np.clip(points[:, 0], -85.0511, 85.0511))
+    x = (points[:, 1] + 180.0) / 360.0 * scale
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0 * scale
+    return np.column_stack((x, y))
+
+
+def rasterize(points: np.ndarray, zoom: int) -> dict[tuple[int, int], np.ndarray]:
+    """Pixels (uniques) traversés par le tracé, regroupés par tuile.
+
+    Chaque segment est échantillonné au moins une fois par pixel, de façon
+    vectorisée. Retourne ``{(x, y): tableau (k, 2) de (ligne, colonne)}``.
+    """
+    pixels = _project(points, zoom)
+    starts, ends = pixels[:-1], pixels[1:]
+    counts = np.ceil(np.hypot(*(ends - starts).T)).astype(np.int64) + 1
+    segment = np.repeat(np.arange(len(starts)), counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    fraction = (offset / np.maximum(counts - 1, 1)[segment])[:, None]
+    samples = np.floor(starts[segment] + fraction * (ends - starts)[segment]).astype(np.int64)
+    samples = np.unique(samples, axis=0)
+
+    tiles: dict[tuple[int, int], np.ndarray] = {}
+    tile_xy = samples // TILE_SIZE
+    keys, inverse = np.unique(tile_xy, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    for index, (tx, ty) in enumerate(keys):
+        local = samples[inverse == index] % TILE_SIZE
+        tiles[(int(tx), int(ty))] = local[:, ::-1]
+    return tiles
+
+
+# ---------- Cache disque ----------
+
+def _user_dir(user_id: int) -> str:
+    return os.path.join(CACHE_DIR, str(user_id))
+
+
+def _tile_path(user_id: int, version: int, z: int, x: int, y: int, ext: str) -> str:
+    return os.path.join(_user_dir(user_id), str(version), str(z), str(x), f"{y}.{ext}")
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as handle:
+        handle.write(data)
+    os.replace(tmp, path)
+
+
+def _collect_pixels(
+    batch: dict[tuple[int, int, int], list[np.ndarray]], points: np.ndarray
+) -> None:
+    """Ajoute à *batch* les pixels traversés par le tracé, à chaque niveau de zoom."""
+    for zoom in range(MIN_ZOOM, MAX_ZOOM + 1):
+        for (x, y), pixels in rasterize(points, zoom).items():
+            batch.setdefault((zoom, x, y), []).append(pixels)
+
+
+def _write_tiles(
+    user_id: int, version: int, batch: dict[tuple[int, int, int], list[np.ndarray]]
+) -> None:
+    """Reporte un lot de passages dans les grilles : une lecture et une écriture par tuile."""
+    for (zoom, x, y), chunks in batch.items():
+        path = _tile_path(user_id, version, zoom, x, y, "npy")
+        counts = np.load(path) if os.path.exists(path) else np.zeros((TILE_SIZE, TILE_SIZE), np.uint32)
+        pixels = np.concatenate(chunks)
+        np.add.at(counts, (pixels[:, 0], pixels[:, 1]), 1)
+        _write_atomic(path, _to_npy(counts))
+        # Le PNG sera régénéré à la prochaine lecture
+        png = _tile_path(user_id, version, zoom, x, y, "png")
+        if os.path.exists(png):
+            os.remove(png)
+
+
+def _to_npy(counts: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    np.save(buffer, counts)
+    return buffer.getvalue()
+
+
+def update_tiles(db: Session, user: models.User) -> int:
+    """Rastérise les tracés pas encore intégrés à la heatmap courante de *user*.
+
+    La version est incrémentée, et tout l'historique rastérisé à nouveau, si
+    le répertoire courant a disparu (cache purgé) ou si une mise à jour
+    précédente s'est interrompue avant de valider (fichier ``.dirty``) : les
+    tuiles pourraient alors compter deux fois certaines activités.
+    Retourne le nombre d'activités ajoutées.
+    """
+    crud.lock_user_heatmap(db, user.id)
+    db.refresh(user)
+    version_dir = os.path.join(_user_dir(user.id), str(user.heatmap_version))
+    dirty = os.path.join(version_dir, ".dirty")
+    if os.path.exists(dirty) or (
+        not os.path.isdir(version_dir)
+        and crud.count_heatmap_activities(db, user.id, user.heatmap_version)
+    ):
+        crud.bump_heatmap_version(db, user)
+        version_dir = os.path.join(_user_dir(user.id), str(user.heatmap_version))
+        dirty = os.path.join(version_dir, ".dirty")
+
+    activities = crud.list_activities_missing_heatmap(db, user.id, user.heatmap_version)
+    if not activities:
+        db.commit()
+        return 0
+    _write_atomic(dirty, b"")
+    # Les pixels sont accumulés par lots de BATCH_SIZE activités : chaque tuile
+    # touchée par un lot n'est lue et réécrite qu'une fois, et la mémoire reste
+    # bornée même quand tout l'historique est rastérisé à nouveau. Le fichier
+    # .dirty n'est retiré qu'après le commit final.
+    batch: dict[tuple[int, int, int], list[np.ndarray]] = {}
+    added = 0
+    for index, activity in enumerate(activities, start=1):
+        points = routes.decode_polyline(activity.summary_polyline or "")
+        if len(points) >= 2:
+            _collect_pixels(batch, points)
+            added += 1
+        activity.heatmap_version = user.heatmap_version
+        if index % BATCH_SIZE == 0:
+            _write_tiles(user.id, user.heatmap_version, batch)
+            batch.clear()
+    _write_tiles(user.id, user.heatmap_version, batch)
+    db.commit()
+    os.remove(dirty)
+    _remove_old_versions(user.id, user.heatmap_version)
+    return added
+
+
+def _remove_old_versions(user_id: int, current: int) -> None:
+    root = _user_dir(user_id)
+    if not os.path.isdir(root):
+        return
+    for name in os.listdir(root):
+        if name != str(current):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def tile_png(user: models.User, z: int, x: int, y: int) -> bytes:
+    """PNG de la tuile demandée, généré depuis la grille de comptage au besoin."""
+    png_path = _tile_path(user.id, user.heatmap_version, z, x, y, "png")
+    try:
+        with open(png_path, "rb") as handle:
+            return handle.read()
+    except FileNotFoundError:
+        pass
+    npy_path = _tile_path(user.id, user.heatmap_version, z, x, y, "npy")
+    try:
+        counts = np.load(npy_path)
+    except FileNotFoundError:
+        return EMPTY_TILE
+    png = render(counts)
+    _write_atomic(png_path, png)
+    return png
@@ -0,0 +1,288 @@
+"""Cache HTTP conditionnel pour les appels à l'API Strava.
+
+``CachingTransport`` s'intercale sous ``httpx.Client`` : une réponse GET est
+servie depuis le cache tant que la durée de vie de son endpoint n'est pas
+écoulée ; au-delà, la requête est renvoyée avec ``If-None-Match`` /
+``If-Modified-Since`` et un ``304`` prolonge l'entrée sans retransférer le
+corps. Les entrées sont indexées par sujet (l'utilisateur, à défaut le token)
+et URL complète.
+
+Le stockage est un répertoire local par défaut (``HTTP_CACHE_BACKEND=disk``),
+ou la table ``http_cache`` (``postgres``) pour le partager entre processus ;
+dans les deux cas borné à ``HTTP_CACHE_MAX_BYTES`` avec éviction LRU.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+
+import httpx
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from . import metrics, models
+from .database import engine
+
+metrics.describe(
+    "strava_http_cache_requests_total",
+    "Requêtes GET vers l'API Strava par résultat de cache (hit, revalidated, miss, bypass).",
+)
+
+MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+CACHE_DIR = os.getenv("HTTP_CACHE_DIR", os.path.join(tempfile.gettempdir(), "strava-http-cache"))
+
+# Durée de vie (secondes) par endpoint ; les URL absentes de la liste ne sont pas mises en cache
+TTLS: list[tuple[re.Pattern, int]] = [
+    (re.compile(r"^/api/v3/activities/\d+/streams$"), 30 * 86400),  # séries : immuables
+    (re.compile(r"^/api/v3/activities/\d+$"), 3600),  # détail : titre ou description modifiables
+    (re.compile(r"^/api/v3/athlete/activities$"), 60),  # liste : nouvelles activités
+]
+
+
+def ttl_for(path: str) -> int | None:
+    for pattern, ttl in TTLS:
+        if pattern.match(path):
+            return ttl
+    return None
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    status_code: int
+    content_type: str | None
+    etag: str | None
+    last_modified: str | None
+    body: bytes
+    stored_at: float
+
+
+# ---------- Stockage ----------
+
+class DiskBackend:
+    """Un fichier par entrée ; l'heure de modification sert d'horodatage LRU."""
+
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size: int | None = None
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key: str) -> CacheEntry | None:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as handle:
+                (length,) = struct.unpack(">I", handle.read(4))
+                meta = json.loads(handle.read(length))
+                body = handle.read()
+            os.utime(path)
+        except (FileNotFoundError, ValueError, struct.error):
+            return None
+        return CacheEntry(body=body, **meta)
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        meta = asdict(entry)
+        del meta["body"]
+        header = json.dumps(meta).encode()
+        data = struct.pack(">I", len(header)) + header + entry.body
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        previous = os.path.getsize(path) if os.path.exists(path) else 0
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data) - previous
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def touch(self, key: str, stored_at: float) -> None:
+        """Prolonge une entrée revalidée par un 304 sans réécrire le corps."""
+        entry = self.get(key)
+        if entry is not None:
+            entry.stored_at = stored_at
+            self.set(key, entry)
+
+    def _files(self) -> list[os.DirEntry]:
+        files = []
+        if not os.path.isdir(self.directory):
+            return files
+        for shard in os.scandir(self.directory):
+            if shard.is_dir():
+                files.extend(entry for entry in os.scandir(shard.path) if entry.is_file())
+        return files
+
+    def _scan_size(self) -> int:
+        return sum(entry.stat().st_size for entry in self._files())
+
+    def _evict(self) -> None:
+        """Supprime les entrées les moins récemment utilisées jusqu'à 90 % de la limite."""
+        files = sorted(self._files(), key=lambda entry: entry.stat().st_mtime)
+        target = self.max_bytes * 0.9
+        for entry in files:
+            if self._size <= target:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            self._size -= size
+
+
+class PostgresBackend:
+    # L'horodatage LRU n'est réécrit qu'au-delà de ce délai, pour ne pas écrire à chaque lecture
+    TOUCH_INTERVAL = 60.0
+    # Fréquence (en écritures) du contrôle de la taille totale
+    EVICT_EVERY = 100
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> CacheEntry | None:
+        table = models.HttpCacheEntry.__table__
+        with engine.begin() as conn:
+            row = conn.execute(select(table).where(table.c.key == key)).mappings().first()
+            if row is None:
+                return None
+            now = time.time()
+            if now - row["accessed_at"] > self.TOUCH_INTERVAL:
+                conn.execute(update(table).where(table.c.key == key).values(accessed_at=now))
+        return CacheEntry(
+            url=row["url"],
+            status_code=row["status_code"],
+            content_type=row["content_type"],
+            etag=row["etag"],
+            last_modified=row["last_modified"],
+            body=row["body"],
+            stored_at=row["stored_at"],
+        )
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        table = models.HttpCacheEntry.__table__
+        values = {**asdict(entry), "size": len(entry.body), "accessed_at": time.time()}
+        with engine.begin() as conn:
+            conn.execute(
+                pg_insert(table)
+                .values(key=key, **values)
+                .on_conflict_do_update(index_elements=["key"], set_=values)
+            )
+        with self._lock:
+            self._writes += 1
+            check = self._writes % self.EVICT_EVERY == 1
+        if check:
+            self._evict()
+
+    def touch(self, key: str, stored_at: float) -> None:
+        table = models.HttpCacheEntry.__table__
+        with engine.begin() as conn:
+            conn.execute(
+                update(table).where(table.c.key == key).values(stored_at=stored_at, accessed_at=time.time())
+            )
+
+    def _evict(self) -> None:
+        table = models.HttpCacheEntry.__table__
+        with engine.begin() as conn:
+            total = conn.execute(select(func.coalesce(func.sum(table.c.size), 0))).scalar()
+            if total <= self.max_bytes:
+                return
+            # Plus anciennes entrées, jusqu'à couvrir l'excédent sur 90 % de la limite
+            excess = total - self.max_bytes * 0.9
+            cumulative = func.sum(table.c.size).over(order_by=(table.c.accessed_at, table.c.key))
+            oldest = select(table.c.key, table.c.size, cumulative.label("cumulative")).subquery()
+            conn.execute(
+                delete(table).where(
+                    table.c.key.in_(select(oldest.c.key).where(oldest.c.cumulative - oldest.c.size < excess))
+                )
+            )
+
+
+# ---------- Transport ----------
+
+def _cache_key(request: httpx.Request) -> str:
+    subject = request.extensions.get("cache_subject")
+    if subject is None:
+        subject = hashlib.sha256(request.headers.get("authorization", "").encode()).hexdigest()
+    return hashlib.sha256(f"{subject}\n{request.url}".encode()).hexdigest()
+
+
+class CachingTransport(httpx.BaseTransport):
+    def __init__(self, backend: DiskBackend | PostgresBackend, transport: httpx.BaseTransport | None = None) -> None:
+        self.backend = backend
+        self.transport = transport or httpx.HTTPTransport()
+
+    def _cached_response(self, request: httpx.Request, entry: CacheEntry) -> httpx.Response:
+        headers = {"content-type": entry.content_type} if entry.content_type else {}
+        return httpx.Response(entry.status_code, headers=headers, content=entry.body, request=request)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        ttl = ttl_for(request.url.path) if request.method == "GET" else None
+        if ttl is None:
+            metrics.inc("strava_http_cache_requests_total", result="bypass")
+            return self.transport.handle_request(request)
+
+        key = _cache_key(request)
+        entry = self.backend.get(key)
+        now = time.time()
+        if entry is not None and now - entry.stored_at < ttl:
+            metrics.inc("strava_http_cache_requests_total", result="hit")
+            return self._cached_response(request, entry)
+
+        if entry is not None:
+            if entry.etag:
+                request.headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                request.headers["If-Modified-Since"] = entry.last_modified
+        response = self.transport.handle_request(request)
+
+        if response.status_code == 304 and entry is not None:
+            response.close()
+            self.backend.touch(key, now)
+            metrics.inc("strava_http_cache_requests_total", result="revalidated")
+            return self._cached_response(request, entry)
+
+        metrics.inc("strava_http_cache_requests_total", result="miss")
+        if response.status_code != 200:
+            return response
+        body = response.read()
+        response.close()
+        entry = CacheEntry(
+            url=str(request.url),
+            status_code=200,
+            content_type=response.headers.get("content-type"),
+            etag=response.headers.get("etag"),
+            last_modified=response.headers.get("last-modified"),
+            body=body,
+            stored_at=now,
+        )
+        self.backend.set(key, entry)
+        return self._cached_response(request, entry)
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+def make_transport() -> httpx.BaseTransport:
+    """Transport de l'API Strava selon ``HTTP_CACHE_BACKEND`` (disk, postgres ou none)."""
+    backend = os.getenv("HTTP_CACHE_BACKEND", "disk")
+    if backend == "none":
+        return httpx.HTTPTransport()
+    if backend == "postgres":
+        return CachingTransport(PostgresBackend(MAX_BYTES))
+    return CachingTransport(DiskBackend(CACHE_DIR, MAX_BYTES))
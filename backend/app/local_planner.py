@@ -0,0 +1,201 @@
+"""Générateur de plans déterministe pour les demandes standard (5 km, 10 km, semi, marathon).
+
+Construit directement un ``schemas.GeminiPlan`` à partir de paramètres structurés,
+sans appel au modèle : périodisation (foncier, développement, spécifique, affûtage),
+progression de la sortie longue avec semaine allégée toutes les 4 semaines, et
+jours sans course renseignés en ``SessionType.repos``.
+"""
+from __future__ import annotations
+
+import re
+import unicodedata
+from datetime import date, timedelta
+
+from . import schemas
+from .schemas import RaceDistance, SessionType
+
+# Sortie longue de départ et au pic (km), nombre de semaines d'affûtage
+_RACES: dict[RaceDistance, dict] = {
+    RaceDistance.five_k: {"label": "5 km", "long_start": 6, "long_peak": 12, "taper": 1, "pace": "allure 5 km"},
+    RaceDistance.ten_k: {"label": "10 km", "long_start": 8, "long_peak": 16, "taper": 1, "pace": "allure 10 km"},
+    RaceDistance.half: {"label": "semi-marathon", "long_start": 10, "long_peak": 21, "taper": 2, "pace": "allure semi"},
+    RaceDistance.marathon: {"label": "marathon", "long_start": 14, "long_peak": 32, "taper": 3, "pace": "allure marathon"},
+}
+
+# Jours de course (0 = lundi) selon le nombre de sorties hebdomadaires ; la sortie longue est le dimanche
+_WEEK_LAYOUTS: dict[int, list[tuple[int, str]]] = {
+    2: [(2, "quality"), (6, "long")],
+    3: [(1, "quality"), (3, "easy"), (6, "long")],
+    4: [(1, "quality"), (3, "tempo"), (4, "easy"), (6, "long")],
+    5: [(0, "easy"), (1, "quality"), (3, "tempo"), (4, "easy"), (6, "long")],
+    6: [(0, "easy"), (1, "quality"), (2, "easy"), (3, "tempo"), (5, "easy"), (6, "long")],
+    7: [(0, "easy"), (1, "quality"), (2, "easy"), (3, "tempo"), (4, "easy"), (5, "easy"), (6, "long")],
+}
+
+_QUALITY = {
+    "base": "Fartlek 8x1 min rapide / 1 min trot",
+    "build": "Fractionné 6x800 m {pace}, récup 2 min",
+    "peak": "Fractionné 5x1000 m {pace}, récup 90 s",
+    "taper": "Rappel 4x400 m {pace}, récup 2 min",
+}
+_TEMPO = {
+    "base": "Côtes 6x45 s, récup descente trot",
+    "build": "Tempo 3x8 min allure seuil, récup 2 min",
+    "peak": "Tempo 25 min {pace}",
+    "taper": "Tempo 10 min {pace}",
+}
+
+
+def _phases(weeks: int, taper: int) -> list[str]:
+    taper = min(taper, max(weeks - 2, 0))
+    training = weeks - taper
+    base = max(round(training * 0.45), 1)
+    peak = max(round(training * 0.2), 1) if training > 2 else 0
+    build = max(training - base - peak, 0)
+    return ["base"] * base + ["build"] * build + ["peak"] * peak + ["taper"] * taper
+
+
+def _long_run_km(week: int, weeks: int, phases: list[str], race: dict) -> float:
+    """Progression linéaire jusqu'au pic, semaine allégée toutes les 4 semaines, puis affûtage."""
+    training_weeks = max(sum(1 for phase in phases if phase != "taper"), 1)
+    if phases[week] == "taper":
+        remaining = weeks - week
+        return race["long_peak"] * (0.45 + 0.15 * (remaining - 1))
+    progress = week / max(training_weeks - 1, 1)
+    km = race["long_start"] + (race["long_peak"] - race["long_start"]) * progress
+    if (week + 1) % 4 == 0:
+        km *= 0.7
+    return km
+
+
+def _next_monday(today: date) -> date:
+    return today + timedelta(days=(7 - today.weekday()) % 7 or 7)
+
+
+def generate_plan(params: schemas.PlanParameters) -> schemas.GeminiPlan:
+    """Construit un plan complet, une séance par jour, à partir de *params*."""
+    race = _RACES[params.distance]
+    start = params.start_date or _next_monday(date.today())
+    start -= timedelta(days=start.weekday())
+    layout = dict(_WEEK_LAYOUTS[params.runs_per_week])
+    phases = _phases(params.weeks, race["taper"])
+
+    sessions: list[schemas.GeminiSession] = []
+    for week in range(params.weeks):
+        phase = phases[week]
+        long_km = _long_run_km(week, params.weeks, phases, race)
+        easy_km = max(round(long_km * 0.45), 4)
+        for weekday in range(7):
+            day = start + timedelta(weeks=week, days=weekday)
+            kind = layout.get(weekday)
+            is_race_day = week == params.weeks - 1 and weekday == 6
+            if is_race_day:
+                session_type, exercise = SessionType.running, f"Course : {race['label']}"
+            elif kind is None:
+                session_type, exercise = SessionType.repos, "Repos"
+            elif kind == "long":
+                session_type, exercise = SessionType.running, f"Sortie longue {round(long_km)} km en endurance"
+            elif kind == "quality":
+                session_type = SessionType.running
+                exercise = "Échauffement 20 min, " + _QUALITY[phase].format(pace=race["pace"])
+            elif kind == "tempo":
+                session_type = SessionType.running
+                exercise = "Échauffement 15 min, " + _TEMPO[phase].format(pace=race["pace"])
+            else:
+                session_type, exercise = SessionType.running, f"Footing {easy_km} km allure facile"
+            sessions.append(schemas.GeminiSession(date=day, type=session_type, exercise=exercise))
+
+    return schemas.GeminiPlan(
+        name=f"Préparation {race['label']} en {params.weeks} semaines",
+        goal=f"Courir un {race['label']} avec {params.runs_per_week} sorties par semaine",
+        sessions=sessions,
+    )
+
+
+# ---------- Analyse du prompt ----------
+
+_DISTANCE_PATTERNS = [
+    (RaceDistance.half, r"\b(semi[- ]?marathon|semi|half[- ]?marathon|21[.,]1 ?km)\b"),
+    (RaceDistance.marathon, r"\bmarathon\b"),
+    (RaceDistance.ten_k, r"\b10 ?(k|km|kilometres?)\b"),
+    (RaceDistance.five_k, r"\b5 ?(k|km|kilometres?)\b"),
+]
+_WEEKS_PATTERN = r"\b(\d{1,2}) ?(semaines?|sem|weeks?)\b"
+_MONTHS_PATTERN = r"\b(\d{1,2}) ?(mois|months?)\b"
+_RUNS_PATTERN = (
+    r"\b(\d) ?(seances?|sorties?|entrainements?|runs?|fois|jours?|days?) ?"
+    r"(par|/|per|a|chaque)? ?(semaine|sem|week)\b"
+)
+# Objectif chronométré (« en 3h30 », « sub 3h », « moins de 45 min », « 1:45 ») : relève du modèle
+_TIME_GOAL_PATTERN = r"\d ?h\b|\d ?h ?\d{2}\b|\d ?(min|mn)\b|\d:\d{2}|\b(sub|moins de|under|chrono)\b"
+# Mots sans incidence sur le plan : s'il ne reste qu'eux, la demande est « standard »
+_FILLER_WORDS = {
+    "plan", "programme", "entrainement", "entrainer", "preparation", "preparer", "pour", "un", "une",
+    "en", "de", "du", "des", "le", "la", "les", "mon", "ma", "mes", "me", "je", "veux", "voudrais",
+    "souhaite", "courir", "course", "faire", "avec", "sur", "et", "a", "training", "for", "an",
+    "the", "in", "to", "run", "my", "i", "want", "prepare", "with", "and", "over", "on", "moi",
+}
+
+
+def _normalize(prompt: str) -> str:
+    text = unicodedata.normalize("NFKD", prompt.lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def parse_prompt(prompt: str) -> schemas.PlanParameters | None:
+    """Extrait distance, durée et nombre de sorties d'une demande simple.
+
+    Retourne ``None`` si la demande ne se réduit pas à ces paramètres (objectif
+    chronométré, contraintes particulières…) : elle relève alors du modèle.
+
+    >>> parse_prompt("marathon en 16 semaines").weeks
+    16
+    >>> parse_prompt("marathon en moins de 3h en 16 semaines") is None
+    True
+    >>> parse_prompt("marathon sub 3h 16 semaines") is None
+    True
+    >>> parse_prompt("marathon 16 semaines en 3h30") is None
+    True
+    >>> parse_prompt("marathon 16 semaines blessure genou") is None
+    True
+    >>> parse_prompt("5k en 8 semaines débutant") is None
+    True
+    >>> parse_prompt("10k en 10 semaines pas de course le lundi") is None
+    True
+    """
+    text = _normalize(prompt)
+
+    distance = None
+    for race, pattern in _DISTANCE_PATTERNS:
+        if re.search(pattern, text):
+            distance = race
+            text = re.sub(pattern, " ", text)
+            break
+
+    weeks = None
+    match = re.search(_WEEKS_PATTERN, text)
+    if match:
+        weeks = int(match.group(1))
+    else:
+        match = re.search(_MONTHS_PATTERN, text)
+        if match:
+            weeks = round(int(match.group(1)) * 4.33)
+    if match:
+        text = text.replace(match.group(0), " ")
+
+    runs_per_week = 4
+    match = re.search(_RUNS_PATTERN, text)
+    if match:
+        runs_per_week = int(match.group(1))
+        text = text.replace(match.group(0), " ")
+
+    if distance is None or weeks is None or re.search(_TIME_GOAL_PATTERN, text):
+        return None
+    # Tout mot restant (blessure, niveau, jour de repos…) est une contrainte que le
+    # planificateur local ignorerait : la demande relève alors du modèle
+    if any(word not in _FILLER_WORDS for word in re.findall(r"[a-z0-9]+", text)):
+        return None
+    try:
+        return schemas.PlanParameters(distance=distance, weeks=weeks, runs_per_week=runs_per_week)
+    except ValueError:
+        return None
@@ -1,21 +1,54 @@
-from fastapi import FastAPI, Depends, HTTPException
+import time
+
+# Mesuré avant les autres imports pour rendre compte du temps de démarrage complet
+_IMPORT_STARTED = time.perf_counter()
+# Instant du fork du worker, renseigné par post_fork (gunicorn.conf.py). Avec
+# preload_app l'import a lieu une seule fois dans le maître : le démarrage d'un
+# worker se mesure alors depuis son fork, et non depuis cet import.
+worker_started: float | None = None
+
+from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, Header, Query, UploadFile
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from datetime import timedelta
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
 
 from .security import SECRET_KEY, ALGORITHM, create_access_token
 
 
+from .cache import plan_cache
 from .database import SessionLocal
-from . import schemas, crud, models, strava_utils, gemini
+from .singleflight import SingleFlight
+from . import schemas, crud, models, strava_utils, gemini, export, strava_archive, streams, strava_tokens, local_planner, metrics, ratelimit, strava_sync, activity_details, best_efforts, routes, heatmap, adherence
+import asyncio
+import hashlib
 import json
+import logging
+import math
+import os
+import shutil
+import tempfile
 
-app = FastAPI(title="Training Plan API")
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Les tâches de fond (synchronisation, tokens Strava, purge) tournent dans
+    # app.sync_worker, une seule fois, et non dans chaque worker web
+    app.state.startup_seconds = time.perf_counter() - (worker_started or _IMPORT_STARTED)
+    app.state.import_seconds = _IMPORT_SECONDS
+    yield
+
+
+app = FastAPI(title="Training Plan API", lifespan=lifespan)
 
 # --- CORS ---
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse, Response, StreamingResponse
 import httpx
 
 origins = [
@@ -49,6 +82,40 @@ async def root():
     return {"message": "Bienvenue sur l'API de plan d'entraînement!"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Compteurs applicatifs au format texte Prometheus."""
+    return metrics.render()
+
+
+@app.get("/health/live")
+async def health_live():
+    """Liveness : le processus répond."""
+    return {"status": "ok"}
+
+
+@app.get("/health/ready")
+async def health_ready(db: Session = Depends(get_db)):
+    """Readiness : la base est joignable.
+
+    Indique aussi la durée de démarrage du worker (``startup_seconds``, depuis
+    son fork sous gunicorn) et celle de l'import de l'application
+    (``import_seconds``, faite une seule fois dans le maître avec preload_app).
+    """
+    timings = {
+        "startup_seconds": getattr(app.state, "startup_seconds", None),
+        "import_seconds": getattr(app.state, "import_seconds", None),
+    }
+    try:
+        db.execute(text("SELECT 1"))
+    except Exception as e:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "unavailable", "database": str(e), **timings},
+        )
+    return {"status": "ok", "database": "ok", **timings}
+
+
 # ----- Auth helpers -----
 
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(lambda: SessionLocal())):
@@ -65,13 +132,34 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         raise credentials_exception
     return user
 
+
+def rate_limited(scope: str, default_limit: str):
+    """Dépendance : utilisateur courant, limité à *default_limit* (``"requêtes/secondes"``) sur *scope*.
+
+    La limite peut être surchargée par la variable ``RATE_LIMIT_<SCOPE>``.
+    """
+    capacity, per_seconds = ratelimit.parse_limit(os.getenv(f"RATE_LIMIT_{scope.upper()}", default_limit))
+
+    def dependency(current_user: models.User = Depends(get_current_user)) -> models.User:
+        retry_after = ratelimit.limiter.hit(scope, current_user.id, capacity, per_seconds)
+        if retry_after:
+            raise HTTPException(
+                status_code=429,
+                detail="Trop de requêtes, réessayez plus tard.",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+        return current_user
+
+    return dependency
+
 # ---------- Auth ----------
 
 @app.post("/register", response_model=schemas.AuthResponse, status_code=201)
 async def register(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
-    if crud.get_user(db, user_id=0) and db.query(models.User).filter(models.User.email == user_in.email).first():
+    try:
+        user = crud.create_user(db, user_in)
+    except crud.EmailAlreadyRegistered:
         raise HTTPException(status_code=400, detail="Email already registered")
-    user = crud.create_user(db, user_in)
     token = create_access_token({"sub": str(user.id)})
     return {"user": user, "access_token": token}
 
@@ -87,7 +175,10 @@ async def login(form_data: schemas.UserCreate = Depends(), db: Session = Depends
 
 @app.post("/users", response_model=schemas.User, status_code=201)
 async def create_user(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
-    return crud.create_user(db, user_in)
+    try:
+        return crud.create_user(db, user_in)
+    except crud.EmailAlreadyRegistered:
+        raise HTTPException(status_code=400, detail="Email already registered")
 
 @app.get("/users", response_model=list[schemas.User])
 async def list_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
@@ -102,32 +193,142 @@ async def get_user(user_id: int, db: Session = Depends(get_db)):
 
 # ---------- Plans ----------
 
+def _resolve_plan_parameters(request: schemas.PlanGenerateRequest) -> schemas.PlanParameters | None:
+    """Paramètres du générateur local, ou ``None`` si la demande doit passer par Gemini."""
+    if request.engine == schemas.PlanEngine.gemini:
+        if not request.prompt:
+            raise HTTPException(status_code=422, detail="Un prompt est requis pour la génération Gemini.")
+        return None
+    params = request.parameters or (local_planner.parse_prompt(request.prompt) if request.prompt else None)
+    if params is None and (request.engine == schemas.PlanEngine.local or not request.prompt):
+        raise HTTPException(
+            status_code=422, detail="Paramètres du plan manquants ou non reconnus dans le prompt."
+        )
+    return params
+
+
+def _generate_plan(
+    db: Session,
+    owner_id: int,
+    request: schemas.PlanGenerateRequest,
+    record: models.IdempotencyKey | None = None,
+) -> dict:
+    """Génère et enregistre un plan ; retourne sa représentation JSON.
+
+    Avec *record*, la réponse est mémorisée dans la transaction qui crée le
+    plan : un plan enregistré a toujours une réponse à rejouer.
+    """
+    params = _resolve_plan_parameters(request)
+    if params is not None:
+        gemini_plan = local_planner.generate_plan(params)
+    else:
+        gemini_plan = _generate_plan_with_gemini(request.prompt, owner_id)
+
+    try:
+        plan = crud.create_plan_from_gemini(db, owner_id=owner_id, plan_data=gemini_plan)
+        payload = jsonable_encoder(schemas.TrainingPlan.model_validate(plan, from_attributes=True))
+        if record is not None and not crud.complete_idempotency_key(db, record, 201, json.dumps(payload)):
+            # Réservation expirée et reprise par un nouvel essai : c'est lui qui créera le plan
+            db.rollback()
+            raise HTTPException(status_code=409, detail="Requête identique en cours de traitement.")
+        db.commit()
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception("Échec de l'enregistrement du plan généré")
+        raise HTTPException(status_code=500, detail="Failed to save the generated plan.")
+    return payload
+
+
+def _generate_plan_with_gemini(prompt: str, owner_id: int) -> schemas.GeminiPlan:
+    """Génère le plan avec Gemini ; les échecs sont traduits en réponses HTTP explicites."""
+    try:
+        return gemini.generate_training_plan(prompt, owner_id)
+    except gemini.GeminiBudgetExceeded as e:
+        detail = (
+            "Quota journalier de génération atteint, réessayez demain."
+            if e.scope == "user"
+            else "Génération Gemini momentanément saturée, réessayez plus tard."
+        )
+        raise HTTPException(
+            status_code=429, detail=detail, headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+    except gemini.GeminiUnavailable:
+        raise HTTPException(status_code=503, detail="La génération Gemini n'est pas configurée.")
+    except gemini.GeminiTimeout:
+        raise HTTPException(status_code=504, detail="La génération du plan a dépassé le délai imparti.")
+    except gemini.GeminiError as e:
+        logger.warning("Échec de la génération Gemini : %s", e)
+        raise HTTPException(status_code=502, detail="Gemini n'a pas produit de plan exploitable.")
+
+
+# Au-delà, une clé sans réponse est considérée comme abandonnée (cf. crud.reserve_idempotency_key)
+PLAN_GENERATION_LEASE = timedelta(seconds=gemini.PLAN_TIMEOUT + 60)
+
+
+def _generate_plan_idempotent(
+    owner_id: int, request: schemas.PlanGenerateRequest, idempotency_key: str | None, request_hash: str
+) -> tuple[int, dict]:
+    """Génère et enregistre un plan, ou rejoue la réponse déjà associée à *idempotency_key*.
+
+    Exécutée dans un thread : elle ouvre sa propre session.
+    """
+    with SessionLocal() as db:
+        record = None
+        if idempotency_key:
+            record, created = crud.reserve_idempotency_key(
+                db, owner_id, idempotency_key, request_hash, PLAN_GENERATION_LEASE
+            )
+            if not created:
+                if record.request_hash != request_hash:
+                    raise HTTPException(
+                        status_code=422, detail="Idempotency-Key déjà utilisée pour une autre requête."
+                    )
+                if record.status_code is None:
+                    raise HTTPException(status_code=409, detail="Requête identique en cours de traitement.")
+                return record.status_code, json.loads(record.response_body)
+
+        try:
+            payload = _generate_plan(db, owner_id, request, record)
+        except Exception:
+            if record is not None:
+                # La transaction a pu échouer en cours de route : rollback avant de libérer la clé
+                db.rollback()
+                crud.release_idempotency_key(db, record)
+            raise
+        return 201, payload
+
+
+# Regroupe les générations concurrentes identiques d'un même utilisateur sur un seul appel Gemini
+plan_generations = SingleFlight()
+
+
 @app.post("/plans/generate", response_model=schemas.TrainingPlan, status_code=201)
 async def generate_plan(
     request: schemas.PlanGenerateRequest,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key", max_length=255),
+    current_user: models.User = Depends(rate_limited("plans_generate", "5/60")),
 ):
     """
     Génère un plan d'entraînement à partir d'un prompt en utilisant l'API Gemini.
-    """
-    raw_plan_json = gemini.generate_training_plan_from_prompt(request.prompt)
-    if not raw_plan_json:
-        raise HTTPException(status_code=500, detail="Failed to generate plan from Gemini.")
 
-    try:
-        plan_data_dict = json.loads(raw_plan_json)
-        gemini_plan = schemas.GeminiPlan(**plan_data_dict)
-    except (json.JSONDecodeError, Exception) as e:
-        print(f"Error parsing Gemini response: {e}")
-        raise HTTPException(status_code=500, detail="Failed to parse the generated plan.")
+    Les demandes standard (distance, durée, sorties par semaine), passées en
+    ``parameters`` ou reconnues dans le prompt, sont générées localement sans
+    appel au modèle.
 
-    try:
-        db_plan = crud.create_plan_from_gemini(db, owner_id=current_user.id, plan_data=gemini_plan)
-        return db_plan
-    except Exception as e:
-        print(f"Error saving generated plan to DB: {e}")
-        raise HTTPException(status_code=500, detail="Failed to save the generated plan.")
+    Avec un en-tête ``Idempotency-Key``, les nouvelles tentatives rejouent la réponse
+    d'origine au lieu de générer un second plan.
+    """
+    request_hash = hashlib.sha256(request.model_dump_json().encode("utf-8")).hexdigest()
+    # Même clé mais corps différent : vols distincts, pour que le second reçoive sa 422
+    flight_key = (current_user.id, idempotency_key, request_hash)
+    status_code, payload = await plan_generations.do(
+        flight_key,
+        lambda: asyncio.to_thread(
+            _generate_plan_idempotent, current_user.id, request, idempotency_key, request_hash
+        ),
+    )
+    return JSONResponse(status_code=status_code, content=payload)
 
 
 @app.post("/plans", response_model=schemas.TrainingPlan, status_code=201)
@@ -140,6 +341,25 @@ async def create_plan(
     return plan
 
 
+def _plan_payloads(db: Session, plans: list[models.TrainingPlan]) -> list[schemas.TrainingPlan]:
+    """Plans sérialisés avec leurs séances, y compris celles héritées d'un modèle."""
+    sessions = crud.expand_plan_sessions(db, plans)
+    return [
+        schemas.TrainingPlan(
+            id=plan.id,
+            name=plan.name,
+            goal=plan.goal,
+            owner_id=plan.owner_id,
+            template_id=plan.template_id,
+            start_date=plan.start_date,
+            sessions=[
+                schemas.Session.model_validate(session, from_attributes=True) for session in sessions[plan.id]
+            ],
+        )
+        for plan in plans
+    ]
+
+
 @app.get("/plans", response_model=list[schemas.TrainingPlan])
 async def list_plans(
     skip: int = 0,
@@ -147,7 +367,31 @@ async def list_plans(
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    return crud.list_plans(db, owner_id=current_user.id, skip=skip, limit=limit)
+    return _plan_payloads(db, crud.list_plans(db, owner_id=current_user.id, skip=skip, limit=limit))
+
+
+def _cached_plan_response(
+    db: Session, plan_id: int, owner_id: int, kind: str, serialize
+) -> Response:
+    """Sert la réponse *kind* du plan depuis le cache, ou la construit et la met en cache.
+
+    La version du plan est relue en base à chaque requête (lecture par clé
+    primaire) : une écriture faite par un autre worker est visible aussitôt.
+    """
+    found = crud.get_plan_cache_version(db, plan_id)
+    if found is None or found[0] != owner_id:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    version = found[1]
+    cached = plan_cache.get(plan_id, version, kind)
+    if cached is not None:
+        return Response(cached.body, media_type="application/json")
+
+    plan = crud.get_plan(db, plan_id)
+    if not plan or plan.owner_id != owner_id:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    body = json.dumps(jsonable_encoder(serialize(db, plan))).encode("utf-8")
+    plan_cache.set(plan_id, version, kind, body)
+    return Response(body, media_type="application/json")
 
 
 @app.get("/plans/{plan_id}", response_model=schemas.TrainingPlan)
@@ -156,23 +400,110 @@ async def get_plan(
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    plan = crud.get_plan(db, plan_id)
-    if not plan or plan.owner_id != current_user.id:
-        raise HTTPException(status_code=404, detail="Plan not found")
-    return plan
+    return _cached_plan_response(
+        db,
+        plan_id,
+        current_user.id,
+        "plan",
+        lambda db, plan: _plan_payloads(db, [plan])[0],
+    )
 
 
 @app.delete("/plans/{plan_id}", status_code=204)
 async def delete_plan(
     plan_id: int,
+    hard: bool = False,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Archive le plan (purgé plus tard en tâche de fond), ou le supprime immédiatement avec ``hard=true``."""
+    if hard:
+        found = crud.delete_plan(db, plan_id, current_user.id)
+    else:
+        found = crud.archive_plan(db, plan_id, current_user.id)
+    if not found:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    return None
+
+
+@app.post("/plans/{plan_id}/restore", response_model=schemas.TrainingPlan)
+async def restore_plan(
+    plan_id: int,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    if not crud.restore_plan(db, plan_id, current_user.id):
+        raise HTTPException(status_code=404, detail="Archived plan not found")
+    return _plan_payloads(db, [crud.get_plan(db, plan_id)])[0]
+
+
+# ---------- Templates ----------
+
+@app.post("/templates", response_model=schemas.PlanTemplate, status_code=201)
+async def create_template(
+    template_in: schemas.PlanTemplateCreate,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Crée un modèle de plan ; ses séances sont datées en jours depuis le début du plan."""
+    return crud.create_template(db, current_user.id, template_in)
+
+
+@app.post("/plans/{plan_id}/template", response_model=schemas.PlanTemplate, status_code=201)
+async def create_template_from_plan(
+    plan_id: int,
+    options: schemas.PlanTemplateFromPlan,
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
+    """Crée un modèle à partir des séances d'un plan existant (généré ou saisi)."""
     plan = crud.get_plan(db, plan_id)
     if not plan or plan.owner_id != current_user.id:
         raise HTTPException(status_code=404, detail="Plan not found")
-    crud.delete_plan(db, plan)
-    return None
+    template = crud.create_template_from_plan(db, plan, options.public)
+    if template is None:
+        raise HTTPException(status_code=422, detail="Le plan ne contient aucune séance.")
+    return template
+
+
+@app.get("/templates", response_model=list[schemas.PlanTemplate])
+async def list_templates(
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Modèles de l'utilisateur et modèles publics."""
+    return crud.list_templates(db, current_user.id)
+
+
+@app.get("/templates/{template_id}", response_model=schemas.PlanTemplate)
+async def get_template(
+    template_id: int,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    template = crud.get_template(db, template_id, current_user.id)
+    if template is None:
+        raise HTTPException(status_code=404, detail="Template not found")
+    return template
+
+
+@app.post("/templates/{template_id}/plans", response_model=schemas.TrainingPlan, status_code=201)
+async def create_plan_from_template(
+    template_id: int,
+    plan_in: schemas.PlanFromTemplate,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Instancie un modèle pour l'utilisateur à partir de ``start_date``.
+
+    Les séances ne sont pas copiées : elles sont lues depuis le modèle, et une
+    séance n'est enregistrée dans le plan qu'une fois modifiée ou réalisée.
+    """
+    template = crud.get_template(db, template_id, current_user.id)
+    if template is None:
+        raise HTTPException(status_code=404, detail="Template not found")
+    plan = crud.create_plan_from_template(db, current_user.id, template, plan_in.start_date, plan_in.name)
+    return _plan_payloads(db, [plan])[0]
 
 
 # ---------- Sessions ----------
@@ -190,16 +521,219 @@ async def add_session(
     return crud.add_session(db, plan, session_in)
 
 
-@app.get("/plans/{plan_id}/sessions", response_model=list[schemas.Session])
-async def list_sessions(
+@app.patch("/plans/{plan_id}/sessions/{session_id}", response_model=schemas.Session)
+async def update_session(
+    plan_id: int,
+    session_id: int,
+    session_in: schemas.SessionUpdate,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Modifie une séance (réalisation, rattachement à une activité Strava…)."""
+    plan = crud.get_plan(db, plan_id)
+    if not plan or plan.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    session = crud.get_session(db, plan.id, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return crud.update_session(db, plan, session, session_in.dict(exclude_unset=True))
+
+
+@app.patch("/plans/{plan_id}/template-sessions/{template_session_id}", response_model=schemas.Session)
+async def update_template_session(
     plan_id: int,
+    template_session_id: int,
+    session_in: schemas.SessionUpdate,
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
+    """Modifie, dans ce plan seulement, une séance héritée du modèle (identifiée par ``template_session_id``).
+
+    La séance est alors copiée dans le plan ; les appels suivants peuvent
+    utiliser indifféremment cette route ou celle de la séance copiée.
+    """
     plan = crud.get_plan(db, plan_id)
     if not plan or plan.owner_id != current_user.id:
         raise HTTPException(status_code=404, detail="Plan not found")
-    return crud.list_sessions(db, plan_id)
+    session = crud.materialize_template_session(db, plan, template_session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return crud.update_session(db, plan, session, session_in.dict(exclude_unset=True))
+
+
+@app.get("/plans/{plan_id}/adherence", response_model=schemas.PlanAdherence)
+async def plan_adherence(
+    plan_id: int,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Assiduité du plan, lue depuis les résumés hebdomadaires.
+
+    Le taux de réalisation et les séries de séances manquées ne portent que sur
+    les semaines terminées : une séance à venir n'est pas une séance manquée.
+    """
+    plan = crud.get_plan(db, plan_id)
+    if not plan or plan.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    weeks = crud.list_plan_adherence(db, plan.id)
+    finished = [week for week in weeks if week.week_start + timedelta(days=7) <= date.today()]
+    longest, current = adherence.combine_streaks(finished)
+    planned_done = sum(week.planned_sessions for week in finished)
+    return {
+        "plan_id": plan.id,
+        "planned_sessions": sum(week.planned_sessions for week in weeks),
+        "completed_sessions": sum(week.completed_sessions for week in weeks),
+        "completion_rate": (
+            round(sum(week.completed_sessions for week in finished) / planned_done, 3)
+            if planned_done
+            else None
+        ),
+        "planned_km": round(sum(week.planned_km for week in weeks), 1),
+        "actual_km": round(sum(week.actual_km for week in weeks), 2),
+        "longest_missed_streak": longest,
+        "current_missed_streak": current,
+        "weeks": weeks,
+    }
+
+
+@app.get("/plans/{plan_id}/sessions", response_model=list[schemas.Session])
+async def list_sessions(
+    plan_id: int,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    return _cached_plan_response(
+        db,
+        plan_id,
+        current_user.id,
+        "sessions",
+        lambda db, plan: [
+            schemas.Session.model_validate(session, from_attributes=True)
+            for session in crud.list_sessions(db, plan.id)
+        ],
+    )
+
+
+# ---------- Calendar ----------
+
+@app.get("/calendar", response_model=list[schemas.CalendarDay])
+async def calendar(
+    date_from: date = Query(..., alias="from"),
+    date_to: date = Query(..., alias="to"),
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Séances de tous les plans et activités Strava de l'utilisateur, regroupées par jour."""
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="La date de fin précède la date de début.")
+    if (date_to - date_from).days > 366:
+        raise HTTPException(status_code=400, detail="Période limitée à un an.")
+
+    days: dict[date, dict] = {}
+    for session in crud.list_user_sessions_between(db, current_user.id, date_from, date_to):
+        days.setdefault(session.date, {"date": session.date, "sessions": [], "activities": []})[
+            "sessions"
+        ].append(session)
+    for activity in crud.list_strava_activities_between(db, current_user.id, date_from, date_to):
+        day = date.fromisoformat(activity.start_date[:10])
+        days.setdefault(day, {"date": day, "sessions": [], "activities": []})["activities"].append(activity)
+    return [days[day] for day in sorted(days)]
+
+
+# ---------- Stats ----------
+
+@app.get("/stats/records", response_model=list[schemas.PersonalRecord])
+async def personal_records(
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Records personnels de l'utilisateur (1 km, 5 km, 10 km, semi, marathon)."""
+    return crud.list_personal_records(db, current_user.id)
+
+
+@app.get("/routes", response_model=list[schemas.Route])
+async def list_routes(
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Parcours courus au moins deux fois, du plus fréquent au moins fréquent."""
+    return crud.list_routes(db, current_user.id)
+
+
+@app.get("/routes/{route_id}", response_model=schemas.RouteTrend)
+async def route_trend(
+    route_id: int,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Activités d'un parcours par ordre chronologique, pour suivre la progression."""
+    route = crud.get_route(db, current_user.id, route_id)
+    if route is None:
+        raise HTTPException(status_code=404, detail="Parcours introuvable")
+    return {"route": route, "activities": crud.list_route_activities(db, route)}
+
+
+@app.get("/heatmap/{z}/{x}/{y}.png")
+async def heatmap_tile(
+    z: int,
+    x: int,
+    y: int,
+    current_user: models.User = Depends(get_current_user),
+):
+    """Tuile de la heatmap personnelle (schéma XYZ Web Mercator), mise à jour à chaque synchronisation."""
+    if not heatmap.MIN_ZOOM <= z <= heatmap.MAX_ZOOM or not (0 <= x < 2**z and 0 <= y < 2**z):
+        raise HTTPException(status_code=404, detail="Tuile hors de la grille")
+    png = await asyncio.to_thread(heatmap.tile_png, current_user, z, x, y)
+    return Response(png, media_type="image/png", headers={"Cache-Control": "private, max-age=300"})
+
+
+# ---------- Search ----------
+
+@app.get("/search", response_model=schemas.SearchResults)
+async def search(
+    q: str = Query(..., min_length=2, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Plans et séances de l'utilisateur correspondant à *q*, classés par pertinence."""
+    plans, sessions = crud.search(db, current_user.id, q, limit)
+    return schemas.SearchResults(
+        plans=[
+            schemas.PlanSearchHit(id=plan.id, name=plan.name, goal=plan.goal, rank=rank)
+            for plan, rank in plans
+        ],
+        sessions=[
+            schemas.SessionSearchHit(
+                **schemas.Session.model_validate(session, from_attributes=True).dict(), rank=rank
+            )
+            for session, rank in sessions
+        ],
+    )
+
+
+# ---------- Export ----------
+
+@app.get("/export")
+async def export_data(
+    format: str = "ndjson",
+    gzip: bool = False,
+    current_user: models.User = Depends(rate_limited("export", "5/3600")),
+):
+    """Exporte en flux les plans, séances et activités Strava de l'utilisateur."""
+    if format not in export.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Format d'export inconnu (ndjson ou csv).")
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"export.{format}"
+    if gzip:
+        media_type = "application/gzip"
+        filename += ".gz"
+    return StreamingResponse(
+        export.stream_export(current_user.id, format, compress=gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 
 # ---------- Strava ----------
@@ -235,69 +769,188 @@ async def strava_callback(code: str, state: str | None = None, db: Session = Dep
     return RedirectResponse("http://localhost:3000/dashboard")
 
 
-@app.post("/strava/sync", response_model=schemas.StravaSyncResult)
-async def strava_sync(
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-):
-    """Synchronise les dernières activités Strava pour l'utilisateur courant."""
-    token = (
-        db.query(models.StravaToken)
-        .filter(models.StravaToken.user_id == current_user.id)
-        .first()
-    )
+def get_strava_token(db: Session, user_id: int) -> models.StravaToken:
+    token = db.query(models.StravaToken).filter(models.StravaToken.user_id == user_id).first()
     if not token:
         raise HTTPException(status_code=400, detail="Compte Strava non lié.")
+    return token
 
-    # 1. Rafraîchir le token si nécessaire
+
+def get_strava_access_token(db: Session, token: models.StravaToken) -> str:
+    """Retourne un access token valide, en le rafraîchissant (une seule fois par utilisateur) si nécessaire."""
     try:
-        new_token_data = strava_utils.refresh_access_token_if_needed(token)
-        # Si le token a été rafraîchi, les nouvelles données sont dans `new_token_data`
-        if new_token_data["access_token"] != token.access_token:
-            crud.upsert_strava_token(
-                db,
-                user_id=current_user.id,
-                access_token=new_token_data["access_token"],
-                refresh_token=new_token_data["refresh_token"],
-                expires_at=new_token_data["expires_at"],
-            )
-            access_token = new_token_data["access_token"]
-        else:
-            access_token = token.access_token
+        return strava_tokens.get_access_token(db, token)
     except httpx.HTTPStatusError as e:
         raise HTTPException(
             status_code=400, detail=f"Erreur de rafraîchissement du token Strava: {e.response.text}"
         )
 
-    # 2. Récupérer les activités
+
+@app.post("/strava/sync", response_model=schemas.StravaSyncResult)
+async def sync_strava_activities(
+    background_tasks: BackgroundTasks,
+    current_user: models.User = Depends(rate_limited("strava_sync", "10/3600")),
+    db: Session = Depends(get_db),
+):
+    """Synchronise immédiatement les nouvelles activités Strava de l'utilisateur courant.
+
+    Le worker ``app.sync_worker`` maintient déjà tous les comptes à jour ; cet
+    endpoint sert à forcer une synchronisation.
+    """
+    token = get_strava_token(db, current_user.id)
     try:
-        activities = strava_utils.fetch_activities(access_token, per_page=30)
+        stats = await asyncio.to_thread(strava_sync.sync_user, db, token)
+    except strava_sync.SyncInProgress:
+        raise HTTPException(status_code=409, detail="Synchronisation Strava déjà en cours.")
     except httpx.HTTPStatusError as e:
         raise HTTPException(
-            status_code=400, detail=f"Erreur de récupération des activités Strava: {e.response.text}"
+            status_code=400, detail=f"Erreur de synchronisation Strava: {e.response.text}"
+        )
+    background_tasks.add_task(strava_sync.enrich_user, current_user.id)
+    return stats
+
+
+@app.get("/strava/sync/status", response_model=schemas.StravaSyncStatus)
+async def strava_sync_status(
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    status = crud.get_strava_sync_status(db, current_user.id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Aucune synchronisation Strava.")
+    return status
+
+
+@app.post("/strava/import", response_model=schemas.StravaImportStatus, status_code=202)
+async def strava_import(
+    archive: UploadFile,
+    background_tasks: BackgroundTasks,
+    current_user: models.User = Depends(rate_limited("strava_import", "3/3600")),
+):
+    """Importe une archive Strava (zip) en tâche de fond, sans appel à l'API Strava."""
+    # L'upload est fermé à la fin de la requête : on le recopie pour la tâche de fond
+    with tempfile.NamedTemporaryFile(suffix=".zip", delete=False) as tmp:
+        await asyncio.to_thread(shutil.copyfileobj, archive.file, tmp)
+    job = await asyncio.to_thread(strava_archive.create_job, current_user.id)
+    background_tasks.add_task(strava_archive.run_import, job.job_id, current_user.id, tmp.name)
+    return job
+
+
+@app.get("/strava/import/{job_id}", response_model=schemas.StravaImportStatus)
+async def strava_import_status(
+    job_id: str,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Progression d'un import d'archive Strava."""
+    job = crud.get_strava_import_job(db, job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import introuvable")
+    return job
+
+
+# Un seul appel Strava par activité, même si plusieurs requêtes arrivent en même temps
+activity_detail_fetches = SingleFlight()
+
+
+def _fetch_activity_detail(activity_id: int, user_id: int, access_token: str) -> None:
+    with SessionLocal() as db:
+        activity = db.get(models.StravaActivity, (activity_id, user_id))
+        if activity is not None and activity.detail_fetched_at is None:
+            activity_details.fetch_detail(db, activity, access_token)
+
+
+@app.get("/strava/activities/{strava_id}/detail", response_model=schemas.StravaActivityDetail)
+async def strava_activity_detail(
+    strava_id: int,
+    current_user: models.User = Depends(rate_limited("strava_detail", "60/60")),
+    db: Session = Depends(get_db),
+):
+    """Détail d'une activité (tours, splits, dénivelé, cardio).
+
+    Récupéré auprès de Strava au premier appel, puis servi depuis la base.
+    """
+    activity = crud.get_strava_activity(db, current_user.id, strava_id)
+    if not activity:
+        raise HTTPException(status_code=404, detail="Activité introuvable")
+
+    if activity.detail_fetched_at is None:
+        # Rafraîchissement sous verrou (SELECT ... FOR UPDATE) : hors de la boucle d'événements
+        access_token = await asyncio.to_thread(
+            get_strava_access_token, db, get_strava_token(db, current_user.id)
         )
+        try:
+            await activity_detail_fetches.do(
+                activity.id,
+                lambda: asyncio.to_thread(_fetch_activity_detail, activity.id, activity.user_id, access_token),
+            )
+        except httpx.HTTPStatusError as e:
+            raise HTTPException(
+                status_code=400, detail=f"Erreur de récupération du détail Strava: {e.response.text}"
+            )
+        db.refresh(activity)
+    return activity
+
+
+# Un seul appel Strava par activité, même si plusieurs requêtes arrivent en même temps
+activity_stream_fetches = SingleFlight()
+
 
-    if not activities:
-        return {"imported": 0, "updated": 0, "skipped": 0}
-
-    # 3. Enregistrer les activités en base
-    stats = {"imported": 0, "updated": 0, "skipped": 0}
-    for activity in activities:
-        activity_data = schemas.StravaActivityCreate(
-            strava_id=activity["id"],
-            name=activity.get("name"),
-            type=activity.get("type"),
-            start_date=activity.get("start_date_local"),
-            distance=activity.get("distance"),
-            moving_time=activity.get("moving_time"),
+def _fetch_activity_stream(activity_id: int, user_id: int, access_token: str) -> None:
+    with SessionLocal() as db:
+        activity = db.get(models.StravaActivity, (activity_id, user_id))
+        if activity is None or activity.stream is not None:
+            return
+        payload = strava_utils.fetch_activity_streams(
+            access_token, activity.strava_id, streams.STREAM_KEYS, subject=user_id
         )
-        _, created = crud.upsert_strava_activity(
-            db, user_id=current_user.id, activity_data=activity_data
+        stream = crud.save_activity_stream(db, activity, streams.encode_strava_streams(payload))
+        if stream is not None:
+            best_efforts.record_activity(db, activity, stream)
+
+
+@app.get("/strava/activities/{strava_id}/streams", response_model=schemas.ActivityStreams)
+async def strava_activity_streams(
+    strava_id: int,
+    points: int = Query(500, ge=3, le=5000),
+    by: str | None = None,
+    current_user: models.User = Depends(rate_limited("strava_streams", "60/60")),
+    db: Session = Depends(get_db),
+):
+    """Séries temporelles d'une activité, sous-échantillonnées pour l'affichage.
+
+    Les séries sont récupérées auprès de Strava au premier appel puis servies depuis la base.
+    """
+    activity = crud.get_strava_activity(db, current_user.id, strava_id)
+    if not activity:
+        raise HTTPException(status_code=404, detail="Activité introuvable")
+
+    if activity.stream is None:
+        # Rafraîchissement sous verrou (SELECT ... FOR UPDATE) : hors de la boucle d'événements
+        access_token = await asyncio.to_thread(
+            get_strava_access_token, db, get_strava_token(db, current_user.id)
         )
-        if created:
-            stats["imported"] += 1
-        else:
-            stats["updated"] += 1
+        try:
+            await activity_stream_fetches.do(
+                activity.id,
+                lambda: asyncio.to_thread(_fetch_activity_stream, activity.id, activity.user_id, access_token),
+            )
+        except httpx.HTTPStatusError as e:
+            raise HTTPException(
+                status_code=400, detail=f"Erreur de récupération des séries Strava: {e.response.text}"
+            )
+        db.refresh(activity, ["stream"])
+    stream = activity.stream
+
+    # Décodage et LTTB (numpy) hors de la boucle d'événements
+    data = await asyncio.to_thread(streams.downsample, stream, points, by=by)
+    return {
+        "strava_id": strava_id,
+        "original_points": stream.point_count,
+        "points": len(next(iter(data.values()), [])),
+        "streams": data,
+    }
 
-    return stats
 
+# Durée de l'import de ce module, dépendances comprises
+_IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
@@ -0,0 +1,42 @@
+"""Compteurs applicatifs, exposés au format texte Prometheus sur ``/metrics``.
+
+Les valeurs sont propres à chaque processus : avec plusieurs workers gunicorn,
+chaque scrape ne voit que le worker qui a répondu.
+"""
+from __future__ import annotations
+
+import threading
+from collections import defaultdict
+
+_counters: dict[str, dict[tuple[tuple[str, str], ...], float]] = defaultdict(lambda: defaultdict(float))
+_descriptions: dict[str, str] = {}
+_lock = threading.Lock()
+
+
+def describe(name: str, description: str) -> None:
+    _descriptions[name] = description
+
+
+def inc(name: str, value: float = 1.0, **labels: str) -> None:
+    key = tuple(sorted((label, str(label_value)) for label, label_value in labels.items()))
+    with _lock:
+        _counters[name][key] += value
+
+
+def get(name: str, **labels: str) -> float:
+    key = tuple(sorted((label, str(label_value)) for label, label_value in labels.items()))
+    with _lock:
+        return _counters[name].get(key, 0.0)
+
+
+def render() -> str:
+    lines: list[str] = []
+    with _lock:
+        for name in sorted(_counters):
+            if name in _descriptions:
+                lines.append(f"# HELP {name} {_descriptions[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in sorted(_counters[name].items()):
+                label_text = ",".join(f'{label}="{label_value}"' for label, label_value in labels)
+                lines.append(f"{name}{{{label_text}}} {value:g}" if label_text else f"{name} {value:g}")
+    return "\n".join(lines) + "\n"
@@ -8,19 +8,33 @@ from sqlalchemy import (
     BigInteger,
     Boolean,
     Column,
+    Computed,
     Date,
     DateTime,
     Enum as PgEnum,
     Float,
     ForeignKey,
+    ForeignKeyConstraint,
+    Index,
     Integer,
+    LargeBinary,
     String,
     Text,
+    UniqueConstraint,
+    event,
+    text,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 
 from .database import Base
 
+# Configuration de recherche plein texte (racinisation et mots vides français)
+SEARCH_CONFIG = "french"
+
+# Partitions de hachage de ``strava_activities`` (par ``user_id``)
+STRAVA_ACTIVITY_PARTITIONS = 16
+
 
 class SessionType(str, enum.Enum):
     cardio = "cardio"
@@ -37,28 +51,150 @@ class User(Base):
     name: str | None = Column(String(255))
     password_hash: str = Column(String(128), nullable=False)
     created_at: datetime = Column(DateTime, default=datetime.utcnow)
+    # Version du cache de tuiles de heatmap ; incrémentée pour forcer une reconstruction complète
+    heatmap_version: int = Column(Integer, nullable=False, default=0, server_default="0")
 
-    plans = relationship("TrainingPlan", back_populates="owner", cascade="all, delete-orphan")
+    plans = relationship(
+        "TrainingPlan", back_populates="owner", cascade="all, delete-orphan", passive_deletes=True
+    )
 
     strava_token = relationship("StravaToken", back_populates="user", uselist=False)
 
 
 class TrainingPlan(Base):
     __tablename__ = "training_plans"
+    __table_args__ = (
+        Index(
+            "ix_training_plans_archived_at",
+            "archived_at",
+            postgresql_where=text("archived_at IS NOT NULL"),
+        ),
+        Index("ix_training_plans_search_vector", "search_vector", postgresql_using="gin"),
+    )
 
     id: int = Column(Integer, primary_key=True, index=True)
     name: str = Column(String(255), nullable=False)
     goal: str | None = Column(Text)
     created_at: datetime = Column(DateTime, default=datetime.utcnow)
+    # Plan supprimé par l'utilisateur, en attente de purge définitive
+    archived_at: datetime | None = Column(DateTime)
+    # Incrémentée à chaque écriture : clé du cache des réponses, commune à tous les workers
+    cache_version: int = Column(Integer, nullable=False, default=0, server_default="0")
+    # Colonne générée par la base ; différée pour ne pas la charger avec le plan
+    search_vector = deferred(
+        Column(
+            TSVECTOR,
+            Computed(
+                f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(name, '')), 'A') || "
+                f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(goal, '')), 'B')",
+                persisted=True,
+            ),
+        )
+    )
 
-    owner_id: int = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    owner_id: int = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     owner = relationship("User", back_populates="plans")
 
+    # Plan instancié depuis un modèle : ses séances sont celles du modèle, décalées
+    # depuis start_date ; seules les séances modifiées ou réalisées ont une ligne dans sessions.
+    # Si le modèle est supprimé (avec son auteur), ses séances sont d'abord copiées
+    # dans le plan (cf. PLAN_TEMPLATE_TRIGGER_DDL)
+    template_id: int | None = Column(
+        Integer, ForeignKey("plan_templates.id", ondelete="SET NULL"), index=True
+    )
+    start_date: date | None = Column(Date)
+    template = relationship("PlanTemplate")
+
+    # passive_deletes : la suppression des séances est laissée au ON DELETE CASCADE de la base
+    sessions = relationship(
+        "Session",
+        back_populates="plan",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        order_by="Session.date",
+    )
+
+
+class PlanTemplate(Base):
+    """Plan partagé entre plusieurs athlètes, instancié par ``TrainingPlan.template_id``.
+
+    Un modèle n'est plus modifié après sa création : les plans qui le
+    référencent lisent ses séances à chaque affichage.
+    """
+
+    __tablename__ = "plan_templates"
+
+    id: int = Column(Integer, primary_key=True, index=True)
+    name: str = Column(String(255), nullable=False)
+    goal: str | None = Column(Text)
+    # Un modèle public peut être instancié par tous les utilisateurs, sinon par son auteur seulement
+    public: bool = Column(Boolean, nullable=False, default=False, server_default="false")
+    created_at: datetime = Column(DateTime, default=datetime.utcnow)
+
+    owner_id: int = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+
     sessions = relationship(
-        "Session", back_populates="plan", cascade="all, delete-orphan", order_by="Session.date"
+        "TemplateSession",
+        back_populates="template",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        order_by="TemplateSession.day_offset",
     )
 
 
+# Avant la suppression d'un modèle, les plans qui l'instancient reçoivent une
+# copie des séances qu'ils héritaient encore ; template_id passe ensuite à
+# NULL (ON DELETE SET NULL). Les plans dont l'auteur est lui-même en cours de
+# suppression sont ignorés.
+PLAN_TEMPLATE_TRIGGER_DDL = (
+    """
+    CREATE FUNCTION plan_templates_detach_plans() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO sessions (plan_id, template_session_id, date, type, exercise, completed)
+        SELECT plan.id, template_session.id, plan.start_date + template_session.day_offset,
+               template_session.type, template_session.exercise, false
+        FROM training_plans AS plan
+        JOIN template_sessions AS template_session ON template_session.template_id = plan.template_id
+        WHERE plan.template_id = OLD.id
+            AND EXISTS (SELECT 1 FROM users WHERE id = plan.owner_id)
+        ON CONFLICT (plan_id, template_session_id) DO NOTHING;
+        UPDATE training_plans SET cache_version = cache_version + 1 WHERE template_id = OLD.id;
+        RETURN OLD;
+    END $$
+    """,
+    """
+    CREATE TRIGGER plan_templates_detach_plans BEFORE DELETE ON plan_templates
+    FOR EACH ROW EXECUTE FUNCTION plan_templates_detach_plans()
+    """,
+)
+
+
+@event.listens_for(PlanTemplate.__table__, "after_create")
+def _create_plan_template_trigger(target, connection, **kw) -> None:
+    """Crée le trigger de détachement lorsque la table est créée hors migrations (``create_all``)."""
+    for statement in PLAN_TEMPLATE_TRIGGER_DDL:
+        connection.execute(text(statement))
+
+
+class TemplateSession(Base):
+    __tablename__ = "template_sessions"
+    __table_args__ = (
+        Index("ix_template_sessions_template_id_day_offset", "template_id", "day_offset"),
+        Index("ix_template_sessions_search_vector", "search_vector", postgresql_using="gin"),
+    )
+
+    id: int = Column(Integer, primary_key=True, index=True)
+    day_offset: int = Column(Integer, nullable=False)  # jours depuis le début du plan
+    type: SessionType = Column(PgEnum(SessionType), nullable=False, default=SessionType.running)
+    exercise: str = Column(String(255), nullable=False)
+    search_vector = deferred(
+        Column(TSVECTOR, Computed(f"to_tsvector('{SEARCH_CONFIG}', exercise)", persisted=True))
+    )
+
+    template_id: int = Column(Integer, ForeignKey("plan_templates.id", ondelete="CASCADE"), nullable=False)
+    template = relationship("PlanTemplate", back_populates="sessions")
+
+
 class StravaToken(Base):
     __tablename__ = "strava_tokens"
 
@@ -72,11 +208,23 @@ class StravaToken(Base):
 
 
 class StravaActivity(Base):
+    """Activité Strava importée.
+
+    La table est partitionnée par hachage de ``user_id`` : les clés primaire et
+    uniques incluent donc ``user_id``, et les requêtes doivent le filtrer pour
+    ne lire qu'une partition.
+    """
+
     __tablename__ = "strava_activities"
+    __table_args__ = (
+        UniqueConstraint("user_id", "strava_id", name="uq_strava_activities_user_id_strava_id"),
+        Index("ix_strava_activities_user_id_start_date", "user_id", "start_date"),
+        {"postgresql_partition_by": "HASH (user_id)"},
+    )
 
-    id: int = Column(Integer, primary_key=True, index=True)
-    strava_id: int = Column(BigInteger, unique=True, nullable=False, index=True)
-    user_id: int = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    id: int = Column(Integer, primary_key=True, autoincrement=True)
+    user_id: int = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    strava_id: int = Column(BigInteger, nullable=False)
 
     name: str | None = Column(String(255))
     type: str | None = Column(String(50))
@@ -85,12 +233,282 @@ class StravaActivity(Base):
         Float
     )  # mètres
     moving_time: int | None = Column(Integer)  # secondes
+    summary_polyline: str | None = Column(Text)  # tracé simplifié, format « encoded polyline »
+    route_id: int | None = Column(
+        Integer, ForeignKey("route_clusters.id", ondelete="SET NULL"), index=True
+    )
+    # Version de heatmap de l'utilisateur dans laquelle le tracé a été rastérisé
+    heatmap_version: int | None = Column(Integer)
+
+    # Détail de l'activité, renseigné au premier affichage ou par le préchargement
+    elapsed_time: int | None = Column(Integer)  # secondes
+    total_elevation_gain: float | None = Column(Float)  # mètres
+    elev_high: float | None = Column(Float)
+    elev_low: float | None = Column(Float)
+    average_speed: float | None = Column(Float)  # m/s
+    max_speed: float | None = Column(Float)
+    average_heartrate: float | None = Column(Float)
+    max_heartrate: float | None = Column(Float)
+    calories: float | None = Column(Float)
+    detail_fetched_at: datetime | None = Column(DateTime)
 
     user = relationship("User")
+    route = relationship("RouteCluster", back_populates="activities", foreign_keys=[route_id])
+    stream = relationship("ActivityStream", back_populates="activity", uselist=False, passive_deletes=True)
+    laps = relationship(
+        "ActivityLap", back_populates="activity", passive_deletes=True, order_by="ActivityLap.lap_index"
+    )
+    splits = relationship(
+        "ActivitySplit", back_populates="activity", passive_deletes=True, order_by="ActivitySplit.split"
+    )
+
+
+@event.listens_for(StravaActivity.__table__, "after_create")
+def _create_activity_partitions(target, connection, **kw) -> None:
+    """Crée les partitions lorsque la table est créée hors migrations (``create_all``)."""
+    for remainder in range(STRAVA_ACTIVITY_PARTITIONS):
+        connection.execute(
+            text(
+                f"CREATE TABLE {target.name}_p{remainder:02d} PARTITION OF {target.name} "
+                f"FOR VALUES WITH (MODULUS {STRAVA_ACTIVITY_PARTITIONS}, REMAINDER {remainder})"
+            )
+        )
+
+
+def _activity_fk(table: str) -> ForeignKeyConstraint:
+    """Clé étrangère composite vers ``strava_activities`` (sa clé primaire inclut ``user_id``)."""
+    return ForeignKeyConstraint(
+        ["activity_id", "user_id"],
+        ["strava_activities.id", "strava_activities.user_id"],
+        name=f"{table}_activity_id_user_id_fkey",
+        ondelete="CASCADE",
+    )
+
+
+class ActivityLap(Base):
+    __tablename__ = "activity_laps"
+    __table_args__ = (UniqueConstraint("activity_id", "lap_index"), _activity_fk("activity_laps"))
+
+    id: int = Column(Integer, primary_key=True, index=True)
+    activity_id: int = Column(Integer, nullable=False)
+    user_id: int = Column(Integer, nullable=False)
+    lap_index: int = Column(Integer, nullable=False)
+    name: str | None = Column(String(255))
+    start_date: str | None = Column(String(50))  # ISO date string
+    elapsed_time: int | None = Column(Integer)
+    moving_time: int | None = Column(Integer)
+    distance: float | None = Column(Float)
+    total_elevation_gain: float | None = Column(Float)
+    average_speed: float | None = Column(Float)
+    max_speed: float | None = Column(Float)
+    average_heartrate: float | None = Column(Float)
+    max_heartrate: float | None = Column(Float)
+
+    activity = relationship("StravaActivity", back_populates="laps")
+
+
+class ActivitySplit(Base):
+    """Découpage kilométrique (``splits_metric`` de Strava)."""
+
+    __tablename__ = "activity_splits"
+    __table_args__ = (UniqueConstraint("activity_id", "split"), _activity_fk("activity_splits"))
+
+    id: int = Column(Integer, primary_key=True, index=True)
+    activity_id: int = Column(Integer, nullable=False)
+    user_id: int = Column(Integer, nullable=False)
+    split: int = Column(Integer, nullable=False)
+    distance: float | None = Column(Float)
+    elapsed_time: int | None = Column(Integer)
+    moving_time: int | None = Column(Integer)
+    elevation_difference: float | None = Column(Float)
+    average_speed: float | None = Column(Float)
+    average_heartrate: float | None = Column(Float)
+    pace_zone: int | None = Column(Integer)
+
+    activity = relationship("StravaActivity", back_populates="splits")
+
+
+class ActivityBestEffort(Base):
+    """Segment le plus rapide d'une activité pour une distance de référence."""
+
+    __tablename__ = "activity_best_efforts"
+    __table_args__ = (
+        UniqueConstraint("activity_id", "distance_name"),
+        _activity_fk("activity_best_efforts"),
+        # Recalcul d'un record après suppression de l'activité qui le détenait
+        Index(
+            "ix_activity_best_efforts_user_id_distance_name_elapsed_time",
+            "user_id",
+            "distance_name",
+            "elapsed_time",
+        ),
+    )
+
+    id: int = Column(Integer, primary_key=True, index=True)
+    activity_id: int = Column(Integer, nullable=False)
+    user_id: int = Column(Integer, nullable=False)
+    distance_name: str = Column(String(20), nullable=False)  # 1k, 5k, 10k, semi, marathon
+    distance: float = Column(Float, nullable=False)  # mètres
+    elapsed_time: float = Column(Float, nullable=False)  # secondes
+    start_offset: int = Column(Integer, nullable=False)  # secondes depuis le début de l'activité
+
+
+class PersonalRecord(Base):
+    """Meilleur effort de l'utilisateur par distance, tenu à jour à chaque nouvelle activité.
+
+    Recalculé par trigger quand l'activité qui le détient est supprimée.
+    """
+
+    __tablename__ = "personal_records"
+    __table_args__ = (_activity_fk("personal_records"),)
+
+    user_id: int = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    distance_name: str = Column(String(20), primary_key=True)
+    distance: float = Column(Float, nullable=False)
+    elapsed_time: float = Column(Float, nullable=False)
+    activity_id: int = Column(Integer, nullable=False)
+    # Copiés depuis l'activité pour servir les records sans jointure
+    strava_id: int = Column(BigInteger, nullable=False)
+    achieved_at: str | None = Column(String(50))  # ISO date string
+
+
+# Les records suivent la suppression de leur activité (ON DELETE CASCADE). Le
+# trigger remplace alors le record supprimé par le meilleur effort restant sur
+# cette distance, sauf si c'est l'utilisateur lui-même qui est supprimé.
+PERSONAL_RECORD_TRIGGER_DDL = (
+    """
+    CREATE FUNCTION personal_records_recompute() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF EXISTS (SELECT 1 FROM users WHERE id = OLD.user_id) THEN
+            INSERT INTO personal_records
+                (user_id, distance_name, distance, elapsed_time, activity_id, strava_id, achieved_at)
+            SELECT effort.user_id, effort.distance_name, effort.distance, effort.elapsed_time,
+                   effort.activity_id, activity.strava_id, activity.start_date
+            FROM activity_best_efforts AS effort
+            JOIN strava_activities AS activity
+                ON activity.id = effort.activity_id AND activity.user_id = effort.user_id
+            WHERE effort.user_id = OLD.user_id
+                AND effort.distance_name = OLD.distance_name
+                AND effort.activity_id <> OLD.activity_id
+            ORDER BY effort.elapsed_time, effort.activity_id
+            LIMIT 1
+            ON CONFLICT (user_id, distance_name) DO NOTHING;
+        END IF;
+        RETURN NULL;
+    END $$
+    """,
+    """
+    CREATE TRIGGER personal_records_recompute AFTER DELETE ON personal_records
+    FOR EACH ROW EXECUTE FUNCTION personal_records_recompute()
+    """,
+)
+
+
+@event.listens_for(PersonalRecord.__table__, "after_create")
+def _create_personal_record_trigger(target, connection, **kw) -> None:
+    """Crée le trigger de recalcul lorsque la table est créée hors migrations (``create_all``)."""
+    for statement in PERSONAL_RECORD_TRIGGER_DDL:
+        connection.execute(text(statement))
+
+
+class RouteCluster(Base):
+    """Parcours récurrent d'un utilisateur : ensemble d'activités au tracé similaire.
+
+    ``path`` est le tracé de référence rééchantillonné (encoded polyline) ;
+    ``endpoints`` concatène les cellules geohash du départ et de l'arrivée.
+    """
+
+    __tablename__ = "route_clusters"
+    __table_args__ = (Index("ix_route_clusters_user_id_endpoints", "user_id", "endpoints"),)
+
+    id: int = Column(Integer, primary_key=True, index=True)
+    user_id: int = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    endpoints: str = Column(String(16), nullable=False)
+    path: str = Column(Text, nullable=False)
+    cell_count: int = Column(Integer, nullable=False)
+    distance: float | None = Column(Float)  # mètres, activité de référence
+    activity_count: int = Column(Integer, nullable=False, default=1)
+    created_at: datetime = Column(DateTime, default=datetime.utcnow)
+
+    activities = relationship("StravaActivity", back_populates="route", foreign_keys="StravaActivity.route_id")
+
+
+class RouteCell(Base):
+    """Index inversé : cellule geohash traversée -> parcours."""
+
+    __tablename__ = "route_cells"
+
+    user_id: int = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    cell: str = Column(String(12), primary_key=True)
+    route_id: int = Column(Integer, ForeignKey("route_clusters.id", ondelete="CASCADE"), primary_key=True)
+
+
+class StravaSyncStatus(Base):
+    """État de la dernière synchronisation Strava d'un utilisateur.
+
+    ``checkpoint`` est le timestamp Unix (UTC) de la plus récente activité
+    enregistrée : la synchronisation suivante, ou la reprise après un crash,
+    repart de là.
+    """
+
+    __tablename__ = "strava_sync_status"
+
+    user_id: int = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    status: str = Column(String(20), nullable=False)  # running, succeeded, failed
+    checkpoint: int | None = Column(BigInteger)
+    started_at: datetime | None = Column(DateTime)
+    finished_at: datetime | None = Column(DateTime)
+    last_success_at: datetime | None = Column(DateTime, index=True)
+    duration_seconds: float | None = Column(Float)
+    imported: int = Column(Integer, nullable=False, default=0)
+    updated: int = Column(Integer, nullable=False, default=0)
+    error: str | None = Column(Text)
+
+
+class StravaImportJob(Base):
+    """Progression d'un import d'archive Strava, lisible depuis n'importe quel worker."""
+
+    __tablename__ = "strava_import_jobs"
+
+    job_id: str = Column(String(32), primary_key=True)
+    user_id: int = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    status: str = Column(String(20), nullable=False)  # pending, running, done, failed
+    total: int = Column(Integer, nullable=False, default=0)
+    processed: int = Column(Integer, nullable=False, default=0)
+    imported: int = Column(Integer, nullable=False, default=0)
+    skipped: int = Column(Integer, nullable=False, default=0)
+    error: str | None = Column(Text)
+    created_at: datetime = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at: datetime = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
+class ActivityStream(Base):
+    """Séries temporelles d'une activité, stockées en tableaux binaires compressés."""
+
+    __tablename__ = "activity_streams"
+    __table_args__ = (_activity_fk("activity_streams"),)
+
+    id: int = Column(Integer, primary_key=True, index=True)
+    activity_id: int = Column(Integer, nullable=False, unique=True)
+    user_id: int = Column(Integer, nullable=False)
+    point_count: int = Column(Integer, nullable=False)
+    time: bytes | None = Column(LargeBinary)  # secondes, deltas uint32 compressés
+    distance: bytes | None = Column(LargeBinary)  # mètres, float32
+    heartrate: bytes | None = Column(LargeBinary)  # bpm, uint16
+    altitude: bytes | None = Column(LargeBinary)  # mètres, float32
+    latlng: bytes | None = Column(LargeBinary)  # (lat, lng) float32
+    fetched_at: datetime = Column(DateTime, default=datetime.utcnow)
+
+    activity = relationship("StravaActivity", back_populates="stream")
 
 
 class Session(Base):
     __tablename__ = "sessions"
+    __table_args__ = (
+        Index("ix_sessions_plan_id_date", "plan_id", "date"),
+        Index("ix_sessions_search_vector", "search_vector", postgresql_using="gin"),
+        UniqueConstraint("plan_id", "template_session_id", name="sessions_plan_id_template_session_id_key"),
+    )
 
     id: int = Column(Integer, primary_key=True, index=True)
     date: date = Column(Date, nullable=False)
@@ -98,6 +516,102 @@ class Session(Base):
     exercise: str = Column(String(255), nullable=False)
     strava_activity_id: str | None = Column(String(64))
     completed: bool = Column(Boolean, default=False)
+    search_vector = deferred(
+        Column(TSVECTOR, Computed(f"to_tsvector('{SEARCH_CONFIG}', exercise)", persisted=True))
+    )
 
     plan_id: int = Column(Integer, ForeignKey("training_plans.id", ondelete="CASCADE"), nullable=False)
     plan = relationship("TrainingPlan", back_populates="sessions")
+    # Séance du modèle que cette ligne remplace (copie à l'écriture)
+    template_session_id: int | None = Column(
+        Integer, ForeignKey("template_sessions.id", ondelete="SET NULL")
+    )
+
+
+class PlanWeekAdherence(Base):
+    """Résumé de l'assiduité d'un plan pour une semaine (lundi ``week_start``).
+
+    Recalculé pour la seule semaine concernée quand une séance est ajoutée,
+    modifiée ou rattachée à une activité Strava. Les séances de repos sont
+    ignorées. Les trois colonnes ``*_missed`` décrivent les séries de séances
+    non réalisées (en début de semaine, en fin de semaine, la plus longue) et
+    se combinent d'une semaine à l'autre sans relire les séances.
+    """
+
+    __tablename__ = "plan_week_adherence"
+
+    plan_id: int = Column(Integer, ForeignKey("training_plans.id", ondelete="CASCADE"), primary_key=True)
+    week_start: date = Column(Date, primary_key=True)
+    planned_sessions: int = Column(Integer, nullable=False, default=0)
+    completed_sessions: int = Column(Integer, nullable=False, default=0)
+    planned_km: float = Column(Float, nullable=False, default=0.0)
+    actual_km: float = Column(Float, nullable=False, default=0.0)
+    leading_missed: int = Column(Integer, nullable=False, default=0)
+    trailing_missed: int = Column(Integer, nullable=False, default=0)
+    longest_missed: int = Column(Integer, nullable=False, default=0)
+    updated_at: datetime = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class IdempotencyKey(Base):
+    """Réponse mémorisée d'une requête portant un en-tête ``Idempotency-Key``.
+
+    ``status_code`` reste nul tant que la requête d'origine est en cours.
+    """
+
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint("user_id", "key"),)
+
+    id: int = Column(Integer, primary_key=True, index=True)
+    user_id: int = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    key: str = Column(String(255), nullable=False)
+    request_hash: str = Column(String(64), nullable=False)
+    status_code: int | None = Column(Integer)
+    response_body: str | None = Column(Text)
+    created_at: datetime = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class GeminiUsage(Base):
+    """Un appel au modèle Gemini : consommation de tokens, durée et issue.
+
+    Sert au suivi de coût et aux budgets journaliers de tokens.
+    """
+
+    __tablename__ = "gemini_usage"
+    __table_args__ = (Index("ix_gemini_usage_user_id_created_at", "user_id", "created_at"),)
+
+    id: int = Column(Integer, primary_key=True)
+    user_id: int = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    call: str = Column(String(20), nullable=False)  # plan
+    model: str = Column(String(100), nullable=False)
+    outcome: str = Column(String(20), nullable=False)  # ok, invalid, error, timeout
+    prompt_tokens: int = Column(Integer, nullable=False, default=0)
+    output_tokens: int = Column(Integer, nullable=False, default=0)
+    latency_ms: int = Column(Integer, nullable=False)
+    created_at: datetime = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+class HttpCacheEntry(Base):
+    """Réponse HTTP mise en cache (mode ``HTTP_CACHE_BACKEND=postgres``)."""
+
+    __tablename__ = "http_cache"
+
+    key: str = Column(String(64), primary_key=True)  # sha256(sujet + URL)
+    url: str = Column(Text, nullable=False)
+    status_code: int = Column(Integer, nullable=False)
+    content_type: str | None = Column(String(255))
+    etag: str | None = Column(String(255))
+    last_modified: str | None = Column(String(64))
+    body: bytes = Column(LargeBinary, nullable=False)
+    size: int = Column(Integer, nullable=False)
+    stored_at: float = Column(Float, nullable=False)  # timestamp Unix
+    accessed_at: float = Column(Float, nullable=False, index=True)
+
+
+class RateLimitBucket(Base):
+    """État partagé d'un seau à jetons (mode ``RATE_LIMIT_BACKEND=postgres``)."""
+
+    __tablename__ = "rate_limit_buckets"
+
+    key: str = Column(String(255), primary_key=True)
+    tokens: float = Column(Float, nullable=False)
+    updated_at: float = Column(Float, nullable=False)  # timestamp Unix
@@ -0,0 +1,46 @@
+"""Purge en tâche de fond des plans archivés.
+
+Un plan supprimé via l'API est seulement archivé (``archived_at``) : la
+réponse est immédiate quelle que soit sa taille. Cette boucle supprime ensuite
+les plans archivés depuis plus de ``PURGE_RETENTION_DAYS`` jours, par lots
+bornés pour ne jamais tenir de longue transaction.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+
+from . import crud
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+PURGE_RETENTION_DAYS = int(os.getenv("PURGE_RETENTION_DAYS", "30"))
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "100"))
+PURGE_INTERVAL = int(os.getenv("PURGE_INTERVAL", "3600"))
+
+
+def purge_archived_plans() -> int:
+    """Supprime, lot par lot, les plans dont la période de rétention est écoulée."""
+    cutoff = datetime.utcnow() - timedelta(days=PURGE_RETENTION_DAYS)
+    purged = 0
+    with SessionLocal() as db:
+        while True:
+            deleted = crud.purge_archived_plans(db, cutoff, PURGE_BATCH_SIZE)
+            purged += deleted
+            if deleted < PURGE_BATCH_SIZE:
+                return purged
+
+
+async def run_purger() -> None:
+    """Boucle de fond lancée par le worker de synchronisation (``app.sync_worker``)."""
+    while True:
+        try:
+            purged = await asyncio.to_thread(purge_archived_plans)
+            if purged:
+                logger.info("%s plan(s) archivé(s) purgé(s)", purged)
+        except Exception:  # noqa: BLE001
+            logger.exception("Échec de la purge des plans archivés")
+        await asyncio.sleep(PURGE_INTERVAL)
@@ -0,0 +1,84 @@
+"""Limitation de débit par seau à jetons (token bucket).
+
+Chaque clé (route + utilisateur) dispose d'un seau de ``capacity`` jetons qui se
+remplit au rythme de ``capacity / per_seconds`` jetons par seconde ; une requête
+consomme un jeton. L'état est gardé en mémoire par défaut ; avec
+``RATE_LIMIT_BACKEND=postgres`` il est partagé entre workers via la table
+``rate_limit_buckets``.
+
+Le backend mémoire ne convient qu'à un processus unique : avec N workers,
+chacun a ses propres seaux et une limite est en pratique N fois plus large.
+``gunicorn.conf.py`` choisit donc postgres par défaut dès qu'il lance
+plusieurs workers.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from . import metrics, models
+from .database import engine
+
+metrics.describe("rate_limit_requests_total", "Requêtes soumises à une limite de débit, par route et résultat.")
+
+
+def parse_limit(spec: str) -> tuple[int, float]:
+    """``"5/60"`` → 5 requêtes par fenêtre de 60 secondes."""
+    capacity, per_seconds = spec.split("/")
+    return int(capacity), float(per_seconds)
+
+
+class MemoryBackend:
+    def __init__(self) -> None:
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, capacity: int, rate: float, now: float) -> float:
+        """Consomme un jeton. Retourne 0 si la requête passe, sinon l'attente en secondes."""
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / rate
+
+
+class PostgresBackend:
+    def hit(self, key: str, capacity: int, rate: float, now: float) -> float:
+        table = models.RateLimitBucket.__table__
+        with engine.begin() as conn:
+            conn.execute(
+                pg_insert(table)
+                .values(key=key, tokens=capacity, updated_at=now)
+                .on_conflict_do_nothing(index_elements=["key"])
+            )
+            row = conn.execute(
+                select(table.c.tokens, table.c.updated_at).where(table.c.key == key).with_for_update()
+            ).one()
+            tokens = min(capacity, row.tokens + max(now - row.updated_at, 0) * rate)
+            allowed = tokens >= 1
+            conn.execute(
+                update(table)
+                .where(table.c.key == key)
+                .values(tokens=tokens - 1 if allowed else tokens, updated_at=now)
+            )
+        return 0.0 if allowed else (1 - tokens) / rate
+
+
+class RateLimiter:
+    def __init__(self, backend: MemoryBackend | PostgresBackend) -> None:
+        self.backend = backend
+
+    def hit(self, scope: str, subject: str | int, capacity: int, per_seconds: float) -> float:
+        retry_after = self.backend.hit(f"{scope}:{subject}", capacity, capacity / per_seconds, time.time())
+        metrics.inc("rate_limit_requests_total", scope=scope, result="limited" if retry_after else "allowed")
+        return retry_after
+
+
+limiter = RateLimiter(PostgresBackend() if os.getenv("RATE_LIMIT_BACKEND") == "postgres" else MemoryBackend())
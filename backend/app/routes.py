@@ -0,0 +1,215 @@
+"""Détection des parcours récurrents à partir des tracés résumés des activités.
+
+Chaque tracé est rééchantillonné puis réduit à l'ensemble des cellules
+geohash qu'il traverse, plus un seau « départ/arrivée ». Les parcours
+candidats, dont le départ et l'arrivée tombent dans la même cellule ou une
+cellule voisine, sont trouvés via l'index inversé ``route_cells`` (cellule ->
+parcours) et le taux de cellules communes ; seuls ces quelques candidats sont
+confirmés par une distance de Fréchet discrète sur des tracés de
+``RESAMPLE_POINTS`` points. Une nouvelle activité ne coûte donc jamais une
+comparaison géométrique avec tout l'historique.
+"""
+from __future__ import annotations
+
+import logging
+import math
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from . import crud, models
+
+logger = logging.getLogger(__name__)
+
+# Cellules d'environ 150 m x 150 m pour le tracé, 5 km x 5 km pour le départ/arrivée
+CELL_PRECISION = 7
+ENDPOINT_PRECISION = 5
+CELL_SPACING = 50.0  # mètres entre deux points du tracé densifié
+RESAMPLE_POINTS = 64
+MIN_OVERLAP = 0.6
+MAX_CANDIDATES = 5
+FRECHET_THRESHOLD = 150.0  # mètres
+
+_EARTH_RADIUS = 6371000.0
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+# ---------- Encodages ----------
+
+def decode_polyline(encoded: str) -> np.ndarray:
+    """Décode un « encoded polyline » Google en tableau (n, 2) de (lat, lng)."""
+    coords: list[tuple[float, float]] = []
+    index = lat = lng = 0
+    length = len(encoded)
+    while index < length:
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1F) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        coords.append((lat / 1e5, lng / 1e5))
+    return np.array(coords, dtype=np.float64).reshape(-1, 2)
+
+
+def encode_polyline(points: np.ndarray) -> str:
+    chunks = []
+    previous = (0, 0)
+    for lat, lng in points:
+        current = (round(lat * 1e5), round(lng * 1e5))
+        for value in (current[0] - previous[0], current[1] - previous[1]):
+            value = ~(value << 1) if value < 0 else value << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1F)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        previous = current
+    return "".join(chunks)
+
+
+def geohash(lat: float, lng: float, precision: int) -> str:
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = bit = 0
+    even = True
+    while len(chars) < precision:
+        interval, value = (lng_range, lng) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        if value >= middle:
+            bits = (bits << 1) | 1
+            interval[0] = middle
+        else:
+            bits <<= 1
+            interval[1] = middle
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(_BASE32[bits])
+            bits = bit = 0
+    return "".join(chars)
+
+
+# ---------- Géométrie ----------
+
+def _to_meters(points: np.ndarray, lat0: float) -> np.ndarray:
+    """Projection équirectangulaire locale, suffisante à l'échelle d'une sortie."""
+    rad = np.radians(points)
+    return np.column_stack(
+        (rad[:, 1] * math.cos(math.radians(lat0)) * _EARTH_RADIUS, rad[:, 0] * _EARTH_RADIUS)
+    )
+
+
+def _cumulative_length(points: np.ndarray) -> np.ndarray:
+    xy = _to_meters(points, float(points[:, 0].mean()))
+    steps = np.hypot(*np.diff(xy, axis=0).T)
+    return np.concatenate(([0.0], np.cumsum(steps)))
+
+
+def resample(points: np.ndarray, count: int) -> np.ndarray:
+    """*count* points régulièrement espacés le long du tracé."""
+    along = _cumulative_length(points)
+    targets = np.linspace(0.0, along[-1], count)
+    return np.column_stack(
+        (np.interp(targets, along, points[:, 0]), np.interp(targets, along, points[:, 1]))
+    )
+
+
+def cells(points: np.ndarray) -> set[str]:
+    """Cellules geohash traversées, le tracé étant densifié tous les ``CELL_SPACING`` mètres."""
+    length = _cumulative_length(points)[-1]
+    dense = resample(points, max(int(length / CELL_SPACING) + 1, 2))
+    return {geohash(lat, lng, CELL_PRECISION) for lat, lng in dense}
+
+
+def geohash_neighbourhood(lat: float, lng: float, precision: int) -> set[str]:
+    """Cellule du point et ses 8 voisines, obtenues en décalant le point d'une cellule."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    height, width = 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+    return {
+        geohash(
+            min(max(lat + dy * height, -90.0), 90.0 - 1e-9),
+            (lng + dx * width + 180.0) % 360.0 - 180.0,
+            precision,
+        )
+        for dy in (-1, 0, 1)
+        for dx in (-1, 0, 1)
+    }
+
+
+def endpoints(points: np.ndarray) -> str:
+    return geohash(*points[0], ENDPOINT_PRECISION) + geohash(*points[-1], ENDPOINT_PRECISION)
+
+
+def endpoint_buckets(points: np.ndarray) -> list[str]:
+    """Seaux départ/arrivée compatibles : un départ ou une arrivée proche d'un bord
+    de cellule peut tomber dans la cellule voisine d'un passage à l'autre."""
+    starts = geohash_neighbourhood(*points[0], ENDPOINT_PRECISION)
+    ends = geohash_neighbourhood(*points[-1], ENDPOINT_PRECISION)
+    return sorted(start + end for start in starts for end in ends)
+
+
+def frechet(a: np.ndarray, b: np.ndarray) -> float:
+    """Distance de Fréchet discrète (mètres) entre deux tracés (lat, lng)."""
+    lat0 = float(a[:, 0].mean())
+    xa, xb = _to_meters(a, lat0), _to_meters(b, lat0)
+    dist = np.hypot(xa[:, None, 0] - xb[None, :, 0], xa[:, None, 1] - xb[None, :, 1])
+    n, m = dist.shape
+    ca = np.empty((n, m))
+    ca[0] = np.maximum.accumulate(dist[0])
+    ca[:, 0] = np.maximum.accumulate(dist[:, 0])
+    for i in range(1, n):
+        for j in range(1, m):
+            ca[i, j] = max(dist[i, j], min(ca[i - 1, j], ca[i - 1, j - 1], ca[i, j - 1]))
+    return float(ca[-1, -1])
+
+
+# ---------- Indexation ----------
+
+def index_activity(db: Session, activity: models.StravaActivity) -> models.RouteCluster | None:
+    """Rattache *activity* à un parcours existant ou en crée un nouveau.
+
+    Ne valide pas la transaction. Retourne ``None`` si l'activité n'a pas de tracé exploitable.
+    """
+    points = decode_polyline(activity.summary_polyline or "")
+    if len(points) < 2 or _cumulative_length(points)[-1] < CELL_SPACING:
+        return None
+
+    path = resample(points, RESAMPLE_POINTS)
+    activity_cells = cells(points)
+    bucket = endpoints(points)
+    candidates = crud.find_route_candidates(
+        db, activity.user_id, endpoint_buckets(points), activity_cells, MAX_CANDIDATES
+    )
+    for cluster, shared in candidates:
+        if shared / max(len(activity_cells), cluster.cell_count) < MIN_OVERLAP:
+            break
+        if frechet(path, decode_polyline(cluster.path)) <= FRECHET_THRESHOLD:
+            crud.attach_activity_to_route(db, activity, cluster)
+            return cluster
+    return crud.create_route_cluster(
+        db, activity, bucket, encode_polyline(path), activity_cells
+    )
+
+
+def index_pending(db: Session, user_id: int) -> int:
+    """Indexe les activités de *user_id* qui ont un tracé mais pas encore de parcours.
+
+    Un verrou consultatif par utilisateur évite que deux processus créent le
+    même parcours en parallèle. Retourne le nombre d'activités rattachées.
+    """
+    crud.lock_user_routes(db, user_id)
+    indexed = 0
+    for activity in crud.list_activities_without_route(db, user_id):
+        if index_activity(db, activity) is not None:
+            indexed += 1
+    db.commit()
+    return indexed
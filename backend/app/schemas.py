@@ -1,11 +1,11 @@
 """Schémas Pydantic pour les endpoints FastAPI."""
 from __future__ import annotations
 
-from datetime import date as dt_date
+from datetime import date as dt_date, datetime
 from enum import Enum
 from typing import List, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 
 
 class SessionType(str, Enum):
@@ -28,9 +28,27 @@ class SessionCreate(SessionBase):
     pass
 
 
+class SessionUpdate(BaseModel):
+    date: Optional[dt_date] = None
+    type: Optional[SessionType] = None
+    exercise: Optional[str] = None
+    strava_activity_id: Optional[str] = None
+    completed: Optional[bool] = None
+
+    @field_validator("date", "type", "exercise")
+    @classmethod
+    def not_null(cls, value):
+        # Champ facultatif, mais null explicite interdit : la colonne est NOT NULL
+        if value is None:
+            raise ValueError("ne peut pas être null")
+        return value
+
+
 class Session(SessionBase):
-    id: int
+    # None pour une séance d'un modèle pas encore modifiée dans ce plan
+    id: Optional[int] = None
     plan_id: int
+    template_session_id: Optional[int] = None
 
     class Config:
         orm_mode = True
@@ -69,16 +87,84 @@ class TrainingPlanCreate(TrainingPlanBase):
 class TrainingPlan(TrainingPlanBase):
     id: int
     owner_id: int
+    template_id: Optional[int] = None
+    start_date: Optional[dt_date] = None
     sessions: list["Session"] = Field(default_factory=list)
 
     class Config:
         orm_mode = True
 
 
+# ---------- Templates ----------
+
+class TemplateSessionCreate(BaseModel):
+    day_offset: int = Field(..., ge=0, description="Jours depuis le début du plan")
+    type: SessionType = SessionType.running
+    exercise: str
+
+
+class TemplateSession(TemplateSessionCreate):
+    id: int
+
+    class Config:
+        orm_mode = True
+
+
+class PlanTemplateCreate(TrainingPlanBase):
+    public: bool = False
+    sessions: list[TemplateSessionCreate] = Field(default_factory=list)
+
+
+class PlanTemplateFromPlan(BaseModel):
+    public: bool = False
+
+
+class PlanTemplate(TrainingPlanBase):
+    id: int
+    owner_id: int
+    public: bool
+    sessions: list[TemplateSession] = Field(default_factory=list)
+
+    class Config:
+        orm_mode = True
+
+
+class PlanFromTemplate(BaseModel):
+    start_date: dt_date
+    name: Optional[str] = Field(None, description="Nom du plan (par défaut celui du modèle)")
+
+
 # ---------- Gemini Generation ----------
 
+class RaceDistance(str, Enum):
+    five_k = "5k"
+    ten_k = "10k"
+    half = "semi"
+    marathon = "marathon"
+
+
+class PlanEngine(str, Enum):
+    auto = "auto"
+    local = "local"
+    gemini = "gemini"
+
+
+class PlanParameters(BaseModel):
+    distance: RaceDistance
+    weeks: int = Field(..., ge=4, le=30, description="Durée du plan en semaines")
+    runs_per_week: int = Field(4, ge=2, le=7, description="Nombre de sorties par semaine")
+    start_date: Optional[dt_date] = Field(None, description="Début du plan (par défaut lundi prochain)")
+
+
 class PlanGenerateRequest(BaseModel):
-    prompt: str = Field(..., description="Le prompt de l'utilisateur pour générer le plan.")
+    prompt: Optional[str] = Field(None, description="Le prompt de l'utilisateur pour générer le plan.")
+    parameters: Optional[PlanParameters] = Field(
+        None, description="Paramètres structurés : génération locale sans appel au modèle."
+    )
+    engine: PlanEngine = Field(
+        PlanEngine.auto,
+        description="auto : générateur local si le prompt se réduit à des paramètres connus, sinon Gemini.",
+    )
 
 class GeminiSession(BaseModel):
     date: dt_date
@@ -90,6 +176,35 @@ class GeminiPlan(BaseModel):
     goal: str
     sessions: list[GeminiSession]
 
+# Format compact demandé au modèle : quelques semaines types et, pour chaque
+# semaine du plan, la semaine type suivie, un coefficient de volume et les
+# seuls jours qui en diffèrent. Le serveur le développe en GeminiSession.
+
+class PatternDay(BaseModel):
+    type: SessionType
+    exercise: str = Field(..., description="Séance ; {km} marque l'emplacement de la distance.")
+    km: Optional[float] = Field(..., description="Distance de référence, multipliée par le volume de la semaine.")
+
+class PatternOverride(PatternDay):
+    km: Optional[float] = Field(..., description="Distance exacte, non multipliée par le volume.")
+    day: int = Field(..., ge=0, le=6, description="0 = lundi, 6 = dimanche.")
+
+class WeekPattern(BaseModel):
+    name: str
+    days: list[PatternDay] = Field(..., min_length=7, max_length=7, description="Du lundi au dimanche.")
+
+class PlanWeek(BaseModel):
+    pattern: str = Field(..., description="Nom de la semaine type.")
+    volume: float = Field(..., ge=0.1, le=3)
+    overrides: list[PatternOverride]
+
+class CompactPlan(BaseModel):
+    name: str
+    goal: str
+    start_date: dt_date
+    patterns: list[WeekPattern]
+    weeks: list[PlanWeek]
+
 
 # ---------- Strava Activity ----------
 
@@ -102,7 +217,7 @@ class StravaActivityBase(BaseModel):
     moving_time: int | None
 
 class StravaActivityCreate(StravaActivityBase):
-    pass
+    summary_polyline: str | None = None
 
 class StravaActivity(StravaActivityBase):
     id: int
@@ -111,8 +226,163 @@ class StravaActivity(StravaActivityBase):
     class Config:
         orm_mode = True
 
+class ActivityLap(BaseModel):
+    lap_index: int
+    name: str | None = None
+    start_date: str | None = None
+    elapsed_time: int | None = None
+    moving_time: int | None = None
+    distance: float | None = None
+    total_elevation_gain: float | None = None
+    average_speed: float | None = None
+    max_speed: float | None = None
+    average_heartrate: float | None = None
+    max_heartrate: float | None = None
+
+    class Config:
+        orm_mode = True
+
+class ActivitySplit(BaseModel):
+    split: int
+    distance: float | None = None
+    elapsed_time: int | None = None
+    moving_time: int | None = None
+    elevation_difference: float | None = None
+    average_speed: float | None = None
+    average_heartrate: float | None = None
+    pace_zone: int | None = None
+
+    class Config:
+        orm_mode = True
+
+class StravaActivityDetail(StravaActivity):
+    elapsed_time: int | None = None
+    total_elevation_gain: float | None = None
+    elev_high: float | None = None
+    elev_low: float | None = None
+    average_speed: float | None = None
+    max_speed: float | None = None
+    average_heartrate: float | None = None
+    max_heartrate: float | None = None
+    calories: float | None = None
+    laps: list[ActivityLap] = Field(default_factory=list)
+    splits: list[ActivitySplit] = Field(default_factory=list)
+
 class StravaSyncResult(BaseModel):
     imported: int
     updated: int
     skipped: int
 
+
+class StravaSyncStatus(BaseModel):
+    status: str
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    last_success_at: datetime | None = None
+    duration_seconds: float | None = None
+    imported: int
+    updated: int
+    error: str | None = None
+
+    class Config:
+        orm_mode = True
+
+
+class StravaImportStatus(BaseModel):
+    job_id: str
+    status: str
+    total: int
+    processed: int
+    imported: int
+    skipped: int
+    error: str | None = None
+
+    class Config:
+        orm_mode = True
+
+
+class ActivityStreams(BaseModel):
+    strava_id: int
+    original_points: int
+    points: int
+    streams: dict[str, list] = Field(default_factory=dict)
+
+
+
+# ---------- Adherence ----------
+
+class WeekAdherence(BaseModel):
+    week_start: dt_date
+    planned_sessions: int
+    completed_sessions: int
+    planned_km: float
+    actual_km: float
+    longest_missed: int
+
+    class Config:
+        orm_mode = True
+
+class PlanAdherence(BaseModel):
+    plan_id: int
+    planned_sessions: int
+    completed_sessions: int
+    completion_rate: float | None = Field(None, description="Sur les semaines terminées")
+    planned_km: float
+    actual_km: float
+    longest_missed_streak: int = Field(..., description="Sur les semaines terminées")
+    current_missed_streak: int = Field(..., description="Sur les semaines terminées")
+    weeks: list[WeekAdherence] = Field(default_factory=list)
+
+
+# ---------- Stats ----------
+
+class PersonalRecord(BaseModel):
+    distance_name: str
+    distance: float
+    elapsed_time: float
+    strava_id: int
+    achieved_at: str | None = None
+
+    class Config:
+        orm_mode = True
+
+
+
+# ---------- Routes ----------
+
+class Route(BaseModel):
+    id: int
+    activity_count: int
+    distance: float | None = None
+    path: str = Field(..., description="Tracé de référence (encoded polyline)")
+
+    class Config:
+        orm_mode = True
+
+class RouteTrend(BaseModel):
+    route: Route
+    activities: list[StravaActivity] = Field(default_factory=list)
+
+
+# ---------- Calendar ----------
+
+class CalendarDay(BaseModel):
+    date: dt_date
+    sessions: list[Session] = Field(default_factory=list)
+    activities: list[StravaActivity] = Field(default_factory=list)
+
+
+# ---------- Search ----------
+
+class PlanSearchHit(TrainingPlanBase):
+    id: int
+    rank: float
+
+
+class SessionSearchHit(Session):
+    rank: float
+
+
+class SearchResults(BaseModel):
+    plans: list[PlanSearchHit] = Field(default_factory=list)
+    sessions: list[SessionSearchHit] = Field(default_factory=list)
@@ -0,0 +1,28 @@
+"""Regroupement des appels concurrents identiques sur une seule exécution."""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    """Tant qu'un appel pour une clé est en cours, les appels suivants attendent son résultat.
+
+    L'appel est exécuté dans une tâche séparée et attendu via ``asyncio.shield`` :
+    si le client qui l'a déclenché se déconnecte, les autres en reçoivent quand même le résultat.
+    """
+
+    def __init__(self) -> None:
+        self._tasks: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
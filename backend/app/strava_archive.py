@@ -0,0 +1,310 @@
+"""Import d'une archive Strava (« Télécharger vos données ») sans passer par l'API.
+
+L'archive contient ``activities.csv`` et un fichier GPX/FIT/TCX (souvent gzippé)
+par activité. Le CSV est lu en flux ; les fichiers ne sont analysés, dans un
+pool de processus, que pour compléter les lignes auxquelles il manque un champ.
+"""
+from __future__ import annotations
+
+import csv
+import gzip
+import io
+import math
+import os
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Iterator
+from xml.etree import ElementTree
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from . import crud, models, schemas
+from .database import SessionLocal
+
+try:  # Dépendance optionnelle : sans elle les fichiers FIT sont ignorés
+    import fitparse
+except ImportError:  # pragma: no cover
+    fitparse = None
+
+BATCH_SIZE = 1000
+MAX_WORKERS = int(os.getenv("STRAVA_IMPORT_WORKERS", str(os.cpu_count() or 2)))
+CSV_DATE_FORMAT = "%b %d, %Y, %I:%M:%S %p"
+
+
+
+# ---------- Jobs ----------
+# La progression est stockée en base : le statut est consultable quel que soit
+# le worker qui reçoit la requête.
+
+def create_job(user_id: int) -> models.StravaImportJob:
+    with SessionLocal() as db:
+        return crud.create_strava_import_job(db, user_id, uuid.uuid4().hex)
+
+
+# ---------- Parsing des fichiers d'activité ----------
+
+def _haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Distance en mètres entre deux points GPS."""
+    rlat1, rlat2 = math.radians(lat1), math.radians(lat2)
+    dlat = rlat2 - rlat1
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(rlat1) * math.cos(rlat2) * math.sin(dlon / 2) ** 2
+    return 6371000 * 2 * math.asin(math.sqrt(a))
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _parse_gpx(data: bytes) -> dict[str, Any]:
+    distance = 0.0
+    moving_time = 0.0
+    start: datetime | None = None
+    previous: tuple[float, float, datetime] | None = None
+    for _, elem in ElementTree.iterparse(io.BytesIO(data)):
+        if _local_name(elem.tag) != "trkpt":
+            continue
+        when = next((c.text for c in elem if _local_name(c.tag) == "time" and c.text), None)
+        if when is None:
+            elem.clear()
+            continue
+        point = (float(elem.get("lat")), float(elem.get("lon")), _parse_time(when))
+        if previous is None:
+            start = point[2]
+        else:
+            step = _haversine(previous[0], previous[1], point[0], point[1])
+            elapsed = (point[2] - previous[2]).total_seconds()
+            distance += step
+            # Les pauses (vitesse < 0,5 m/s) ne comptent pas dans le temps de déplacement
+            if elapsed > 0 and step / elapsed >= 0.5:
+                moving_time += elapsed
+        previous = point
+        elem.clear()
+    return {"start_date": start, "distance": distance, "moving_time": int(moving_time)}
+
+
+def _parse_tcx(data: bytes) -> dict[str, Any]:
+    distance = 0.0
+    moving_time = 0.0
+    start: datetime | None = None
+    for _, elem in ElementTree.iterparse(io.BytesIO(data)):
+        name = _local_name(elem.tag)
+        if name == "Id" and start is None and elem.text:
+            start = _parse_time(elem.text)
+        elif name == "Lap":
+            for child in elem:
+                child_name = _local_name(child.tag)
+                if child_name == "TotalTimeSeconds" and child.text:
+                    moving_time += float(child.text)
+                elif child_name == "DistanceMeters" and child.text:
+                    distance += float(child.text)
+            elem.clear()
+    return {"start_date": start, "distance": distance, "moving_time": int(moving_time)}
+
+
+def _parse_fit(data: bytes) -> dict[str, Any]:
+    if fitparse is None:
+        return {}
+    fit = fitparse.FitFile(io.BytesIO(data))
+    for message in fit.get_messages("session"):
+        values = message.get_values()
+        return {
+            "start_date": values.get("start_time"),
+            "distance": values.get("total_distance"),
+            "moving_time": int(values.get("total_timer_time") or 0) or None,
+        }
+    return {}
+
+
+_PARSERS = {".gpx": _parse_gpx, ".tcx": _parse_tcx, ".fit": _parse_fit}
+
+
+def parse_activity_file(zip_path: str, member: str) -> dict[str, Any]:
+    """Extrait date de début, distance et temps de déplacement d'un fichier de l'archive.
+
+    Exécutée dans un processus du pool : l'archive est rouverte ici plutôt que
+    de faire transiter le contenu des fichiers entre processus.
+    """
+    name = member[:-3] if member.endswith(".gz") else member
+    parser = _PARSERS.get(os.path.splitext(name)[1].lower())
+    if parser is None:
+        return {}
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            data = archive.read(member)
+        if member.endswith(".gz"):
+            data = gzip.decompress(data)
+        parsed = parser(data)
+    except Exception:  # noqa: BLE001 - un fichier corrompu ne doit pas bloquer l'import
+        return {}
+    if isinstance(parsed.get("start_date"), datetime):
+        parsed["start_date"] = _format_date(parsed["start_date"])
+    return parsed
+
+
+# ---------- Lecture de activities.csv ----------
+
+def _format_date(value: datetime) -> str:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _to_float(value: str | None) -> float | None:
+    if not value:
+        return None
+    try:
+        return float(value.replace(",", ""))
+    except ValueError:
+        return None
+
+
+def _open_activities_csv(archive: zipfile.ZipFile) -> io.TextIOWrapper:
+    member = next(
+        (name for name in archive.namelist() if name.rsplit("/", 1)[-1] == "activities.csv"),
+        None,
+    )
+    if member is None:
+        raise ValueError("activities.csv introuvable dans l'archive")
+    return io.TextIOWrapper(archive.open(member), encoding="utf-8-sig", newline="")
+
+
+def _iter_csv_rows(archive: zipfile.ZipFile) -> Iterator[dict[str, Any]]:
+    """Lit ``activities.csv`` ligne à ligne.
+
+    Le CSV Strava contient des colonnes en double (« Distance » en km puis en
+    mètres, « Elapsed Time » deux fois) : on se fie aux positions des en-têtes.
+    """
+    with _open_activities_csv(archive) as handle:
+        reader = csv.reader(handle)
+        header = next(reader, [])
+        positions: dict[str, list[int]] = {}
+        for index, column in enumerate(header):
+            positions.setdefault(column.strip(), []).append(index)
+
+        def cell(row: list[str], column: str, occurrence: int = 0) -> str | None:
+            indexes = positions.get(column)
+            if not indexes or len(indexes) <= occurrence:
+                return None
+            index = indexes[occurrence]
+            return row[index].strip() if index < len(row) else None
+
+        distance_in_meters = len(positions.get("Distance", [])) > 1
+        for row in reader:
+            strava_id = cell(row, "Activity ID")
+            if not strava_id or not strava_id.isdigit():
+                continue
+
+            if distance_in_meters:
+                distance = _to_float(cell(row, "Distance", -1))
+            else:
+                km = _to_float(cell(row, "Distance"))
+                distance = km * 1000 if km is not None else None
+            moving_time = _to_float(cell(row, "Moving Time"))
+            if moving_time is None:
+                moving_time = _to_float(cell(row, "Elapsed Time", -1))
+
+            start_date = None
+            raw_date = cell(row, "Activity Date")
+            if raw_date:
+                try:
+                    start_date = _format_date(datetime.strptime(raw_date, CSV_DATE_FORMAT))
+                except ValueError:
+                    start_date = None
+
+            yield {
+                "strava_id": int(strava_id),
+                "name": (cell(row, "Activity Name") or None),
+                "type": (cell(row, "Activity Type") or None),
+                "start_date": start_date,
+                "distance": distance,
+                "moving_time": int(moving_time) if moving_time is not None else None,
+                "filename": cell(row, "Filename") or None,
+            }
+
+
+def count_activities(zip_path: str) -> int:
+    with zipfile.ZipFile(zip_path) as archive, _open_activities_csv(archive) as handle:
+        return max(sum(1 for _ in csv.reader(handle)) - 1, 0)
+
+
+# ---------- Import ----------
+
+def _complete_rows(rows: list[dict[str, Any]], zip_path: str, pool: ProcessPoolExecutor) -> None:
+    """Complète, à partir des fichiers d'activité, les lignes CSV incomplètes."""
+    incomplete = [
+        row
+        for row in rows
+        if row["filename"]
+        and (row["distance"] is None or row["moving_time"] is None or row["start_date"] is None)
+    ]
+    if not incomplete:
+        return
+    parsed_rows = pool.map(
+        parse_activity_file,
+        [zip_path] * len(incomplete),
+        [row["filename"] for row in incomplete],
+        chunksize=16,
+    )
+    for row, parsed in zip(incomplete, parsed_rows):
+        for key in ("start_date", "distance", "moving_time"):
+            if row[key] is None and parsed.get(key) is not None:
+                row[key] = parsed[key]
+
+
+def _insert_batch(db, user_id: int, rows: list[dict[str, Any]]) -> int:
+    """Insère un lot en ignorant les activités déjà connues. Retourne le nombre inséré."""
+    values = [
+        {
+            **schemas.StravaActivityCreate(
+                **{key: value for key, value in row.items() if key != "filename"}
+            ).dict(),
+            "user_id": user_id,
+        }
+        for row in rows
+    ]
+    stmt = (
+        pg_insert(models.StravaActivity)
+        .values(values)
+        .on_conflict_do_nothing(index_elements=[models.StravaActivity.user_id, models.StravaActivity.strava_id])
+    )
+    result = db.execute(stmt)
+    db.commit()
+    return result.rowcount
+
+
+def run_import(job_id: str, user_id: int, zip_path: str) -> None:
+    """Importe l'archive *zip_path* pour *user_id* en mettant à jour la progression du job.
+
+    L'archive temporaire est supprimée à la fin, qu'il y ait erreur ou non.
+    """
+    with SessionLocal() as db:
+        try:
+            crud.update_strava_import_job(db, job_id, status="running", total=count_activities(zip_path))
+            processed = imported = skipped = 0
+            with zipfile.ZipFile(zip_path) as archive, ProcessPoolExecutor(max_workers=MAX_WORKERS) as pool:
+                rows = _iter_csv_rows(archive)
+                while True:
+                    batch = [row for _, row in zip(range(BATCH_SIZE), rows)]
+                    if not batch:
+                        break
+                    _complete_rows(batch, zip_path, pool)
+                    inserted = _insert_batch(db, user_id, batch)
+                    processed += len(batch)
+                    imported += inserted
+                    skipped += len(batch) - inserted
+                    crud.update_strava_import_job(
+                        db, job_id, processed=processed, imported=imported, skipped=skipped
+                    )
+            crud.update_strava_import_job(db, job_id, status="done")
+        except Exception as e:  # noqa: BLE001 - l'erreur est restituée via le statut du job
+            db.rollback()
+            crud.update_strava_import_job(db, job_id, status="failed", error=str(e))
+        finally:
+            os.remove(zip_path)
@@ -0,0 +1,124 @@
+"""Synchronisation incrémentale des activités Strava d'un utilisateur.
+
+Partagée par ``POST /strava/sync`` et par le worker de fond
+(``python -m app.sync_worker``). Les activités sont lues par ordre
+chronologique à partir du point de reprise (``StravaSyncStatus.checkpoint``),
+qui est avancé et commité avec chaque page : une synchronisation interrompue
+reprend là où elle s'était arrêtée.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from . import activity_details, best_efforts, crud, heatmap, models, routes, schemas, strava_tokens, strava_utils
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 100
+# Pages lues au plus par synchronisation ; la suite sera reprise au passage suivant
+MAX_PAGES = int(os.getenv("STRAVA_SYNC_MAX_PAGES", "10"))
+# Historique récupéré lors de la première synchronisation d'un compte
+BACKFILL_DAYS = int(os.getenv("STRAVA_SYNC_BACKFILL_DAYS", "365"))
+# Au-delà, une synchronisation « en cours » est considérée comme interrompue
+LEASE = timedelta(seconds=int(os.getenv("STRAVA_SYNC_LEASE", "900")))
+# Fenêtre dans laquelle les activités sont rattachées aux séances des plans
+MATCH_DAYS = int(os.getenv("STRAVA_SESSION_MATCH_DAYS", "14"))
+
+
+class SyncInProgress(Exception):
+    """Une synchronisation est déjà en cours pour cet utilisateur."""
+
+
+def _activity_data(activity: dict) -> schemas.StravaActivityCreate:
+    return schemas.StravaActivityCreate(
+        strava_id=activity["id"],
+        name=activity.get("name"),
+        type=activity.get("type"),
+        start_date=activity.get("start_date_local"),
+        distance=activity.get("distance"),
+        moving_time=activity.get("moving_time"),
+        summary_polyline=(activity.get("map") or {}).get("summary_polyline") or None,
+    )
+
+
+def _timestamp(activity: dict) -> int:
+    """Début de l'activité en timestamp Unix (``start_date`` est en UTC)."""
+    return int(datetime.fromisoformat(activity["start_date"].replace("Z", "+00:00")).timestamp())
+
+
+def sync_user(db: Session, token: models.StravaToken) -> dict[str, int]:
+    """Synchronise les activités de ``token.user_id`` et enregistre le résultat.
+
+    Lève ``SyncInProgress`` si un autre processus synchronise déjà ce compte,
+    et propage les erreurs Strava (``httpx.HTTPStatusError``) après les avoir
+    consignées dans le statut.
+    """
+    status = crud.claim_strava_sync(db, token.user_id, LEASE)
+    if status is None:
+        raise SyncInProgress()
+
+    stats = {"imported": 0, "updated": 0, "skipped": 0}
+    try:
+        access_token = strava_tokens.get_access_token(db, token)
+        after = status.checkpoint or int(time.time()) - BACKFILL_DAYS * 86400
+        for _ in range(MAX_PAGES):
+            activities = strava_utils.fetch_activities(
+                access_token, per_page=PAGE_SIZE, after=after, subject=token.user_id
+            )
+            if not activities:
+                break
+            created, updated = crud.upsert_strava_activities(
+                db, token.user_id, [_activity_data(activity) for activity in activities]
+            )
+            stats["imported"] += created
+            stats["updated"] += updated
+            after = max(after, *(_timestamp(activity) for activity in activities))
+            status.checkpoint = after
+            db.add(status)
+            db.commit()
+            if len(activities) < PAGE_SIZE:
+                break
+    except Exception as e:
+        db.rollback()
+        crud.finish_strava_sync(db, status, stats["imported"], stats["updated"], error=str(e) or repr(e))
+        raise
+    crud.finish_strava_sync(db, status, stats["imported"], stats["updated"])
+    return stats
+
+
+def enrich_recent(db: Session, token: models.StravaToken) -> None:
+    """Indexe parcours et heatmap, rattache les activités aux séances prévues, puis précharge
+    le détail et les séries des activités récentes.
+
+    Chaque étape est indépendante : l'échec de l'une est consigné et
+    n'empêche pas les suivantes.
+    """
+    steps = (
+        ("parcours", lambda: routes.index_pending(db, token.user_id)),
+        ("heatmap", lambda: heatmap.update_tiles(db, token.user)),
+        ("séances", lambda: crud.match_sessions_to_activities(
+            db, token.user_id, date.today() - timedelta(days=MATCH_DAYS)
+        )),
+    )
+    for name, step in steps:
+        try:
+            step()
+        except Exception:  # noqa: BLE001 - l'enrichissement est opportuniste
+            db.rollback()
+            logger.exception("Échec de l'enrichissement « %s » (user %s)", name, token.user_id)
+    activity_details.prefetch_recent(db, token)
+    best_efforts.prefetch_recent(db, token)
+
+
+def enrich_user(user_id: int) -> None:
+    """Variante de :func:`enrich_recent` avec sa propre session (tâche de fond)."""
+    with SessionLocal() as db:
+        token = db.query(models.StravaToken).filter(models.StravaToken.user_id == user_id).first()
+        if token is not None:
+            enrich_recent(db, token)
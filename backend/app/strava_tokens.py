@@ -0,0 +1,100 @@
+"""Rafraîchissement des tokens Strava : single-flight par utilisateur et renouvellement proactif.
+
+Strava fait tourner le refresh token à chaque rafraîchissement : deux
+rafraîchissements concurrents pour un même utilisateur finissent par stocker un
+refresh token déjà invalidé. On sérialise donc les rafraîchissements par
+utilisateur avec un verrou en mémoire (threads d'un même worker) et un verrou de
+ligne ``SELECT ... FOR UPDATE`` sur ``strava_tokens`` (workers distincts), puis on
+revérifie l'expiration une fois le verrou obtenu.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+from . import models, strava_utils
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Marge appliquée lors d'une requête : en dessous, le token est rafraîchi sur place
+REQUEST_MARGIN = 60
+# Marge du rafraîchisseur de fond : les tokens sont renouvelés bien avant la marge ci-dessus
+PROACTIVE_MARGIN = int(os.getenv("STRAVA_TOKEN_REFRESH_MARGIN", "900"))
+REFRESH_INTERVAL = int(os.getenv("STRAVA_TOKEN_REFRESH_INTERVAL", "300"))
+
+_user_locks: dict[int, threading.Lock] = {}
+_user_locks_guard = threading.Lock()
+
+
+def _lock_for(user_id: int) -> threading.Lock:
+    with _user_locks_guard:
+        return _user_locks.setdefault(user_id, threading.Lock())
+
+
+def get_access_token(db: Session, token: models.StravaToken, margin: int = REQUEST_MARGIN) -> str:
+    """Retourne un access token valide pendant au moins *margin* secondes.
+
+    Lève ``httpx.HTTPStatusError`` si Strava refuse le rafraîchissement.
+    """
+    if token.expires_at > int(time.time()) + margin:
+        return token.access_token
+
+    with _lock_for(token.user_id):
+        try:
+            locked = (
+                db.query(models.StravaToken)
+                .filter(models.StravaToken.id == token.id)
+                .with_for_update()
+                .populate_existing()
+                .one()
+            )
+            # Un autre thread ou worker a pu rafraîchir pendant qu'on attendait le verrou
+            if locked.expires_at > int(time.time()) + margin:
+                db.commit()
+                return locked.access_token
+
+            data = strava_utils.refresh_access_token(locked.refresh_token)
+            locked.access_token = data["access_token"]
+            locked.refresh_token = data["refresh_token"]
+            locked.expires_at = data["expires_at"]
+            db.commit()
+            return data["access_token"]
+        except Exception:
+            db.rollback()
+            raise
+
+
+def refresh_expiring_tokens() -> int:
+    """Rafraîchit les tokens qui expirent dans moins de ``PROACTIVE_MARGIN`` secondes."""
+    deadline = int(time.time()) + PROACTIVE_MARGIN
+    refreshed = 0
+    with SessionLocal() as db:
+        tokens = (
+            db.query(models.StravaToken)
+            .filter(models.StravaToken.expires_at <= deadline)
+            .order_by(models.StravaToken.expires_at)
+            .all()
+        )
+        for token in tokens:
+            try:
+                get_access_token(db, token, margin=PROACTIVE_MARGIN)
+                refreshed += 1
+            except Exception:  # noqa: BLE001 - un compte révoqué ne doit pas bloquer les autres
+                logger.exception("Échec du rafraîchissement du token Strava (user %s)", token.user_id)
+    return refreshed
+
+
+async def run_token_refresher() -> None:
+    """Boucle de fond lancée par le worker de synchronisation (``app.sync_worker``)."""
+    while True:
+        try:
+            await asyncio.to_thread(refresh_expiring_tokens)
+        except Exception:  # noqa: BLE001
+            logger.exception("Échec du rafraîchissement proactif des tokens Strava")
+        await asyncio.sleep(REFRESH_INTERVAL)
@@ -1,6 +1,9 @@
 import os
+import threading
 import httpx
-from typing import Any, Dict, TYPE_CHECKING
+from typing import Any, Dict
+
+from . import http_cache
 
 STRAVA_CLIENT_ID = os.getenv("STRAVA_CLIENT_ID")
 STRAVA_CLIENT_SECRET = os.getenv("STRAVA_CLIENT_SECRET")
@@ -8,6 +11,24 @@ STRAVA_REDIRECT_URI = os.getenv("STRAVA_REDIRECT_URI", "http://localhost:8000/st
 STRAVA_OAUTH_URL = "https://www.strava.com/oauth/authorize"
 STRAVA_TOKEN_URL = "https://www.strava.com/oauth/token"
 
+_api_client: httpx.Client | None = None
+_api_client_lock = threading.Lock()
+
+
+def api_client() -> httpx.Client:
+    """Client partagé pour l'API Strava : connexions réutilisées et réponses mises en cache."""
+    global _api_client
+    with _api_client_lock:
+        if _api_client is None:
+            _api_client = httpx.Client(transport=http_cache.make_transport())
+        return _api_client
+
+
+def _cache_extensions(subject: Any) -> dict[str, Any]:
+    """Les réponses en cache sont cloisonnées par utilisateur plutôt que par token,
+    qui change à chaque rafraîchissement."""
+    return {} if subject is None else {"cache_subject": str(subject)}
+
 
 def get_authorize_url(state: str = "") -> str:
     if not STRAVA_CLIENT_ID:
@@ -53,34 +74,54 @@ def refresh_access_token(refresh_token: str) -> Dict[str, Any]:
         return resp.json()
 
 
-import time
+def fetch_activities(
+    access_token: str,
+    page: int = 1,
+    per_page: int = 30,
+    after: int | None = None,
+    subject: Any = None,
+) -> list[dict[str, Any]]:
+    """Récupère une page d'activités de l'athlète depuis l'API Strava.
+
+    Avec *after* (timestamp Unix), seules les activités postérieures sont
+    renvoyées, de la plus ancienne à la plus récente.
+    """
+    url = "https://www.strava.com/api/v3/athlete/activities"
+    params = {"page": page, "per_page": per_page}
+    if after is not None:
+        params["after"] = after
+    headers = {"Authorization": f"Bearer {access_token}"}
 
-if TYPE_CHECKING:
-    from . import models
+    resp = api_client().get(
+        url, params=params, headers=headers, timeout=15, extensions=_cache_extensions(subject)
+    )
+    resp.raise_for_status()
+    return resp.json()
 
 
-def refresh_access_token_if_needed(token: "models.StravaToken") -> dict[str, Any]:
-    """Vérifie l'expiration et rafraîchit si nécessaire. Retourne un dict avec les nouvelles données du token."""
-    # Check if token expires in the next 60 seconds
-    if token.expires_at > int(time.time()) + 60:
-        return {
-            "access_token": token.access_token,
-            "refresh_token": token.refresh_token,
-            "expires_at": token.expires_at,
-        }
+def fetch_activity_streams(
+    access_token: str, activity_id: int, keys: tuple[str, ...], subject: Any = None
+) -> dict[str, Any]:
+    """Récupère les séries temporelles d'une activité, indexées par type."""
+    url = f"https://www.strava.com/api/v3/activities/{activity_id}/streams"
+    params = {"keys": ",".join(keys), "key_by_type": "true"}
+    headers = {"Authorization": f"Bearer {access_token}"}
 
-    # Token is expired or about to expire, refresh it
-    new_token_data = refresh_access_token(token.refresh_token)
-    return new_token_data
+    resp = api_client().get(
+        url, params=params, headers=headers, timeout=30, extensions=_cache_extensions(subject)
+    )
+    resp.raise_for_status()
+    return resp.json()
 
 
-def fetch_activities(access_token: str, page: int = 1, per_page: int = 30) -> list[dict[str, Any]]:
-    """Récupère une page d'activités de l'athlète depuis l'API Strava."""
-    url = "https://www.strava.com/api/v3/athlete/activities"
-    params = {"page": page, "per_page": per_page}
+def fetch_activity(access_token: str, activity_id: int, subject: Any = None) -> dict[str, Any]:
+    """Récupère le détail d'une activité (tours, découpage kilométrique, dénivelé, cardio)."""
+    url = f"https://www.strava.com/api/v3/activities/{activity_id}"
+    params = {"include_all_efforts": "false"}
     headers = {"Authorization": f"Bearer {access_token}"}
 
-    with httpx.Client() as client:
-        resp = client.get(url, params=params, headers=headers, timeout=15)
-        resp.raise_for_status()
-        return resp.json()
+    resp = api_client().get(
+        url, params=params, headers=headers, timeout=15, extensions=_cache_extensions(subject)
+    )
+    resp.raise_for_status()
+    return resp.json()
@@ -0,0 +1,113 @@
+"""Encodage compact et sous-échantillonnage des séries temporelles d'activité.
+
+Chaque série est stockée sous forme de tableau NumPy typé, sérialisé puis
+compressé avec zlib. Le temps est stocké en deltas (presque toujours 1 s), ce
+qui le réduit à quelques octets une fois compressé.
+"""
+from __future__ import annotations
+
+import zlib
+from typing import Any
+
+import numpy as np
+
+STREAM_KEYS = ("time", "distance", "heartrate", "altitude", "latlng")
+
+_DTYPES: dict[str, Any] = {
+    "time": np.uint32,
+    "distance": np.float32,
+    "heartrate": np.uint16,
+    "altitude": np.float32,
+    "latlng": np.float32,
+}
+
+
+def encode(key: str, values: list[Any]) -> bytes:
+    """Sérialise la série *key* en tableau binaire compressé."""
+    array = np.asarray(values, dtype=np.float64)
+    if key == "time":
+        array = np.diff(array, prepend=0)
+    return zlib.compress(array.astype(_DTYPES[key]).tobytes(), 6)
+
+
+def decode(key: str, blob: bytes) -> np.ndarray:
+    """Inverse de :func:`encode`. ``latlng`` est renvoyé sous forme (n, 2)."""
+    array = np.frombuffer(zlib.decompress(blob), dtype=_DTYPES[key])
+    if key == "time":
+        return np.cumsum(array, dtype=np.int64)
+    if key == "latlng":
+        return array.reshape(-1, 2)
+    return array
+
+
+def encode_strava_streams(payload: dict[str, Any]) -> dict[str, Any]:
+    """Convertit la réponse ``key_by_type`` de l'API streams en colonnes de ``ActivityStream``."""
+    columns: dict[str, Any] = {key: None for key in STREAM_KEYS}
+    point_count = 0
+    for key in STREAM_KEYS:
+        data = (payload.get(key) or {}).get("data")
+        if not data:
+            continue
+        columns[key] = encode(key, data)
+        point_count = max(point_count, len(data))
+    columns["point_count"] = point_count
+    return columns
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets : indices des *threshold* points conservés.
+
+    Les moyennes de chaque seau sont calculées en une passe vectorisée ; seule
+    la sélection du point de chaque seau, qui dépend du précédent, est itérée
+    (une itération par point de sortie, pas par point d'entrée).
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    # Débuts des seaux ; le dernier « seau » ne contient que le dernier point
+    edges = (np.floor(np.arange(threshold - 1) * (n - 2) / (threshold - 2)) + 1).astype(np.int64)
+    counts = np.diff(np.append(edges, n))
+    avg_x = np.add.reduceat(x, edges) / counts
+    avg_y = np.add.reduceat(y, edges) / counts
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        xs = x[start:end]
+        ys = y[start:end]
+        area = np.abs((x[a] - avg_x[i + 1]) * (ys - y[a]) - (x[a] - xs) * (avg_y[i + 1] - y[a]))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def downsample(stream: Any, points: int, by: str | None = None) -> dict[str, list[Any]]:
+    """Décode les séries de *stream* et les réduit à *points* points par LTTB.
+
+    La sélection est calculée sur la série *by* (par défaut fréquence cardiaque,
+    sinon altitude puis distance) en fonction du temps, puis appliquée à toutes
+    les séries pour qu'elles restent alignées.
+    """
+    series = {
+        key: decode(key, getattr(stream, key))
+        for key in STREAM_KEYS
+        if getattr(stream, key) is not None
+    }
+    if not series:
+        return {}
+
+    if by not in series or by in ("time", "latlng"):
+        by = next((key for key in ("heartrate", "altitude", "distance") if key in series), None)
+    n = min(len(values) for values in series.values())
+    if by is None:
+        indices = np.linspace(0, n - 1, min(points, n)).astype(np.int64)
+    else:
+        x = series["time"][:n] if "time" in series else np.arange(n)
+        indices = lttb(x, series[by][:n], points)
+    return {key: values[:n][indices].tolist() for key, values in series.items()}
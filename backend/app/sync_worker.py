@@ -0,0 +1,100 @@
+"""Worker de synchronisation Strava pour l'ensemble des comptes liés.
+
+Lancé à côté de l'API : ``python -m app.sync_worker``. À chaque passage, il
+sélectionne les comptes dont la dernière tentative de synchronisation date de
+plus de ``STRAVA_SYNC_STALE_AFTER`` secondes (les moins récemment synchronisés
+d'abord) et les synchronise en parallèle, au plus ``STRAVA_SYNC_CONCURRENCY``
+à la fois, puis précharge le détail et les séries de leurs activités récentes
+(les séries alimentent les records personnels).
+
+Le même processus renouvelle les tokens Strava avant expiration
+(``strava_tokens.run_token_refresher``) et purge les plans archivés
+(``purge.run_purger``) : ces boucles ne tournent ainsi qu'une fois, et non
+dans chaque worker web.
+
+Après un crash, les comptes restés « en cours » sont repris une fois leur bail
+expiré, à partir de leur point de reprise (cf. ``strava_sync``).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import httpx
+
+from . import crud, models, purge, strava_sync, strava_tokens
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+CONCURRENCY = int(os.getenv("STRAVA_SYNC_CONCURRENCY", "8"))
+STALE_AFTER = int(os.getenv("STRAVA_SYNC_STALE_AFTER", "3600"))
+INTERVAL = int(os.getenv("STRAVA_SYNC_INTERVAL", "60"))
+# Comptes sélectionnés au plus par passage
+BATCH_SIZE = int(os.getenv("STRAVA_SYNC_BATCH_SIZE", "500"))
+
+
+def due_users() -> list[int]:
+    stale_before = datetime.utcnow() - timedelta(seconds=STALE_AFTER)
+    with SessionLocal() as db:
+        return crud.list_due_strava_syncs(db, stale_before, BATCH_SIZE)
+
+
+def sync_one(user_id: int) -> None:
+    """Synchronise un compte dans sa propre session (exécuté dans un thread)."""
+    with SessionLocal() as db:
+        token = db.query(models.StravaToken).filter(models.StravaToken.user_id == user_id).first()
+        if token is None:  # compte délié entre-temps
+            return
+        try:
+            stats = strava_sync.sync_user(db, token)
+        except strava_sync.SyncInProgress:
+            logger.info("Synchronisation déjà en cours (user %s)", user_id)
+        except httpx.HTTPError as e:
+            logger.warning("Échec de la synchronisation Strava (user %s) : %s", user_id, e)
+        else:
+            logger.info("Synchronisation Strava (user %s) : %s", user_id, stats)
+            strava_sync.enrich_recent(db, token)
+
+
+async def run_cycle() -> int:
+    """Synchronise les comptes à rafraîchir. Retourne le nombre de comptes traités."""
+    user_ids = await asyncio.to_thread(due_users)
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def guarded(user_id: int) -> None:
+        async with semaphore:
+            try:
+                await asyncio.to_thread(sync_one, user_id)
+            except Exception:  # noqa: BLE001 - un compte en erreur ne doit pas bloquer les autres
+                logger.exception("Erreur inattendue lors de la synchronisation (user %s)", user_id)
+
+    await asyncio.gather(*(guarded(user_id) for user_id in user_ids))
+    return len(user_ids)
+
+
+async def run_syncs() -> None:
+    """Boucle de synchronisation : un passage toutes les ``INTERVAL`` secondes."""
+    while True:
+        try:
+            count = await run_cycle()
+            if count:
+                logger.info("%s compte(s) Strava synchronisé(s)", count)
+        except Exception:  # noqa: BLE001
+            logger.exception("Échec du passage de synchronisation Strava")
+        await asyncio.sleep(INTERVAL)
+
+
+async def main() -> None:
+    # Le pool par défaut d'asyncio.to_thread est plus petit que la concurrence visée ;
+    # un thread de plus pour chacune des boucles de tokens et de purge
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=CONCURRENCY + 3))
+    await asyncio.gather(run_syncs(), strava_tokens.run_token_refresher(), purge.run_purger())
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    asyncio.run(main())
@@ -0,0 +1,37 @@
+"""Configuration gunicorn pour la production (workers uvicorn)."""
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+worker_class = "uvicorn.workers.UvicornWorker"
+# Dimensionné sur le nombre de CPU, surchargeable via WEB_CONCURRENCY
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# Avec plusieurs workers, les limites de débit doivent être partagées (cf. app.ratelimit).
+# Ce fichier est lu avant l'import de l'application : la valeur par défaut s'applique
+if workers > 1:
+    os.environ.setdefault("RATE_LIMIT_BACKEND", "postgres")
+
+# L'application est importée une fois dans le maître puis partagée par fork
+preload_app = True
+
+# Redémarrages progressifs : les requêtes en cours ont le temps de se terminer
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+keepalive = 5
+max_requests = int(os.getenv("MAX_REQUESTS", "2000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "200"))
+
+accesslog = "-"
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    import time
+
+    from app import main
+    from app.database import engine
+
+    # Le démarrage du worker (health/ready) se mesure depuis le fork
+    main.worker_started = time.perf_counter()
+    # Les connexions éventuellement ouvertes par le maître ne doivent pas être partagées
+    engine.dispose(close=False)